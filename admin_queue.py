@@ -0,0 +1,224 @@
+import asyncio
+import json
+import random
+import threading
+import time
+
+from telegram import InputMediaDocument, InputMediaPhoto
+from telegram.error import BadRequest, Forbidden, InvalidToken, RetryAfter
+
+from metrics import ADMIN_NOTIFICATIONS_FAILED
+from persistence import open_database
+from ratelimit import TokenBucket
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    messages TEXT NOT NULL,
+    sent INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+"""
+
+# Spooled jobs are JSON, so media group items are stored as {"type": ..., "media": ...} dicts
+# and generated files to upload as {"attachment": {"filename": ..., "content": text}}
+INPUT_MEDIA = {"photo": InputMediaPhoto, "document": InputMediaDocument}
+
+# Telegram allows roughly 30 messages/s overall and about 1 message/s into one chat
+GLOBAL_RATE = 30
+PER_CHAT_RATE = 1
+PER_CHAT_BURST = 3
+
+# Telegram rejects longer texts; the limit is counted in UTF-16 code units
+MAX_MESSAGE_LENGTH = 4096
+
+
+def _length(text):
+    return len(text.encode("utf-16-le")) // 2
+
+
+def split_text(text, limit=MAX_MESSAGE_LENGTH):
+    """``text`` in parts Telegram accepts, cut at line breaks where possible."""
+    if _length(text) <= limit:
+        return [text]
+    parts, current = [], ""
+    for line in text.splitlines(keepends=True):
+        while _length(line) > limit:
+            # a line longer than a whole message is cut where it has to be; a character
+            # is one or two code units, so each step at least halves the excess
+            cut = limit
+            while _length(line[:cut]) > limit:
+                cut -= (_length(line[:cut]) - limit + 1) // 2
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:cut])
+            line = line[cut:]
+        if _length(current) + _length(line) > limit:
+            parts.append(current)
+            current = ""
+        current += line
+    if current:
+        parts.append(current)
+    return parts
+
+
+class AdminQueue:
+    """Background, at-least-once delivery of notifications to admin chats.
+
+    Every job is written to a SQLite spool before ``enqueue`` returns and is only
+    removed once all its messages were accepted by Telegram, so nothing is lost
+    if the process dies mid-delivery. A job is a list of Bot API calls (by default
+    ``send_message`` keyword arguments) that is delivered in order; progress is
+    recorded per message so a retry does not resend the parts that already went out.
+    """
+
+    def __init__(self, bot, path, workers=4, global_rate=GLOBAL_RATE, per_chat_rate=PER_CHAT_RATE,
+                 max_backoff=300):
+        self.bot = bot
+        self.workers = workers
+        self.max_backoff = max_backoff
+        self._conn = open_database(path)
+        self._conn.executescript(SCHEMA)
+        self._db_lock = threading.Lock()
+        self._global_bucket = TokenBucket(global_rate)
+        self._per_chat_rate = per_chat_rate
+        self._chat_buckets = {}
+        self._chat_locks = {}
+        self._paused_until = 0.0
+        self._queue = asyncio.Queue()
+        self._jobs = {}
+        self._tasks = []
+
+    async def start(self):
+        """Reload undelivered jobs from the spool and start the workers."""
+        rows = self._conn.execute(
+            "SELECT id, chat_id, messages, sent, attempts FROM outbox WHERE failed = 0 ORDER BY id"
+        ).fetchall()
+        for job_id, chat_id, messages, sent, attempts in rows:
+            self._jobs[job_id] = [chat_id, json.loads(messages), sent, attempts]
+            self._queue.put_nowait(job_id)
+        if rows:
+            print(f"📤 Resuming {len(rows)} undelivered admin notification(s)")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Stop the workers. Undelivered jobs stay in the spool for the next start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._conn.close()
+
+    async def drain(self, timeout):
+        """Wait up to ``timeout`` seconds for every queued job to be delivered; True if they were."""
+        deadline = time.monotonic() + timeout
+        while self._jobs and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._jobs:
+            print(f"📤 {len(self._jobs)} admin notification(s) left in the spool for the next start")
+        return not self._jobs
+
+    @property
+    def pending(self):
+        return len(self._jobs)
+
+    async def enqueue(self, chat_id, messages):
+        """Durably queue ``messages`` (texts or Bot API kwargs dicts) for ``chat_id``.
+
+        Texts too long for one Telegram message are sent in several.
+        """
+        parts = []
+        for message in messages:
+            if isinstance(message, str):
+                message = {"text": message}
+            if "text" in message:
+                parts += [dict(message, text=text) for text in split_text(message["text"])]
+            else:
+                parts.append(message)
+        messages = parts
+        job_id = await asyncio.to_thread(self._insert, chat_id, messages)
+        self._jobs[job_id] = [chat_id, messages, 0, 0]
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    def _insert(self, chat_id, messages):
+        with self._db_lock:
+            cursor = self._conn.execute(
+                "INSERT INTO outbox (chat_id, messages, created_at) VALUES (?, ?, ?)",
+                (chat_id, json.dumps(messages, ensure_ascii=False), time.time()),
+            )
+            return cursor.lastrowid
+
+    def _execute(self, sql, params):
+        with self._db_lock:
+            self._conn.execute(sql, params)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._deliver(job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _wait_for_slot(self, chat_id):
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self._per_chat_rate, PER_CHAT_BURST)
+        await bucket.acquire()
+        await self._global_bucket.acquire()
+
+    async def _deliver(self, job_id):
+        job = self._jobs[job_id]
+        chat_id, messages = job[0], job[1]
+        # one job at a time per chat keeps multi-part notifications together
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        async with lock:
+            while job[2] < len(messages):
+                message = dict(messages[job[2]])
+                method = message.pop("method", "send_message")
+                if "media" in message:
+                    message["media"] = [
+                        INPUT_MEDIA[item["type"]](**{key: value for key, value in item.items() if key != "type"})
+                        for item in message["media"]
+                    ]
+                if "attachment" in message:
+                    attachment = message.pop("attachment")
+                    message["document"] = attachment["content"].encode("utf-8")
+                    message["filename"] = attachment["filename"]
+                await self._wait_for_slot(chat_id)
+                try:
+                    await getattr(self.bot, method)(chat_id=chat_id, **message)
+                except RetryAfter as exc:
+                    retry_after = exc.retry_after
+                    delay = retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else retry_after
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                    await asyncio.sleep(delay)
+                    continue
+                except (BadRequest, Forbidden, InvalidToken) as exc:
+                    # permanent errors: keep the job in the spool for manual inspection
+                    print(f"Admin notification {job_id} failed permanently: {exc}")
+                    ADMIN_NOTIFICATIONS_FAILED.inc(type(exc).__name__)
+                    await asyncio.to_thread(self._execute, "UPDATE outbox SET failed = 1 WHERE id = ?", (job_id,))
+                    del self._jobs[job_id]
+                    return
+                except Exception as exc:
+                    job[3] += 1
+                    delay = min(self.max_backoff, 2 ** job[3]) * random.uniform(0.5, 1.0)
+                    print(f"Admin notification {job_id} attempt {job[3]} failed ({exc!r}); retrying in {delay:.1f}s")
+                    await asyncio.to_thread(self._execute, "UPDATE outbox SET attempts = ? WHERE id = ?", (job[3], job_id))
+                    # requeue instead of sleeping here so other jobs keep flowing
+                    asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, job_id)
+                    return
+                job[2] += 1
+                if job[2] < len(messages):
+                    await asyncio.to_thread(self._execute, "UPDATE outbox SET sent = ? WHERE id = ?", (job[2], job_id))
+        await asyncio.to_thread(self._execute, "DELETE FROM outbox WHERE id = ?", (job_id,))
+        del self._jobs[job_id]
@@ -0,0 +1,210 @@
+"""Turning the free-text "amount lost" answer into a USD value.
+
+The question asks for a USD value, but people answer "about 5k", "$12,000",
+"2 BTC", "0.5 eth", "1,5 BTC" or "3000 coins". ``parse_amount`` finds the
+number (with k/m suffixes, thousands separators or a decimal comma) and the
+currency it is in; amounts in a cryptocurrency, or in "coins"/"tokens" of the
+case's crypto type, are converted with a ``PriceTable``. An answer that can
+be read more than one way is left unknown rather than guessed.
+"""
+import asyncio
+import json
+import os
+import re
+import time
+
+import httpx
+
+USD = "USD"
+
+# Dollar-pegged currencies never need a price lookup
+PEGGED = {"USD": 1.0, "USDT": 1.0, "USDC": 1.0, "BUSD": 1.0, "DAI": 1.0}
+
+# Lower-cased words and symbols -> currency code
+CURRENCY_ALIASES = {
+    "$": "USD", "usd": "USD", "us$": "USD", "dollar": "USD", "dollars": "USD", "bucks": "USD",
+    "€": "EUR", "eur": "EUR", "euro": "EUR", "euros": "EUR",
+    "£": "GBP", "gbp": "GBP", "pound": "GBP", "pounds": "GBP",
+    "btc": "BTC", "bitcoin": "BTC", "bitcoins": "BTC",
+    "eth": "ETH", "ether": "ETH", "ethereum": "ETH",
+    "usdt": "USDT", "tether": "USDT", "usdc": "USDC", "busd": "BUSD", "dai": "DAI",
+    "bnb": "BNB", "sol": "SOL", "solana": "SOL", "trx": "TRX", "tron": "TRX",
+    "xrp": "XRP", "ripple": "XRP", "matic": "MATIC", "pol": "MATIC", "polygon": "MATIC",
+    "avax": "AVAX", "avalanche": "AVAX", "ltc": "LTC", "litecoin": "LTC",
+    "doge": "DOGE", "dogecoin": "DOGE", "ada": "ADA", "cardano": "ADA", "ton": "TON",
+}
+# "3000 coins" is in whatever the user picked as the crypto type
+CRYPTO_WORDS = frozenset(("coin", "coins", "token", "tokens"))
+
+# CoinGecko ids of the currencies above, for PriceTable.refresh
+COINGECKO_IDS = {
+    "BTC": "bitcoin", "ETH": "ethereum", "BNB": "binancecoin", "SOL": "solana", "TRX": "tron",
+    "XRP": "ripple", "MATIC": "matic-network", "AVAX": "avalanche-2", "LTC": "litecoin",
+    "DOGE": "dogecoin", "ADA": "cardano", "TON": "the-open-network",
+}
+# fiat rates are derived from the bitcoin price in each currency
+FIAT = ("EUR", "GBP")
+
+MULTIPLIERS = {
+    "k": 1e3, "thousand": 1e3, "grand": 1e3,
+    "m": 1e6, "mn": 1e6, "mil": 1e6, "million": 1e6,
+    "b": 1e9, "bn": 1e9, "billion": 1e9,
+}
+
+AMOUNT_RE = re.compile(
+    r"(?P<prefix>us\$|[$€£])?\s*"
+    r"(?P<number>(?P<grouped>\d{1,3}(?:[,\s]\d{3})+(?:\.\d+)?)|(?P<comma>\d+,\d+)|\d+(?:\.\d+)?|\.\d+)"
+    r"\s*(?P<multiplier>thousand|million|billion|grand|mil|mn|bn|k|m|b)?\b"
+    r"\s*(?P<unit>us\$|[$€£]|[a-z]+)?",
+    re.IGNORECASE,
+)
+
+
+def currency_code(name):
+    """The currency code for a symbol, code or name ("ETH", "ether", "€"), or None."""
+    if not name:
+        return None
+    name = name.strip().lower()
+    return CURRENCY_ALIASES.get(name) or (name.upper() if name.upper() in PEGGED else None)
+
+
+def _currency(match, crypto_type):
+    """The currency written next to an ``AMOUNT_RE`` match, or None if there is none."""
+    unit = (match.group("unit") or "").lower()
+    if match.group("prefix"):
+        return currency_code(match.group("prefix"))
+    if unit in CRYPTO_WORDS or (crypto_type and unit and unit == crypto_type.strip().lower()):
+        return currency_code(crypto_type) or (crypto_type or "").strip().upper() or USD
+    return currency_code(unit)
+
+
+def _value(match, currency):
+    """The number of an ``AMOUNT_RE`` match, or None if it can be read more than one way."""
+    number = match.group("number")
+    if match.group("comma"):
+        # "1,5 BTC": a comma not followed by three digits is a decimal comma
+        value = float(number.replace(",", "."))
+    elif (match.group("grouped") and number.count(",") == 1 and "." not in number
+          and currency not in PEGGED and currency not in FIAT):
+        # "1,500 BTC" is 1500 with a thousands separator or 1.5 with a decimal comma
+        return None
+    else:
+        value = float(re.sub(r"[,\s]", "", number))
+    if match.group("multiplier"):
+        value *= MULTIPLIERS[match.group("multiplier").lower()]
+    return value
+
+
+def parse_amount(text, crypto_type=None):
+    """``(value, currency)`` for a free-text amount, or None if it has none or is ambiguous.
+
+    The amount is the first number with a currency next to it ("in 2023 I lost
+    3 eth" is 3 ETH); "coins" and "tokens" mean ``crypto_type``. A number
+    without a currency is in USD, as the question asks, but only if it is the
+    only number in the answer.
+    """
+    bare = []
+    for match in AMOUNT_RE.finditer(text or ""):
+        currency = _currency(match, crypto_type)
+        if currency is not None:
+            value = _value(match, currency)
+            return None if value is None else (value, currency)
+        bare.append(match)
+    if len(bare) != 1:
+        return None
+    value = _value(bare[0], USD)
+    return None if value is None else (value, USD)
+
+
+class PriceTable:
+    """USD prices of cryptocurrencies (and a few fiat currencies), cached in a local file.
+
+    Lookups only read the table. A task started with ``start`` refreshes it
+    from ``url`` (CoinGecko's simple price API) whenever the prices are
+    ``ttl`` seconds old; if that fails, the last known prices are used until
+    the next attempt ``ttl`` seconds later. Without a URL the table is whatever
+    the cache file holds, re-read every ``ttl`` seconds.
+    """
+
+    def __init__(self, path, ttl=3600, url=None):
+        self.path = path
+        self.ttl = ttl
+        self.url = url
+        self.prices = {}
+        self.updated = 0.0
+        self._task = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                cached = json.load(file)
+        except (OSError, ValueError):
+            return
+        self.prices = {symbol: float(price) for symbol, price in cached.get("prices", {}).items()}
+        self.updated = float(cached.get("updated", 0))
+
+    def _save(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"updated": self.updated, "prices": self.prices}, file, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+    async def refresh(self):
+        params = {
+            "ids": ",".join(COINGECKO_IDS.values()),
+            "vs_currencies": ",".join(("usd",) + tuple(fiat.lower() for fiat in FIAT)),
+        }
+        async with httpx.AsyncClient(timeout=10) as client:
+            response = await client.get(self.url, params=params)
+            response.raise_for_status()
+            quotes = response.json()
+        prices = {
+            symbol: float(quotes[coin_id]["usd"])
+            for symbol, coin_id in COINGECKO_IDS.items()
+            if coin_id in quotes and "usd" in quotes[coin_id]
+        }
+        bitcoin = quotes.get(COINGECKO_IDS["BTC"], {})
+        for fiat in FIAT:
+            if bitcoin.get(fiat.lower()) and bitcoin.get("usd"):
+                prices[fiat] = float(bitcoin["usd"]) / float(bitcoin[fiat.lower()])
+        self.prices, self.updated = prices, time.time()
+        await asyncio.to_thread(self._save)
+
+    async def _run(self):
+        # prices from the cache file are used until they are ttl old
+        delay = self.updated + self.ttl - time.time()
+        while True:
+            await asyncio.sleep(max(delay, 0))
+            delay = self.ttl
+            if not self.url:
+                await asyncio.to_thread(self._load)
+            else:
+                try:
+                    await self.refresh()
+                except (httpx.HTTPError, ValueError, KeyError, OSError) as exc:
+                    print(f"Price refresh failed ({exc!r}); using prices from {time.ctime(self.updated)}")
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def usd_value(self, value, currency):
+        """``value`` units of ``currency`` in USD, or None if its price is unknown."""
+        if currency in PEGGED:
+            return value * PEGGED[currency]
+        price = self.prices.get(currency)
+        return None if price is None else value * price
+
+
+def amount_in_usd(text, crypto_type, prices):
+    """The USD value of an ``amount_lost`` answer, or None if it can't be worked out."""
+    parsed = parse_amount(text, crypto_type)
+    if parsed is None:
+        return None
+    return prices.usd_value(*parsed)
@@ -0,0 +1,147 @@
+"""Structured audit events written to rotating JSONL files off the event loop.
+
+Handlers call ``AuditLog.emit``, which only puts a dict on a bounded queue. A
+single task takes whatever has piled up on the queue and writes it in one go
+from a worker thread, so the bot never waits on the disk. When the writer falls
+behind and the queue is full, new events are dropped and counted (in
+``bot_log_events_dropped_total`` and as an ``events_dropped`` line in the log
+itself) instead of slowing the bot down.
+
+Every line is one event: ``{"ts": ..., "event": ..., ...}``. Values of the
+``redact`` fields, and rejected answers to those questions, are replaced before
+they are queued, so they never reach the disk.
+"""
+import asyncio
+import json
+import os
+import time
+import weakref
+
+from metrics import LOG_EVENTS_DROPPED, REGISTRY, state_label
+
+REDACTED = "[redacted]"
+
+MAX_BYTES = 50 * 1024 * 1024
+BACKUPS = 5
+QUEUE_SIZE = 10_000
+# events written per thread hop at most
+BATCH_SIZE = 1000
+# once the queue is drained, events are left to pile up this long before the next write
+LINGER = 0.25
+
+_logs = weakref.WeakSet()
+REGISTRY.gauge(
+    "bot_log_queue_depth", "Events waiting to be written, by log.", ("log",),
+    lambda: {(log.name,): log._queue.qsize() for log in _logs},
+)
+
+
+class AuditLog:
+    """Queue-fed writer of ``path``, rotated at ``max_bytes`` into ``path.1`` … ``path.<backups>``."""
+
+    name = "audit"
+
+    def __init__(self, path, max_bytes=MAX_BYTES, backups=BACKUPS, queue_size=QUEUE_SIZE, redact=()):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.redact = frozenset(redact)
+        self.dropped = 0
+        self._reported = 0
+        self._queue = asyncio.Queue(queue_size)
+        self._file = None
+        self._task = None
+        _logs.add(self)
+
+    def emit(self, event, **fields):
+        """Queue one event; never blocks."""
+        for key in self.redact.intersection(fields):
+            fields[key] = REDACTED
+        if "answer" in fields and fields.get("field") in self.redact:
+            fields["answer"] = REDACTED
+        try:
+            self._queue.put_nowait({"ts": round(time.time(), 3), "event": event, **fields})
+        except asyncio.QueueFull:
+            self.dropped += 1
+            LOG_EVENTS_DROPPED.inc(self.name)
+
+    def transition(self, update, handler, state, new_state, seconds, error=None):
+        """Emit a ``transition`` event; the ``on_transition`` of ``instrument_conversation``."""
+        fields = {
+            "chat_id": update.effective_chat.id if update.effective_chat else None,
+            "handler": handler,
+            "from": state_label(state),
+            "to": state_label(new_state if new_state is not None else state),
+            "duration_ms": round(seconds * 1000, 3),
+        }
+        if error is not None:
+            fields["error"] = repr(error)
+        self.emit("transition", **fields)
+
+    # ---- writing (in a worker thread) ------------------------------------
+
+    def _open(self):
+        return open(self.path, "ab")
+
+    def _encode(self, event):
+        return json.dumps(event, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = self._open()
+
+    def _write(self, batch):
+        data = "".join(self._encode(event) for event in batch).encode()
+        if self._file is None:
+            self._file = self._open()
+        size = os.fstat(self._file.fileno()).st_size
+        if size and size + len(data) > self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+
+    # ---- the listener task ------------------------------------------------
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < BATCH_SIZE and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            stopping = None in batch
+            if stopping:
+                batch = batch[:batch.index(None)]
+            if self.dropped > self._reported:
+                batch.append({"ts": round(time.time(), 3), "event": "events_dropped",
+                              "count": self.dropped - self._reported})
+                self._reported = self.dropped
+            if batch:
+                try:
+                    await asyncio.to_thread(self._write, batch)
+                except OSError as exc:
+                    print(f"Could not write {len(batch)} {self.name} event(s) to {self.path}: {exc}")
+            if stopping:
+                return
+            if len(batch) < BATCH_SIZE:
+                # a handful of events per write would cost a thread hop and a flush each
+                await asyncio.sleep(LINGER)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Write every event queued so far, then close the file."""
+        if self._task is not None:
+            await self._queue.put(None)
+            await self._task
+            self._task = None
+        if self._file is not None:
+            await asyncio.to_thread(self._file.close)
+            self._file = None
+
@@ -0,0 +1,89 @@
+"""Memory benchmark: bytes per active session with a plain dict vs CaseDraft.
+
+Run from the repository root:
+
+    python benchmarks/bench_case_draft.py [--sessions 10000]
+
+Every session answers all the intake questions the way a real user would
+(answers are decoded from JSON, so each one is a fresh string as it would be
+when it comes out of a Telegram update). A second scenario has every session
+paste 64 KB into the free-text answers.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from case_draft import CaseDraft  # noqa: E402
+
+ANSWERS = {
+    "name": "Alice Example",
+    "email": "alice@example.com",
+    "phone": "+44-7700-900123",
+    "location": "United Kingdom",
+    "incident_type": "Fraudulent Investment",
+    "incident_description": "Joined an investment group on Telegram, deposited funds and could not withdraw.",
+    "exchange": "Binance",
+    "crypto_type": "USDT",
+    "network": "TRON",
+    "wallet_addresses": "TJRabPrwbZy45sbavfcjinPJC18kjpRTv8\nTN3W4H6rK2ce4vX9YnFQHwKENnHjoxb3m9",
+    "date_time": "2024-03-02 14:00",
+    "amount_lost": "12,500 USD",
+    "how_occurred": "Fake investment platform",
+    "proof_ownership": "Yes",
+    "transaction_ids": "No",
+    "evidence": "Yes",
+    "police_report": "No",
+    "other_services": "No",
+    "additional_info": "The platform asked for a 'withdrawal fee' before releasing funds.",
+}
+LONG_FIELDS = ("incident_description", "additional_info", "how_occurred")
+
+
+def fresh_answers(session, paste):
+    answers = dict(ANSWERS, name=f"User {session}")
+    if paste:
+        for field in LONG_FIELDS:
+            answers[field] = "x" * paste
+    # decoding gives every session its own string objects, like real updates do
+    return json.loads(json.dumps(answers))
+
+
+def measure(factory, sessions, paste):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    drafts = []
+    for session in range(sessions):
+        # the decoded answers stand in for updates, which are garbage once handled
+        draft = factory()
+        for key, value in fresh_answers(session, paste).items():
+            draft[key] = value
+        drafts.append(draft)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure memory per intake session.")
+    parser.add_argument("--sessions", type=int, default=10_000)
+    args = parser.parse_args()
+
+    for label, paste in (("typical answers", 0), ("64 KB pastes", 64 * 1024)):
+        sessions = args.sessions if not paste else max(args.sessions // 20, 1)
+        plain = measure(dict, sessions, paste)
+        draft = measure(CaseDraft, sessions, paste)
+        print(
+            f"{label:16} dict {plain:10,.0f} B/session   CaseDraft {draft:8,.0f} B/session   "
+            f"({plain / draft:.1f}x smaller)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Memory benchmark: peak Python memory of a case export vs the number of cases.
+
+Run from the repository root:
+
+    python benchmarks/bench_export.py [--cases 10000 100000 1000000] [--format csv]
+
+Fills a temporary case store with synthetic cases and exports all of them,
+reporting the time taken and the peak traced memory. The peak should stay the
+same however many cases are exported.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from case_store import CASE_FIELDS, CaseStore  # noqa: E402
+from export import FORMATS, export_parts  # noqa: E402
+
+NETWORKS = ("TRON", "Ethereum (ERC20)", "Bitcoin", "BSC (BEP20)")
+
+
+def fill(store, count):
+    # bulk insert straight into the cases table; the indexes used for linking don't matter here
+    start = time.time() - 365 * 86400
+    columns = ", ".join(CASE_FIELDS)
+    with store._conn:
+        store._conn.execute("BEGIN")
+        store._conn.executemany(
+            f"INSERT INTO cases (user_id, chat_id, submitted_at, {columns}) "
+            f"VALUES (?, ?, ?, {', '.join('?' for _ in CASE_FIELDS)})",
+            (
+                (i, i, start + i, *[
+                    NETWORKS[i % len(NETWORKS)] if field == "network" else f"{field} of case {i}"
+                    for field in CASE_FIELDS
+                ])
+                for i in range(count)
+            ),
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure memory used by a case export.")
+    parser.add_argument("--cases", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    args = parser.parse_args()
+
+    for count in args.cases:
+        with tempfile.TemporaryDirectory() as directory:
+            store = CaseStore(os.path.join(directory, "cases.sqlite3"))
+            fill(store, count)
+            tracemalloc.start()
+            began = time.perf_counter()
+            exported = 0
+            for path, rows in export_parts(store.iter_cases(), args.format, directory):
+                exported += rows
+                os.unlink(path)
+            elapsed = time.perf_counter() - began
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            store.close()
+        print(f"{exported:>9,} cases  {elapsed:6.1f} s  peak {peak / 1024:8,.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
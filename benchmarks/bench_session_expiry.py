@@ -0,0 +1,87 @@
+"""Micro-benchmark for session_expiry.py with many open sessions.
+
+Run from the repository root:
+
+    python benchmarks/bench_session_expiry.py [--sessions 100000]
+
+Reports the cost of recording activity and of a sweep round, both when nothing
+has expired and when a slice of the sessions has, to show that neither grows
+with the number of open sessions.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.ext import CommandHandler, ConversationHandler  # noqa: E402
+
+from session_expiry import SessionExpiry  # noqa: E402
+
+
+class Application:
+    """Just enough of telegram.ext.Application for SessionExpiry.sweep."""
+
+    bot = None
+
+    def __init__(self):
+        self.dropped = 0
+
+    def drop_user_data(self, user_id):
+        self.dropped += 1
+
+
+async def notify(bot, chat_id):
+    pass
+
+
+def build(sessions, timeout):
+    async def noop(update, context):
+        return None
+
+    conversation = ConversationHandler(
+        entry_points=[CommandHandler("start", noop)], states={0: [CommandHandler("x", noop)]}, fallbacks=[]
+    )
+    expiry = SessionExpiry(conversation, timeout, notify)
+    now = time.monotonic()
+    for chat_id in range(sessions):
+        key = (chat_id, chat_id)
+        conversation._conversations[key] = 0
+        # spread the last activity evenly over the timeout window
+        expiry.touch(key, now - timeout + timeout * chat_id / sessions)
+    return conversation, expiry, now
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark idle-session expiry.")
+    parser.add_argument("--sessions", type=int, default=100_000)
+    parser.add_argument("--timeout", type=float, default=600.0)
+    args = parser.parse_args()
+
+    for sessions in (args.sessions // 100, args.sessions // 10, args.sessions):
+        conversation, expiry, now = build(sessions, args.timeout)
+        keys = [(chat_id, chat_id) for chat_id in range(0, sessions, 7)]
+        touches = len(keys)
+        touch = timeit.timeit(lambda: [expiry.touch(key, now) for key in keys], number=1) / touches
+
+        # nothing older than the timeout: a sweep only looks at the front entry
+        idle = timeit.timeit(lambda: expiry.pop_expired(now - args.timeout), number=1000) / 1000
+
+        # the oldest 1% went idle
+        app = Application()
+        cutoff = now + args.timeout * 0.01
+        started = time.perf_counter()
+        ended = asyncio.run(expiry.sweep(app, cutoff))
+        sweep = time.perf_counter() - started
+
+        print(
+            f"{sessions:>8} sessions: touch {touch * 1e6:6.2f} us, empty sweep {idle * 1e6:6.2f} us, "
+            f"sweep of {ended} expired {sweep * 1e3:7.2f} ms ({sweep / max(ended, 1) * 1e6:.2f} us each)"
+        )
+
+
+if __name__ == "__main__":
+    main()
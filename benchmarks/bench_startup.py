@@ -0,0 +1,116 @@
+"""Cold-start benchmark: how long a fresh bot process takes before it can handle updates.
+
+Run from the repository root:
+
+    python benchmarks/bench_startup.py [--sessions 10000] [--runs 5] [--target-ms 1500]
+
+Every run starts a new interpreter that imports telegram, imports bot.py (which
+loads .env and compiles the intake flow), builds the Application with all its
+handlers and restores ``--sessions`` open sessions from a persistence database.
+The median of each phase is reported; the exit status is 1 if the median total,
+interpreter start included, is over ``--target-ms``.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CHILD = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+import telegram
+imported_telegram = time.perf_counter()
+import bot
+imported_bot = time.perf_counter()
+app = bot.build_application("123456:STARTUP")
+built = time.perf_counter()
+
+async def restore():
+    await app.persistence.get_user_data()
+    await app.persistence.get_conversations("intake")
+
+asyncio.run(restore())
+restored = time.perf_counter()
+print(json.dumps({{
+    "import telegram": imported_telegram - started,
+    "import bot (.env, flow)": imported_bot - imported_telegram,
+    "build application": built - imported_bot,
+    "restore sessions": restored - built,
+}}))
+"""
+
+ANSWERS = {
+    "name": "Alice Example", "email": "alice@example.com", "phone": "+44-7700-900123",
+    "location": "United Kingdom", "incident_type": "Scam",
+    "incident_description": "Joined an investment group on Telegram and could not withdraw.",
+}
+
+
+def make_sessions(path, sessions):
+    import sqlite3
+
+    from persistence import SCHEMA
+
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    with conn:
+        conn.executemany(
+            "INSERT INTO user_data (user_id, data) VALUES (?, ?)",
+            ((user_id, json.dumps(dict(ANSWERS, name=f"User {user_id}"))) for user_id in range(sessions)),
+        )
+        conn.executemany(
+            "INSERT INTO conversations (name, conv_key, state) VALUES ('intake', ?, 7)",
+            ((json.dumps([user_id, user_id]),) for user_id in range(sessions)),
+        )
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure bot cold-start time.")
+    parser.add_argument("--sessions", type=int, default=10_000, help="open sessions to restore")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--target-ms", type=float, default=1500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        state = os.path.join(workdir, "state.sqlite3")
+        make_sessions(state, args.sessions)
+        env = dict(
+            os.environ,
+            PERSISTENCE_PATH=state,
+            ADMIN_SPOOL_PATH=os.path.join(workdir, "outbox.sqlite3"),
+            CASE_STORE_PATH=os.path.join(workdir, "cases.sqlite3"),
+            EVIDENCE_PATH=os.path.join(workdir, "evidence"),
+        )
+        phases, totals = {}, []
+        for _ in range(args.runs):
+            began = time.perf_counter()
+            output = subprocess.run(
+                [sys.executable, "-c", CHILD.format(root=ROOT)],
+                env=env, cwd=workdir, capture_output=True, text=True, check=True,
+            ).stdout
+            total = time.perf_counter() - began
+            timings = json.loads(output.strip().splitlines()[-1])
+            timings = {"interpreter start and exit": total - sum(timings.values()), **timings}
+            for name, seconds in timings.items():
+                phases.setdefault(name, []).append(seconds)
+            totals.append(total)
+
+    for name, samples in phases.items():
+        print(f"{name:28} {statistics.median(samples) * 1000:8.1f} ms")
+    total_ms = statistics.median(totals) * 1000
+    verdict = "ok" if total_ms <= args.target_ms else "OVER TARGET"
+    print(f"{'total':28} {total_ms:8.1f} ms  (target {args.target_ms:.0f} ms: {verdict})")
+    sys.exit(0 if total_ms <= args.target_ms else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Micro-benchmarks for validation.py.
+
+Run from the repository root:
+
+    python benchmarks/bench_validation.py [--addresses 100] [--target-ms 1.0]
+
+The checksum code is first checked against known answers (Keccak-256, EIP-55,
+BIP-173/350 and Base58Check vectors). Each scenario then parses one multi-line
+paste of N addresses (or TXIDs) for a network and reports the best time per
+paste and per address; the exit status is 1 if a known answer is wrong or any
+paste takes longer than ``--target-ms``. A paste is one message, and 4096
+characters hold at most about 95 EVM or 117 Base58 addresses, hence the default.
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from validation import (  # noqa: E402
+    b58check_encode, is_valid_email, is_valid_evm_address, keccak256, normalize_address,
+    parse_addresses, parse_txids, to_checksum_address, BITCOIN, TRON,
+)
+
+BECH32_SAMPLES = (
+    "bc1qar0srrr7xfkvy5l643lydnw9re59gtzzwf5mdq",
+    "bc1p5d7rjq7g6rdk2yhzks9smlaqtedr4dekq08ge8ztwac72sfr9rusxg3297",
+)
+
+KECCAK_VECTORS = {
+    b"": "c5d2460186f7233c927e7db2dcc703c0e500b653ca82273b7bfad8045d85a470",
+    b"abc": "4e03657aea45a94fc7d47ba826c8d667c0d1e6e33a64a036ec44f58fa12d6c45",
+}
+# from EIP-55 itself
+EIP55_VECTORS = (
+    "0x52908400098527886E0F7030069857D2E4169EE7",
+    "0x8617E340B3D01FA5F11F306F4090FD50E238070D",
+    "0xde709f2102306220921060314715629080e2fb77",
+    "0x27b1fdb04752bbc536007a920d24acb045561c26",
+    "0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed",
+    "0xfB6916095ca1df60bB79Ce92cE3Ea74c37c5d359",
+    "0xdbF03B407c01E7cD3CBea99509d93f8DDDC8C6FB",
+    "0xD1220A0cf47c7B9Be7A2E6BA89F429762e7b9aDb",
+)
+# address -> accepted on (kind); bech32 ones from BIP-173 and BIP-350
+ADDRESS_VECTORS = (
+    ("1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN2", BITCOIN, True),
+    ("3J98t1WpEZ73CNmQviecrnyiWrnqRhWNLy", BITCOIN, True),
+    ("1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN3", BITCOIN, False),
+    ("TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t", TRON, True),
+    ("1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN2", TRON, False),
+    ("BC1QW508D6QEJXTDG4Y5R3ZARVARY0C5XW7KV8F3T4", BITCOIN, True),
+    ("bc1qrp33g0q5c5txsp9arysrx4k6zdkfs4nce4xj0gdcccefvpysxf3qccfmv3", BITCOIN, True),
+    ("bc1pw508d6qejxtdg4y5r3zarvary0c5xw7kw508d6qejxtdg4y5r3zarvary0c5xw7kt5nd6y", BITCOIN, True),
+    ("bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vqzk5jj0", BITCOIN, True),
+    ("bc1zw508d6qejxtdg4y5r3zarvaryvaxxpcs", BITCOIN, True),
+    # version 1 with a bech32 checksum, version 0 with a bech32m one
+    ("bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vqh2y7hd", BITCOIN, False),
+    ("bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kemeawh", BITCOIN, False),
+    # wrong checksum, mixed case, bad padding, 1-byte program, no data
+    ("bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t5", BITCOIN, False),
+    ("bc1qW508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4", BITCOIN, False),
+    ("bc1zw508d6qejxtdg4y5r3zarvaryvqyzf3du", BITCOIN, False),
+    ("bc1pw5dgrnzv", BITCOIN, False),
+    ("bc1gmk9yu", BITCOIN, False),
+)
+
+
+def check_known_answers():
+    """The known answers the checksum code gets wrong (empty if it is right)."""
+    wrong = [f"keccak256({data!r})" for data, digest in KECCAK_VECTORS.items() if keccak256(data).hex() != digest]
+    for address in EIP55_VECTORS:
+        body = address[2:]
+        checksummed = to_checksum_address(address)
+        if not body.isupper() and not body.islower() and checksummed != address:
+            wrong.append(f"to_checksum_address({address})")
+        if not is_valid_evm_address(address):
+            wrong.append(f"is_valid_evm_address({address})")
+        # one letter in the wrong case breaks the checksum
+        if body != body.lower() and body != body.upper():
+            flipped = "0x" + body.swapcase()
+            if is_valid_evm_address(flipped):
+                wrong.append(f"is_valid_evm_address({flipped})")
+    for address, kind, valid in ADDRESS_VECTORS:
+        if (normalize_address(address, kind) is not None) != valid:
+            wrong.append(f"normalize_address({address}, {kind}) should be {'valid' if valid else 'invalid'}")
+    return wrong
+
+
+def make_pastes(count, rng):
+    evm_lower = ["0x" + rng.randbytes(20).hex() for _ in range(count)]
+    # checksummed addresses are generated up front so the benchmark measures verification
+    evm_mixed = [to_checksum_address(address) for address in evm_lower]
+    bitcoin = [b58check_encode(bytes([rng.choice((0x00, 0x05))]) + rng.randbytes(20)) for _ in range(count)]
+    bitcoin += [BECH32_SAMPLES[index % 2] for index in range(count // 4)]
+    tron = [b58check_encode(b"\x41" + rng.randbytes(20)) for _ in range(count)]
+    txids = ["0x" + rng.randbytes(32).hex() for _ in range(count)]
+    return {
+        "Ethereum (lowercase)": ("Ethereum", "\n".join(evm_lower), parse_addresses, count),
+        "Ethereum (EIP-55)": ("Ethereum", "\n".join(evm_mixed), parse_addresses, count),
+        "Bitcoin (Base58Check + bech32)": ("Bitcoin", "\n".join(bitcoin), parse_addresses, len(bitcoin)),
+        "TRON (Base58Check)": ("TRON", "\n".join(tron), parse_addresses, count),
+        "Ethereum TXIDs": ("Ethereum", "\n".join(txids), parse_txids, count),
+    }
+
+
+def bench(function, repeat, number):
+    # the fastest run is the one least disturbed by the rest of the machine
+    return min(timeit.repeat(function, repeat=repeat, number=number)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--addresses", type=int, default=100, help="addresses per paste")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--target-ms", type=float, default=1.0, help="longest acceptable time per paste")
+    args = parser.parse_args()
+
+    wrong = check_known_answers()
+    for failure in wrong:
+        print(f"WRONG: {failure}")
+    if wrong:
+        sys.exit(1)
+
+    rng = random.Random(42)
+    over = []
+    print(f"{'scenario':34} {'per paste':>12} {'per address':>14}")
+    for name, (network, paste, parse, count) in make_pastes(args.addresses, rng).items():
+        def run():
+            result = parse(paste, network)
+            assert not result.invalid, result.invalid[:3]
+
+        seconds = bench(run, args.repeat, 5)
+        verdict = "" if seconds * 1e3 <= args.target_ms else "  OVER TARGET"
+        if verdict:
+            over.append(name)
+        print(f"{name:34} {seconds * 1e3:9.3f} ms {seconds / count * 1e6:11.2f} µs{verdict}")
+
+    seconds = bench(lambda: is_valid_email("name@example.com"), args.repeat, 10000)
+    print(f"{'is_valid_email':34} {'':12} {seconds * 1e6:11.2f} µs")
+    print(f"target {args.target_ms:g} ms per paste of {args.addresses} addresses: "
+          f"{'OVER for ' + ', '.join(over) if over else 'ok'}")
+    sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
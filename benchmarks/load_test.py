@@ -0,0 +1,190 @@
+"""Concurrent-user load test against a local Bot API stand-in.
+
+Runs the real Application from bot.py (persistence, case store and admin queue
+included, in a temporary directory) against fake_bot_api.FakeBotAPI and drives
+N virtual users through the intake conversation at the same time. Every
+virtual user waits for the bot's reply before sending its next answer. Users
+rotate through three scripts:
+
+* ``other``: every "Other" branch plus the police-case branch
+* ``keyboard``: keyboard answers, validated Ethereum address and TXID
+* ``cancel``: abandons the case with /cancel half-way
+
+Run from the repository root:
+
+    python benchmarks/load_test.py --users 200 --sessions 3 --api-latency 0.02
+
+The report shows throughput, p50/p95/p99 reply latency per conversation state
+(the time from putting the update on the queue to the bot's reply reaching the
+fake API), event-loop lag and RSS growth.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SCRIPTS = {
+    "other": (
+        "/start", "Start Recovery Process", "Jane Tester", "jane@example.com", "+1-555-0100",
+        "Germany", "Other", "Someone posing as support drained my wallet.", "skip",
+        "Other", "XRP", "Other", "Ripple", "rPT1Sjq2YGrBMTttX4GZHjKu9dyfzbpAYe", "last week",
+        "$12,000", "Other", "SIM swap", "Yes", "No", "Yes", "Yes", "CR-2024-001", "No",
+        "Nothing else.",
+    ),
+    "keyboard": (
+        "/start", "Start Recovery Process", "John Tester", "john@example.com", "skip",
+        "USA", "Scam", "Fake exchange kept my deposit.", "CoinFake", "ETH", "Ethereum",
+        "0x5aaeb6053f3e94c9b9a09f33669435e7ef1beaed", "2024-05-01 10:00", "2 ETH",
+        "Fake investment platform", "No", "Yes",
+        "0x" + "ab" * 32, "No", "No", "Yes", "Please hurry.",
+    ),
+    "cancel": (
+        "/start", "Start Recovery Process", "Quitter Person", "quit@example.com", "skip",
+        "France", "Scam", "Changed my mind.", "/cancel",
+    ),
+}
+
+
+def label_script(texts):
+    """Pair every message of a script with the conversation state it is answered in."""
+    from flow import FLOW, NAME, STATE_NAMES
+
+    labelled, state, shadow = [], None, {}
+    for text in texts:
+        if text.startswith("/"):
+            labelled.append((text[1:], text))
+            state = NAME if text == "/start" else None
+            continue
+        labelled.append((STATE_NAMES[state], text))
+        state = FLOW.advance(state, text, shadow).state
+    return labelled
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentiles(samples):
+    if len(samples) < 2:
+        value = samples[0] if samples else 0.0
+        return value, value, value
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return cuts[49], cuts[94], cuts[98]
+
+
+async def monitor_loop_lag(samples, stop, interval=0.01):
+    while not stop.is_set():
+        before = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - before - interval)
+
+
+async def virtual_user(app, api, chat_id, scripts, latencies, update_ids, think):
+    from telegram import Update
+
+    from fake_bot_api import make_text_update
+
+    for name, messages in scripts:
+        for label, text in messages:
+            update = Update.de_json(make_text_update(next(update_ids), chat_id, text), app.bot)
+            sent = time.perf_counter()
+            await app.update_queue.put(update)
+            await api.next_message(chat_id)
+            latencies.setdefault(label, []).append(time.perf_counter() - sent)
+            if think:
+                await asyncio.sleep(think)
+
+
+async def run(args):
+    from fake_bot_api import FakeBotAPI
+
+    api = FakeBotAPI(latency=args.api_latency, record=False)
+    port = await api.start()
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    os.chdir(workdir)
+    os.environ.update({
+        "BOT_API_BASE_URL": f"http://127.0.0.1:{port}/bot",
+        "ADMIN_ID": "1",
+        "PERSISTENCE_PATH": os.path.join(workdir, "state.sqlite3"),
+        "ADMIN_SPOOL_PATH": os.path.join(workdir, "outbox.sqlite3"),
+        "CASE_STORE_PATH": os.path.join(workdir, "cases.sqlite3"),
+        # virtual users answer as fast as the bot replies, far above a human's rate
+        "FLOOD_RATE": "1000",
+        "FLOOD_BURST": "1000",
+        # no price lookups over the network; amounts in a cryptocurrency stay unconverted
+        "PRICE_TABLE_PATH": os.path.join(workdir, "prices.json"),
+        "PRICE_URL": "",
+    })
+    import bot
+
+    app = bot.build_application("123456:LOADTEST")
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+
+    scripts = {name: label_script(texts) for name, texts in SCRIPTS.items()}
+    names = itertools.cycle(sorted(scripts))
+    update_ids = itertools.count(1)
+    latencies, lag = {}, []
+    stop_monitor = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(lag, stop_monitor))
+
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+    users = []
+    for user in range(args.users):
+        plan = [(name, scripts[name]) for name in itertools.islice(names, args.sessions)]
+        users.append(virtual_user(app, api, 10_000 + user, plan, latencies, update_ids, args.think))
+    await asyncio.gather(*users)
+    elapsed = time.perf_counter() - started
+    rss_after = rss_bytes()
+
+    stop_monitor.set()
+    await monitor
+    await app.stop()
+    if app.post_stop:
+        await app.post_stop(app)
+    await app.shutdown()
+    await api.stop()
+
+    messages = sum(len(samples) for samples in latencies.values())
+    print(f"users={args.users} sessions/user={args.sessions} api_latency={args.api_latency * 1e3:.0f}ms")
+    print(f"throughput: {messages / elapsed:.1f} msg/s, {args.users * args.sessions / elapsed:.2f} sessions/s "
+          f"({messages} messages in {elapsed:.2f}s)")
+    print(f"\n{'state':24} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for label, samples in sorted(latencies.items(), key=lambda item: -statistics.median(item[1])):
+        p50, p95, p99 = percentiles(samples)
+        print(f"{label:24} {len(samples):7d} {p50 * 1e3:9.2f} {p95 * 1e3:9.2f} {p99 * 1e3:9.2f}")
+    everything = [sample for samples in latencies.values() for sample in samples]
+    p50, p95, p99 = percentiles(everything)
+    print(f"{'ALL':24} {len(everything):7d} {p50 * 1e3:9.2f} {p95 * 1e3:9.2f} {p99 * 1e3:9.2f}")
+    p50, _, p99 = percentiles(lag)
+    print(f"\nevent-loop lag: p50 {p50 * 1e3:.2f}ms  p99 {p99 * 1e3:.2f}ms  max {max(lag, default=0) * 1e3:.2f}ms")
+    print(f"RSS: {rss_before / 2**20:.1f} MiB -> {rss_after / 2**20:.1f} MiB "
+          f"(+{(rss_after - rss_before) / 2**20:.1f} MiB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the intake conversation with concurrent users.")
+    parser.add_argument("--users", type=int, default=50, help="concurrent virtual users")
+    parser.add_argument("--sessions", type=int, default=3, help="conversations per user")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="seconds added to each Bot API call")
+    parser.add_argument("--think", type=float, default=0.0, help="seconds a user waits between answers")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
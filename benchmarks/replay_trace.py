@@ -0,0 +1,203 @@
+"""Replay a recorded update trace against a local Bot API stand-in.
+
+Record real traffic with TRACE_PATH=trace.jsonl.gz (see update_trace.py), then
+run from the repository root:
+
+    python benchmarks/replay_trace.py trace.jsonl.gz --speed 10 --api-latency 0.02
+
+Runs the real Application from bot.py (in a temporary directory) against
+fake_bot_api.FakeBotAPI and puts the recorded updates on its queue with the
+recorded gaps between them divided by --speed (``max``: back to back). The
+flood guard's rate is raised by the same factor (and lifted for ``max``), so
+the same chats are throttled as when the trace was recorded. Several files
+(e.g. rotated ones, oldest first) are replayed one after another.
+
+The report shows the latency distribution per conversation state (the time
+from putting an update on the queue to its handler finishing, lane waits
+included), event-loop lag and throughput. Updates no handler took (throttled
+ones, answers of conversations that were already open when recording started)
+are counted separately.
+"""
+import argparse
+import asyncio
+import functools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# the script's own directory is on sys.path as well
+from load_test import monitor_loop_lag, percentiles  # noqa: E402
+
+
+def speed(text):
+    if text == "max":
+        return 0.0
+    value = float(text)
+    if value <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive or 'max'")
+    return value
+
+
+def load(paths):
+    """The kept ids of the trace and its ``(gap, update)`` pairs."""
+    from update_trace import read_trace
+
+    kept_ids, updates, skipped = (), [], 0.0
+    for path in paths:
+        for event in read_trace(path):
+            if event["event"] == "trace_started" and not kept_ids:
+                kept_ids = tuple(event["kept_ids"])
+            elif event["event"] == "update":
+                # updates recorded without a message only add their gap to the next one
+                if "message" in event["update"]:
+                    updates.append((skipped + event["gap"], event["update"]))
+                    skipped = 0.0
+                else:
+                    skipped += event["gap"]
+    return kept_ids, updates
+
+
+def register_files(api, updates, max_file_bytes):
+    """Serve made-up content of the recorded size for every file in the trace."""
+    for _, update in updates:
+        message = update["message"]
+        for file in message.get("photo", []) + ([message["document"]] if "document" in message else []):
+            size = min(file.get("file_size") or 1024, max_file_bytes)
+            # distinct content per file, so evidence is not deduplicated differently than it was live
+            api.add_file(random.Random(file["file_id"]).randbytes(size), file["file_id"])
+
+
+def _measure(handler, label, queued, latencies):
+    callback = handler.callback
+
+    @functools.wraps(callback)
+    async def measured(update, context):
+        try:
+            return await callback(update, context)
+        finally:
+            sent = queued.pop(update.update_id, None)
+            if sent is not None:
+                latencies.setdefault(label, []).append(time.perf_counter() - sent)
+
+    handler.callback = measured
+
+
+def measure(app, queued, latencies):
+    """Record queue-to-done latency of every update a group 0 handler takes, by state or command."""
+    from telegram.ext import CommandHandler, ConversationHandler
+
+    from metrics import state_label
+
+    for handler in app.handlers.get(0, []):
+        if isinstance(handler, ConversationHandler):
+            for entry in handler.entry_points + handler.fallbacks:
+                label = "/" + min(entry.commands) if isinstance(entry, CommandHandler) else entry.callback.__name__
+                _measure(entry, label, queued, latencies)
+            for state, handlers in handler.states.items():
+                for state_handler in handlers:
+                    _measure(state_handler, state_label(state), queued, latencies)
+        else:
+            label = "/" + min(handler.commands) if isinstance(handler, CommandHandler) else handler.callback.__name__
+            _measure(handler, label, queued, latencies)
+
+
+async def run(args):
+    from fake_bot_api import FakeBotAPI
+
+    kept_ids, updates = load(args.traces)
+    if not updates:
+        sys.exit("No updates in the trace.")
+    api = FakeBotAPI(latency=args.api_latency, record=False)
+    register_files(api, updates, args.max_file_bytes)
+    port = await api.start()
+    workdir = tempfile.mkdtemp(prefix="replay-")
+    os.chdir(workdir)
+    flood_rate = float(os.getenv("FLOOD_RATE", "1"))
+    os.environ.update({
+        "BOT_API_BASE_URL": f"http://127.0.0.1:{port}/bot",
+        "ADMIN_ID": str(kept_ids[0] if kept_ids else 1),
+        "REVIEWER_IDS": ",".join(str(kept) for kept in kept_ids[1:]),
+        "PERSISTENCE_PATH": os.path.join(workdir, "state.sqlite3"),
+        "ADMIN_SPOOL_PATH": os.path.join(workdir, "outbox.sqlite3"),
+        "CASE_STORE_PATH": os.path.join(workdir, "cases.sqlite3"),
+        "EVIDENCE_PATH": os.path.join(workdir, "evidence"),
+        "AUDIT_LOG_PATH": os.path.join(workdir, "audit.jsonl"),
+        "FLOOD_RATE": str(flood_rate * args.speed if args.speed else 1e9),
+        "PRICE_TABLE_PATH": os.path.join(workdir, "prices.json"),
+        "PRICE_URL": "",
+        # the replay itself is not recorded
+        "TRACE_PATH": "",
+    })
+    if not args.speed:
+        os.environ["FLOOD_BURST"] = "1000000"
+    from telegram import Update
+
+    import bot
+
+    app = bot.build_application("123456:REPLAY")
+    queued, latencies, lag = {}, {}, []
+    measure(app, queued, latencies)
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+
+    stop_monitor = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(lag, stop_monitor))
+    started = time.perf_counter()
+    due = started
+    for gap, data in updates:
+        if args.speed:
+            due += gap / args.speed
+            if due > time.perf_counter():
+                await asyncio.sleep(due - time.perf_counter())
+        update = Update.de_json(data, app.bot)
+        queued[update.update_id] = time.perf_counter()
+        await app.update_queue.put(update)
+    # updates still queued when stop() is called would be taken in without being waited for
+    await app.update_queue.join()
+    await app.stop()
+    elapsed = time.perf_counter() - started
+    stop_monitor.set()
+    await monitor
+    if app.post_stop:
+        await app.post_stop(app)
+    await app.shutdown()
+    await api.stop()
+
+    recorded = sum(gap for gap, _ in updates)
+    handled = sum(len(samples) for samples in latencies.values())
+    print(f"trace: {len(updates)} updates over {recorded:.1f}s recorded, "
+          f"{len({data['message']['chat']['id'] for _, data in updates})} chats")
+    print(f"replay: speed={args.speed or 'max'} api_latency={args.api_latency * 1e3:.0f}ms, "
+          f"{elapsed:.2f}s wall, {len(updates) / elapsed:.1f} updates/s")
+    print(f"handled: {handled}, not handled (throttled or outside a conversation): {len(updates) - handled}")
+    print(f"\n{'state':24} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for label, samples in sorted(latencies.items(), key=lambda item: -statistics.median(item[1])):
+        p50, p95, p99 = percentiles(samples)
+        print(f"{label:24} {len(samples):7d} {p50 * 1e3:9.2f} {p95 * 1e3:9.2f} {p99 * 1e3:9.2f}")
+    everything = [sample for samples in latencies.values() for sample in samples]
+    p50, p95, p99 = percentiles(everything)
+    print(f"{'ALL':24} {len(everything):7d} {p50 * 1e3:9.2f} {p95 * 1e3:9.2f} {p99 * 1e3:9.2f}")
+    p50, _, p99 = percentiles(lag)
+    print(f"\nevent-loop lag: p50 {p50 * 1e3:.2f}ms  p99 {p99 * 1e3:.2f}ms  max {max(lag, default=0) * 1e3:.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded update trace against the fake Bot API.")
+    parser.add_argument("traces", nargs="+", help="trace files written with TRACE_PATH, oldest first")
+    parser.add_argument("--speed", type=speed, default=1.0, help="1 for real time, 10 for ten times faster, or max")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="seconds added to each Bot API call")
+    parser.add_argument("--max-file-bytes", type=int, default=1024 * 1024,
+                        help="cap on the size of the stand-in evidence files")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,417 +1,291 @@
-from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, ContextTypes, ConversationHandler
-import re
+from telegram import Update
+from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, TypeHandler, filters, ContextTypes, ConversationHandler
+import asyncio
+import functools
 import os
+import tempfile
+import time
+import httpx
 from dotenv import load_dotenv
-
-# Define states - expanded to match PDF questions, added POLICE_CASE
-(
-    NAME, EMAIL, PHONE, LOCATION, INCIDENT_TYPE, INCIDENT_DESCRIPTION,
-    EXCHANGE, CRYPTO_TYPE, CRYPTO_TYPE_OTHER, NETWORK, NETWORK_OTHER,
-    WALLET_ADDRESSES, DATE_TIME, AMOUNT_LOST, HOW_OCCURRED, HOW_OCCURRED_OTHER,
-    PROOF_OWNERSHIP, TRANSACTION_IDS, EVIDENCE, POLICE_REPORT, POLICE_CASE,
-    OTHER_SERVICES, ADDITIONAL_INFO
-) = range(23)
+from admin_queue import AdminQueue, split_text
+from amounts import PriceTable, amount_in_usd
+from audit_log import AuditLog
+from case_draft import CaseDraft
+from case_store import CaseStore
+from digest import AdminDigest, is_urgent
+from evidence_store import EvidenceStore, FileTooLarge
+from export import MAX_PART_BYTES, export_parts, parse_export_args
+from flood_guard import FloodGuard
+from lifecycle import serve_polling
+from metrics import InstrumentedRequest, instrument_conversation, record_rejected, start_metrics_server
+from persistence import SharedConversationHandler, SQLitePersistence
+from routing import ReviewRouter
+from session_expiry import SessionExpiry
+from triage import TriageQueue
+from update_processor import PerChatUpdateProcessor
+from update_trace import TraceRecorder
+from flow import FLOW, NAME, STATE_NAMES, keyboard
+from webhook import ALLOWED_UPDATES, serve_webhook
 
 # Load environment variables from .env
 load_dotenv()
 
 # Global configuration from environment
 ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
-
-def is_valid_email(email):
-    """Check if email is valid using regex pattern"""
-    pattern = r'^[\w\.-]+@[\w\.-]+\.\w+$'
-    return re.match(pattern, email) is not None
+PERSISTENCE_PATH = os.getenv("PERSISTENCE_PATH", "bot_state.sqlite3")
+PERSISTENCE_FLUSH_INTERVAL = float(os.getenv("PERSISTENCE_FLUSH_INTERVAL", "10"))
+# Set by multiworker.py: several worker processes share the persistence database
+SHARED_STATE = os.getenv("SHARED_STATE", "0") == "1"
+BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL", "")
+
+# On SIGTERM, updates already received get this many seconds to be handled and
+# queued admin notifications this many more to go out; keep the sum below the
+# service manager's stop timeout
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "20"))
+ADMIN_DRAIN_TIMEOUT = float(os.getenv("ADMIN_DRAIN_TIMEOUT", "15"))
+
+# Sessions idle for this many seconds are ended and the user is told so
+SESSION_TIMEOUT = float(os.getenv("SESSION_TIMEOUT", "600"))
+
+# Each chat may send FLOOD_RATE updates per second on average, in bursts of up to
+# FLOOD_BURST (enough for a 10-photo album); anything beyond that is dropped
+FLOOD_RATE = float(os.getenv("FLOOD_RATE", "1"))
+FLOOD_BURST = int(os.getenv("FLOOD_BURST", "10"))
+
+# Updates of different chats are handled in parallel, up to this many at once
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "64"))
+
+# Webhook mode is used when WEBHOOK_URL is set (or WEBHOOK_MODE=1 behind a proxy that
+# registers the webhook itself); otherwise the bot long-polls.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "0") == "1"
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+
+# Outbound admin notification queue
+ADMIN_SPOOL_PATH = os.getenv("ADMIN_SPOOL_PATH", "admin_outbox.sqlite3")
+ADMIN_QUEUE_WORKERS = int(os.getenv("ADMIN_QUEUE_WORKERS", "4"))
+
+# Digest mode: instead of messages per case, the admin gets one summary plus a file
+# every ADMIN_DIGEST_INTERVAL seconds or ADMIN_DIGEST_MAX_CASES cases, whichever comes
+# first. Losses of at least ADMIN_URGENT_AMOUNT and the ADMIN_URGENT_TYPES incident
+# types (comma-separated) are still sent right away.
+ADMIN_DIGEST = os.getenv("ADMIN_DIGEST", "0") == "1"
+ADMIN_DIGEST_INTERVAL = float(os.getenv("ADMIN_DIGEST_INTERVAL", "300"))
+ADMIN_DIGEST_MAX_CASES = int(os.getenv("ADMIN_DIGEST_MAX_CASES", "20"))
+ADMIN_DIGEST_FORMAT = os.getenv("ADMIN_DIGEST_FORMAT", "jsonl")
+ADMIN_URGENT_AMOUNT = float(os.getenv("ADMIN_URGENT_AMOUNT", "10000"))
+ADMIN_URGENT_TYPES = frozenset(
+    item.strip() for item in os.getenv("ADMIN_URGENT_TYPES", "Hacked Wallet").split(",") if item.strip()
+)
+
+# Finished cases are spread over the REVIEWER_IDS (comma-separated Telegram user ids,
+# just ADMIN_ID by default): REVIEW_ROUTING=least_loaded gives each case to the reviewer
+# with the fewest open cases, network or language always sends the same network or user
+# language to the same reviewer. Cases nobody claimed within REVIEW_CLAIM_TIMEOUT
+# seconds go to another reviewer.
+REVIEWER_IDS = tuple(
+    int(item) for item in os.getenv("REVIEWER_IDS", "").split(",") if item.strip()
+) or (ADMIN_ID,)
+REVIEW_ROUTING = os.getenv("REVIEW_ROUTING", "least_loaded")
+REVIEW_CLAIM_TIMEOUT = float(os.getenv("REVIEW_CLAIM_TIMEOUT", "900"))
+
+# Indexed store of submitted cases
+CASE_STORE_PATH = os.getenv("CASE_STORE_PATH", "cases.sqlite3")
+
+# Amounts lost are converted to USD with prices cached in PRICE_TABLE_PATH and
+# refreshed in the background from PRICE_URL every PRICE_TTL seconds (PRICE_URL=
+# keeps the cached ones); /next hands out cases worth at least MIN_CLAIM_USD,
+# largest first
+PRICE_TABLE_PATH = os.getenv("PRICE_TABLE_PATH", "prices.json")
+PRICE_TTL = float(os.getenv("PRICE_TTL", "3600"))
+PRICE_URL = os.getenv("PRICE_URL", "https://api.coingecko.com/api/v3/simple/price")
+MIN_CLAIM_USD = float(os.getenv("MIN_CLAIM_USD", "1000"))
+
+# Photos and documents sent as evidence, stored by content hash
+EVIDENCE_PATH = os.getenv("EVIDENCE_PATH", "evidence")
+EVIDENCE_DOWNLOADS = int(os.getenv("EVIDENCE_DOWNLOADS", "4"))
+EVIDENCE_MAX_BYTES = int(os.getenv("EVIDENCE_MAX_BYTES", str(20 * 1024 * 1024)))
+# a media group holds at most 10 items
+MAX_EVIDENCE_FILES = 10
+
+# /export sends files of at most this many bytes (the Bot API takes uploads up to 50 MB)
+EXPORT_PART_BYTES = int(os.getenv("EXPORT_PART_BYTES", str(MAX_PART_BYTES)))
+
+# Per-field answer size caps in bytes on top of the defaults in case_draft.py,
+# e.g. "incident_description=4096,additional_info=1024"
+CASE_FIELD_LIMITS = {
+    field.strip(): int(limit)
+    for field, _, limit in (item.partition("=") for item in os.getenv("CASE_FIELD_LIMITS", "").split(","))
+    if field.strip()
+}
+
+# Prometheus metrics on http://METRICS_LISTEN:METRICS_PORT/metrics (disabled when 0)
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Audit trail of state transitions (with handler durations), rejected answers and
+# reviewer actions as JSONL in AUDIT_LOG_PATH (disabled when empty), rotated at
+# AUDIT_LOG_MAX_BYTES with AUDIT_LOG_BACKUPS old files kept. Answers to the
+# AUDIT_REDACT questions never reach the file. Events beyond AUDIT_QUEUE_SIZE
+# waiting to be written are dropped and counted rather than slowing the bot.
+AUDIT_LOG_PATH = os.getenv("AUDIT_LOG_PATH", "audit.jsonl")
+AUDIT_LOG_MAX_BYTES = int(os.getenv("AUDIT_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+AUDIT_LOG_BACKUPS = int(os.getenv("AUDIT_LOG_BACKUPS", "5"))
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_REDACT = frozenset(
+    item.strip() for item in os.getenv("AUDIT_REDACT", "name,email,phone").split(",") if item.strip()
+)
+
+# Opt-in trace of every incoming update, anonymized, with the time between
+# updates, as gzip-compressed JSONL in TRACE_PATH (disabled when empty). Replay
+# it against fake_bot_api.py with benchmarks/replay_trace.py.
+TRACE_PATH = os.getenv("TRACE_PATH", "")
+
+# Keyboards are immutable, so they are built once and shared by every chat
+START_KEYBOARD = keyboard((('Start Recovery Process',),))
+NEW_CASE_KEYBOARD = keyboard((('Start New Case',),))
+
+# Filter objects shared by every state of the conversation
+TEXT_ANSWER = filters.TEXT & ~filters.COMMAND
+NEW_CASE_BUTTON = filters.Regex('^Start New Case$')
+EVIDENCE_FILE = filters.PHOTO | filters.Document.ALL
+
+def audit(bot_data, event, **fields):
+    """Record an audit event, if the audit log is enabled."""
+    if "audit_log" in bot_data:
+        bot_data["audit_log"].emit(event, **fields)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start the conversation and ask for name."""
-    keyboard = [['Start Recovery Process']]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    
+    # answers and files of an earlier case must not leak into this one
+    context.user_data.clear()
     await update.message.reply_text(
         "🛡 Welcome to ChainGuard Solutions Crypto Recovery Desk! 🚀\n\n"
         "We specialize in tracing, investigating, and recovering stolen or lost cryptocurrencies.\n\n"
         "Before we can assist you, we need to gather detailed information about your case.\n"
         "All information is kept strictly confidential and used only for investigation purposes.\n\n"
         "Press 'Start Recovery Process' to begin, or use /cancel at any time to stop.",
-        reply_markup=reply_markup
+        reply_markup=START_KEYBOARD
     )
     return NAME
 
-async def get_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Store name and ask for email."""
-    if update.message.text == 'Start Recovery Process':
-        await update.message.reply_text(
-            "📋 Section A – Basic Contact Information\n\n"
-            "1. Please enter your Full Name (for official records):",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        return NAME
-    
-    if len(update.message.text) < 3:
-        await update.message.reply_text(
-            "⚠️ Please enter a valid name (at least 3 characters long).\n"
-            "What is your full name?"
-        )
-        return NAME
-    
-    context.user_data["name"] = update.message.text
-    await update.message.reply_text(
-        "2. Please enter your Email Address (for investigation updates):\n"
-        "Make sure to enter a valid email address where we can contact you."
-    )
-    return EMAIL
-
-async def get_email(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Validate email and ask for phone."""
-    email = update.message.text
-    
-    if not is_valid_email(email):
-        await update.message.reply_text(
-            "⚠️ Please enter a valid email address.\n"
-            "For example: name@example.com"
-        )
-        return EMAIL
-    
-    context.user_data["email"] = email
-    await update.message.reply_text(
-        "3. Please enter your Phone / WhatsApp number (optional):\n"
-        "You can type 'Skip' if you don't want to provide this."
-    )
-    return PHONE
-
-async def get_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Store phone and ask for location."""
-    if update.message.text.lower() == 'skip':
-        context.user_data["phone"] = "Not provided"
-    else:
-        # Check if the input contains only numbers, +, and -
-        phone = update.message.text.strip()
-        if not all(char.isdigit() or char in '+-' for char in phone):
-            await update.message.reply_text(
-                "⚠️ Please enter a valid phone number containing only numbers and +/- symbols.\n"
-                "Or type 'Skip' to continue without providing a phone number."
+def flow_handler(state):
+    """Create the callback answering questions in ``state`` via the compiled flow."""
+    async def handle(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        transition = FLOW.advance(state, update.message.text, context.user_data)
+        if transition.rejected:
+            record_rejected(state)
+            audit(
+                context.bot_data, "validation_failed", chat_id=update.effective_chat.id,
+                state=STATE_NAMES[state], field=FLOW.steps[state].key, answer=update.message.text,
+                reason=transition.text.splitlines()[0],
             )
-            return PHONE
-        context.user_data["phone"] = phone
-    
-    await update.message.reply_text(
-        "4. Please enter your Location / Country:\n"
-        "This helps determine jurisdiction & applicable laws."
-    )
-    return LOCATION
-
-async def get_location(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Store location and ask for incident type."""
-    context.user_data["location"] = update.message.text
-    
-    keyboard = [
-        ['Scam', 'Hacked Wallet'],
-        ['Fraudulent Investment', 'Lost Access'],
-        ['Other']
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    
-    await update.message.reply_text(
-        "📋 Section B – Incident Overview\n\n"
-        "5. What happened? Please choose one:",
-        reply_markup=reply_markup
-    )
-    return INCIDENT_TYPE
-
-async def get_incident_type(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Store incident type and ask for description."""
-    context.user_data["incident_type"] = update.message.text
-    
-    await update.message.reply_text(
-        "6. Please briefly describe the incident in your own words:",
-        reply_markup=ReplyKeyboardRemove()
-    )
-    return INCIDENT_DESCRIPTION
-
-async def get_incident_description(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Store description and ask for exchange."""
-    context.user_data["incident_description"] = update.message.text
-    
-    await update.message.reply_text(
-        "📋 Section C – Case Details\n\n"
-        "7. Exchange or Platform Name (if applicable):\n"
-        "Enter the name or type 'skip' if not applicable."
-    )
-    return EXCHANGE
-
-async def get_exchange(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Store exchange and ask for crypto type."""
-    if update.message.text.lower() == 'skip':
-        context.user_data["exchange"] = "Not applicable"
-    else:
-        context.user_data["exchange"] = update.message.text
-    
-    # Provide keyboard for crypto types (top 5 + Other)
-    keyboard = [
-        ['BTC', 'ETH', 'USDT'],
-        ['BNB', 'SOL', 'Other']
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    
-    await update.message.reply_text(
-        "8. Type of Cryptocurrency involved:\n"
-        "Please choose from the options below or select 'Other' to type a different crypto.",
-        reply_markup=reply_markup
-    )
-    return CRYPTO_TYPE
-
-async def get_crypto_type(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle selected crypto type or ask for custom input."""
-    text = update.message.text
-    if text == 'Other':
-        await update.message.reply_text(
-            "Please type the cryptocurrency name/symbol (e.g., XRP, ADA, DOGE):",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        return CRYPTO_TYPE_OTHER
-    
-    # If user selects one of the buttons
-    context.user_data["crypto_type"] = text
-    
-    # Ask for network (keyboard stays here)
-    keyboard = [
-        ['Ethereum', 'TRON'],
-        ['Binance Smart Chain', 'Bitcoin'],
-        ['Polygon', 'Avalanche'],
-        ['Other']
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    
-    await update.message.reply_text(
-        "9. Network / Blockchain:",
-        reply_markup=reply_markup
-    )
-    return NETWORK
-
-async def get_crypto_type_other(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Store custom crypto type and ask for network."""
-    context.user_data["crypto_type"] = update.message.text
-    
-    keyboard = [
-        ['Ethereum', 'TRON'],
-        ['Binance Smart Chain', 'Bitcoin'],
-        ['Polygon', 'Avalanche'],
-        ['Other']
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    
-    await update.message.reply_text(
-        "9. Network / Blockchain:",
-        reply_markup=reply_markup
-    )
-    return NETWORK
-
-async def get_network(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Store network and ask for wallet addresses."""
-    if update.message.text == 'Other':
-        await update.message.reply_text(
-            "Please specify the Network / Blockchain:",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        return NETWORK_OTHER
-    
-    context.user_data["network"] = update.message.text
-    
-    # remove keyboard here because next question requires free text (wallet addresses)
-    await update.message.reply_text(
-        "10. Wallet Address(es) involved:\n"
-        "Please provide your wallet address and the suspected scammer/hacker's address if known.\n"
-        "Separate multiple addresses with new lines.",
-        reply_markup=ReplyKeyboardRemove()
-    )
-    return WALLET_ADDRESSES
-
-async def get_network_other(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Store custom network and ask for wallet addresses."""
-    context.user_data["network"] = update.message.text
-    
-    # remove keyboard as above
-    await update.message.reply_text(
-        "10. Wallet Address(es) involved:\n"
-        "Please provide your wallet address and the suspected scammer/hacker's address if known.\n"
-        "Separate multiple addresses with new lines.",
-        reply_markup=ReplyKeyboardRemove()
-    )
-    return WALLET_ADDRESSES
-
-async def get_wallet_addresses(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Store wallet addresses and ask for date/time."""
-    context.user_data["wallet_addresses"] = update.message.text
-    
-    # ensure keyboard removed — free-text question
-    await update.message.reply_text(
-        "11. Date & Time of Incident:\n"
-        "Please provide the approximate date and time when the incident occurred.",
-        reply_markup=ReplyKeyboardRemove()
-    )
-    return DATE_TIME
-
-async def get_date_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Store date/time and ask for amount lost."""
-    context.user_data["date_time"] = update.message.text
-    
-    # ensure keyboard removed — free-text question
-    await update.message.reply_text(
-        "12. Total Amount Lost:\n"
-        "Please specify approximate USD value.",
-        reply_markup=ReplyKeyboardRemove()
-    )
-    return AMOUNT_LOST
-
-async def get_amount_lost(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Store amount and ask how loss occurred."""
-    context.user_data["amount_lost"] = update.message.text
-    
-    keyboard = [
-        ['Phishing link', 'Fake investment platform'],
-        ['Rug pull', 'Fake wallet app'],
-        ['Social engineering', 'Unauthorized transfer'],
-        ['KYC', 'Other']
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    
-    await update.message.reply_text(
-        "13. How did the loss occur?",
-        reply_markup=reply_markup
-    )
-    return HOW_OCCURRED
-
-async def get_how_occurred(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Store how loss occurred and ask about proof of ownership."""
-    if update.message.text == 'Other':
-        await update.message.reply_text(
-            "Please specify how the loss occurred:",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        return HOW_OCCURRED_OTHER
-    
-    context.user_data["how_occurred"] = update.message.text
-    
-    keyboard = [['Yes', 'No']]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    
-    await update.message.reply_text(
-        "📋 Section D – Evidence & Proof\n\n"
-        "14. Do you have proof of ownership of the assets?",
-        reply_markup=reply_markup
-    )
-    return PROOF_OWNERSHIP
-
-async def get_how_occurred_other(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Store custom how occurred and ask about proof of ownership."""
-    context.user_data["how_occurred"] = update.message.text
-    
-    keyboard = [['Yes', 'No']]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    
-    await update.message.reply_text(
-        "📋 Section D – Evidence & Proof\n\n"
-        "14. Do you have proof of ownership of the assets?",
-        reply_markup=reply_markup
-    )
-    return PROOF_OWNERSHIP
-
-async def get_proof_ownership(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Store proof ownership and ask about transaction IDs."""
-    context.user_data["proof_ownership"] = update.message.text
-    
-    keyboard = [['Yes', 'No']]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    
-    await update.message.reply_text(
-        "15. Do you have transaction IDs (TXIDs) from the blockchain?",
-        reply_markup=reply_markup
-    )
-    return TRANSACTION_IDS
-
-async def get_transaction_ids(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Store transaction IDs and ask about evidence."""
-    context.user_data["transaction_ids"] = update.message.text
-    
-    keyboard = [['Yes', 'No']]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    
-    await update.message.reply_text(
-        "16. Do you have chat screenshots, emails, or scammer contact details?",
-        reply_markup=reply_markup
-    )
-    return EVIDENCE
-
-async def get_evidence(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Store evidence and ask about police report."""
-    context.user_data["evidence"] = update.message.text
-    
-    keyboard = [['Yes', 'No']]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    
-    await update.message.reply_text(
-        "📋 Section E – Additional Information\n\n"
-        "17. Have you reported the case to local police or cybercrime authorities?\n"
-        "If yes, please mention the case reference number in the next question.",
-        reply_markup=reply_markup
-    )
-    return POLICE_REPORT
-
-async def get_police_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle the Yes/No for police report. If Yes -> ask for case number, if No -> continue."""
-    text = update.message.text.strip().lower()
-    if text == 'yes':
-        # Ask user to enter case/reference number
-        await update.message.reply_text(
-            "Please enter the case reference number (as provided by the police/cybercrime authority):",
-            reply_markup=ReplyKeyboardRemove()
+        if transition.completes:
+            return await submit_case(update, context)
+        await update.message.reply_text(transition.text, reply_markup=transition.reply_markup)
+        return transition.state
+
+    handle.__name__ = handle.__qualname__ = f"answer_{STATE_NAMES[state].lower()}"
+    return handle
+
+def upload_handler(state):
+    """Create the callback keeping photos/documents sent in ``state`` as evidence."""
+    step_key = FLOW.steps[state].key
+
+    async def handle(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        message = update.message
+        files = context.user_data.get("evidence_files") or []
+        if len(files) >= MAX_EVIDENCE_FILES:
+            await message.reply_text(
+                f"⚠️ You can attach up to {MAX_EVIDENCE_FILES} files. Please answer the question to continue."
+            )
+            return None
+        if message.photo:
+            attachment, kind, file_name = message.photo[-1], "photo", None
+        else:
+            attachment, kind, file_name = message.document, "document", message.document.file_name
+        too_large = (
+            f"⚠️ This file is too large (the limit is {EVIDENCE_MAX_BYTES // (1024 * 1024)} MB). "
+            "Please send a smaller file or answer the question to continue."
         )
-        return POLICE_CASE
-    else:
-        # treat anything other than 'yes' as 'no' (still store raw text if you want)
-        context.user_data["police_report"] = "No"
-        # proceed to Q18
-        keyboard = [['Yes', 'No']]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        await update.message.reply_text(
-            "18. Have you tried any other recovery services?",
-            reply_markup=reply_markup
+        if attachment.file_size and attachment.file_size > EVIDENCE_MAX_BYTES:
+            await message.reply_text(too_large)
+            return None
+        telegram_file = await attachment.get_file()
+        try:
+            sha256, size = await context.bot_data["evidence_store"].save(telegram_file.file_path)
+        except FileTooLarge:
+            await message.reply_text(too_large)
+            return None
+        except httpx.HTTPError as exc:
+            # the error text would contain the download URL, and with it the bot token
+            status = f" {exc.response.status_code}" if isinstance(exc, httpx.HTTPStatusError) else ""
+            print(f"Evidence download failed: {type(exc).__name__}{status}")
+            await message.reply_text("⚠️ This file could not be received. Please send it again.")
+            return None
+        files.append({
+            "sha256": sha256, "kind": kind, "file_id": attachment.file_id,
+            "file_name": file_name, "size": size, "step": step_key,
+        })
+        context.user_data["evidence_files"] = files
+        await message.reply_text(
+            f"📎 Received ({len(files)} file(s) attached so far). "
+            "Send more, or answer the question above to continue."
         )
-        return OTHER_SERVICES
-
-async def get_police_case(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Store police case number and continue to question 18."""
-    context.user_data["police_report"] = update.message.text.strip()
-    # proceed to Q18
-    keyboard = [['Yes', 'No']]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    await update.message.reply_text(
-        "18. Have you tried any other recovery services?",
-        reply_markup=reply_markup
-    )
-    return OTHER_SERVICES
-
-async def get_other_services(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Store other services info and ask for additional details."""
-    context.user_data["other_services"] = update.message.text
-    
-    await update.message.reply_text(
-        "19. Any additional details you believe are important?\n"
-        "Please provide any other relevant information that might help with your case.",
-        reply_markup=ReplyKeyboardRemove()
-    )
-    return ADDITIONAL_INFO
-
-async def get_additional_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Store additional info and send complete case to admin."""
-    context.user_data["additional_info"] = update.message.text
-
-    user_data = context.user_data
-    
+        # stay in the same state
+        return None
+
+    handle.__name__ = handle.__qualname__ = f"upload_{STATE_NAMES[state].lower()}"
+    return handle
+
+def format_evidence_messages(case_id, files):
+    """Admin messages forwarding the evidence files of a case, one media group per kind.
+
+    Telegram does not mix documents with photos in a media group, and a group
+    needs at least two items, so single files are sent on their own.
+    """
+    messages = []
+    for kind, method in (("photo", "send_photo"), ("document", "send_document")):
+        items = [item for item in files if item["kind"] == kind]
+        caption = f"📎 Case #{case_id} evidence"
+        if len(items) == 1:
+            messages.append({"method": method, kind: items[0]["file_id"], "caption": caption})
+        elif items:
+            media = [{"type": kind, "media": item["file_id"]} for item in items]
+            media[0]["caption"] = caption
+            messages.append({"method": "send_media_group", "media": media})
+    return messages
+
+def format_links(links):
+    """One line listing the cases linked to a case, or nothing if there are none."""
+    if not links:
+        return ""
+    return "🔗 Linked to cases: " + ", ".join(
+        f"#{other_id} ({'; '.join(reasons)})" for other_id, reasons in links
+    ) + "\n"
+
+def format_usd(amount_usd):
+    """``amount_usd`` as "≈ $12,345", or "unknown" if the amount could not be converted."""
+    return "unknown" if amount_usd is None else f"≈ ${amount_usd:,.0f}"
+
+def format_minimum_claim(amount_usd):
+    """The minimum-claim line, with whether the case meets it."""
+    line = f"MINIMUM CLAIM: USD ${MIN_CLAIM_USD:,.0f}+"
+    if amount_usd is None:
+        return f"❔ {line} (amount not recognized)"
+    if amount_usd >= MIN_CLAIM_USD:
+        return f"✅ {line} (qualifies)"
+    return f"❌ {line} (below minimum)"
+
+def format_case_messages(case_id, user_data, links=(), amount_usd=None):
+    """Build the two admin messages describing a submitted case."""
     message = (
-        f"🚨 NEW CRYPTO RECOVERY CASE SUBMISSION 🚨\n\n"
+        f"🚨 NEW CRYPTO RECOVERY CASE SUBMISSION 🚨\n"
+        f"🆔 Case #{case_id}\n"
+        f"{format_links(links)}\n"
         f"📋 SECTION A - BASIC CONTACT INFORMATION:\n"
         f"👤 Name: {user_data.get('name','')}\n"
         f"📧 Email: {user_data.get('email','')}\n"
@@ -429,31 +303,68 @@ async def get_additional_info(update: Update, context: ContextTypes.DEFAULT_TYPE
         f"🔑 Wallet Addresses: {user_data.get('wallet_addresses','')}\n"
         f"📅 Date/Time: {user_data.get('date_time','')}\n"
         f"💸 Amount Lost: {user_data.get('amount_lost','')}\n"
+        f"💵 In USD: {format_usd(amount_usd)}\n"
         f"❓ How Occurred: {user_data.get('how_occurred','')}\n\n"
     )
     
-    # Send first part
-    await context.bot.send_message(chat_id=ADMIN_ID, text=message)
-    
-    # Send second part with evidence info
+    # Second part with evidence info
     evidence_message = (
         f"📋 SECTION D - EVIDENCE & PROOF:\n"
         f"📄 Proof of Ownership: {user_data.get('proof_ownership','')}\n"
         f"🔍 Transaction IDs: {user_data.get('transaction_ids','')}\n"
-        f"🗂 Evidence Available: {user_data.get('evidence','')}\n\n"
+        f"🗂 Evidence Available: {user_data.get('evidence','')}\n"
+        f"📎 Files Attached: {len(user_data.get('evidence_files') or ())}\n\n"
         
         f"📋 SECTION E - ADDITIONAL INFO:\n"
         f"🚔 Police Report / Case No.: {user_data.get('police_report','')}\n"
         f"🔄 Other Services: {user_data.get('other_services','')}\n"
         f"ℹ️ Additional Details: {user_data.get('additional_info','')}\n\n"
-        f"⚠️ MINIMUM CLAIM: USD $1,000+"
+        f"{format_minimum_claim(amount_usd)}"
     )
     
-    await context.bot.send_message(chat_id=ADMIN_ID, text=evidence_message)
+    return [message, evidence_message]
+
+def with_claim_prompt(messages, case_id):
+    """Tell the reviewer a case was sent to how to claim and close it."""
+    prompt = f"👉 /claim {case_id} to take this case, /done {case_id} once reviewed"
+    return messages[:-1] + [f"{messages[-1]}\n\n{prompt}"]
 
-    keyboard = [['Start New Case']]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
+async def submit_case(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Store the finished case, send it to its reviewer and thank the user."""
+    user_data = context.user_data
+    case_store = context.bot_data["case_store"]
+    amount_usd = amount_in_usd(
+        user_data.get("amount_lost"), user_data.get("crypto_type"), context.bot_data["price_table"]
+    )
+    reviewer_id = context.bot_data["review_router"].route(
+        user_data.get("network", ""), update.effective_user.language_code or ""
+    )
+    digest = context.bot_data.get("admin_digest")
+    # the digest only collects the cases routed to the admin
+    digested = (digest is not None and reviewer_id == ADMIN_ID
+                and not is_urgent(user_data, amount_usd, ADMIN_URGENT_AMOUNT, ADMIN_URGENT_TYPES))
+    case_id = await case_store.add_case(
+        user_data, user_id=update.effective_user.id, chat_id=update.effective_chat.id,
+        amount_usd=amount_usd, reviewer_id=reviewer_id, held=digested,
+    )
+    # Earlier cases with the same wallet, TXID or a near-identical story
+    links = await case_store.links(case_id)
+    audit(
+        context.bot_data, "case_submitted", case_id=case_id, chat_id=update.effective_chat.id,
+        reviewer_id=reviewer_id, amount_usd=amount_usd, linked=[other_id for other_id, _ in links],
+    )
     
+    if digested:
+        await digest.add(case_id, format_links(links))
+    else:
+        # Both parts are spooled and delivered in the background, so the user's
+        # confirmation does not wait on the Bot API
+        await context.bot_data["admin_queue"].enqueue(
+            reviewer_id,
+            with_claim_prompt(format_case_messages(case_id, user_data, links, amount_usd), case_id)
+            + format_evidence_messages(case_id, user_data.get("evidence_files") or ()),
+        )
+
     # Append your requested thank-you message lines exactly as provided
     await update.message.reply_text(
         "✅ Thank you for providing the details!\n\n"
@@ -464,90 +375,345 @@ async def get_additional_info(update: Update, context: ContextTypes.DEFAULT_TYPE
         "No Upfront Fees – Pay Only Upon Recovery \n"
         "🛡️*Your Crypto Isn't Gone – Let Experts Trace, Investigate, and Recover It.*\n\n"
         "You can start a new case by pressing 'Start New Case' or using /start command.",
-        reply_markup=reply_markup
+        reply_markup=NEW_CASE_KEYBOARD
     )
     return ConversationHandler.END
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Cancel conversation."""
-    keyboard = [['Start New Case']]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    
     await update.message.reply_text(
         "❌ Process cancelled.\n"
         "You can start a new case anytime by pressing 'Start New Case' or using /start command.",
-        reply_markup=reply_markup
+        reply_markup=NEW_CASE_KEYBOARD
     )
     return ConversationHandler.END
 
-async def timeout(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Timeout handler."""
-    keyboard = [['Start New Case']]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    
-    await update.message.reply_text(
+async def timeout(bot, chat_id):
+    """Tell the user their session was ended for inactivity (called by SessionExpiry)."""
+    await bot.send_message(
+        chat_id,
         "⏰ Session timed out due to inactivity.\n"
         "You can start a new case anytime by pressing 'Start New Case' or using /start command.",
-        reply_markup=reply_markup
+        reply_markup=NEW_CASE_KEYBOARD
     )
-    return ConversationHandler.END
 
-def main():
-    """Run the bot."""
-    # Read bot token from environment
-    bot_token = os.getenv("BOT_TOKEN")
-    if not bot_token:
-        raise RuntimeError("BOT_TOKEN is not set. Please add it to your .env file.")
-
-    if ADMIN_ID == 0:
-        print("Warning: ADMIN_ID is not set. Set ADMIN_ID in .env to receive submissions.")
+async def reassigned(app, case_id, previous_id, reviewer_id):
+    """Send a case nobody claimed in time to its new reviewer (called by ReviewRouter)."""
+    case_store = app.bot_data["case_store"]
+    case = await case_store.get(case_id)
+    links = await case_store.links(case_id)
+    audit(app.bot_data, "case_reassigned", case_id=case_id, previous_id=previous_id, reviewer_id=reviewer_id)
+    admin_queue = app.bot_data["admin_queue"]
+    await admin_queue.enqueue(
+        reviewer_id,
+        [f"↪️ Case #{case_id} was not claimed in time by its reviewer and is now yours."]
+        + with_claim_prompt(format_case_messages(case_id, case, links, case["amount_usd"]), case_id)
+        + format_evidence_messages(case_id, case["evidence_files"]),
+    )
+    await admin_queue.enqueue(
+        previous_id, [f"↪️ Case #{case_id} was not claimed in time and went to another reviewer."]
+    )
 
-    app = ApplicationBuilder().token(bot_token).build()
+FIND_USAGE = (
+    "Usage: /find <field>:<value>\n"
+    "Fields: email, wallet, txid, network\n"
+    "Example: /find wallet:0x1234..."
+)
+
+async def show_case(update: Update, context: ContextTypes.DEFAULT_TYPE, case):
+    """Reply with a stored case and queue its evidence files to the same chat."""
+    case_id = case["id"]
+    links = await context.bot_data["case_store"].links(case_id)
+    for text in format_case_messages(case_id, case, links, case["amount_usd"]):
+        for part in split_text(text):
+            await update.message.reply_text(part)
+    evidence = format_evidence_messages(case_id, case["evidence_files"])
+    if evidence:
+        await context.bot_data["admin_queue"].enqueue(update.effective_chat.id, evidence)
+
+async def case_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Reviewer: show a stored case by id."""
+    if not context.args or not context.args[0].lstrip('#').isdigit():
+        await update.message.reply_text("Usage: /case <id>")
+        return
+    case_id = int(context.args[0].lstrip('#'))
+    case = await context.bot_data["case_store"].get(case_id)
+    if case is None:
+        await update.message.reply_text(f"No case #{case_id} found.")
+        return
+    audit(context.bot_data, "case_viewed", case_id=case_id, reviewer_id=update.effective_user.id)
+    await show_case(update, context, case)
+
+async def next_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Reviewer: claim and show the largest case nobody has reviewed yet."""
+    triage = context.bot_data["triage"]
+    claimed = await triage.pop(update.effective_user.id)
+    if claimed is None:
+        await update.message.reply_text("No cases waiting for review.")
+        return
+    # the case may have been routed to another reviewer
+    await context.bot_data["review_router"].refresh()
+    case_id, amount_usd = claimed
+    audit(context.bot_data, "case_claimed", case_id=case_id, reviewer_id=update.effective_user.id, via="next")
+    await update.message.reply_text(
+        f"🎯 Next case: #{case_id} ({format_usd(amount_usd)}), {len(triage)} more waiting"
+    )
+    await show_case(update, context, await context.bot_data["case_store"].get(case_id))
+
+async def claim_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Reviewer: take a case for review, usually one that was routed to you."""
+    if not context.args or not context.args[0].lstrip('#').isdigit():
+        await update.message.reply_text("Usage: /claim <id>")
+        return
+    case_id = int(context.args[0].lstrip('#'))
+    if await context.bot_data["case_store"].get(case_id) is None:
+        await update.message.reply_text(f"No case #{case_id} found.")
+        return
+    if not await context.bot_data["review_router"].claim(case_id, update.effective_user.id):
+        await update.message.reply_text(f"Case #{case_id} was already claimed.")
+        return
+    audit(context.bot_data, "case_claimed", case_id=case_id, reviewer_id=update.effective_user.id, via="claim")
+    await update.message.reply_text(f"✅ Case #{case_id} is yours. Send /done {case_id} once it is reviewed.")
+
+async def done_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Reviewer: close one of your cases."""
+    if not context.args or not context.args[0].lstrip('#').isdigit():
+        await update.message.reply_text("Usage: /done <id>")
+        return
+    case_id = int(context.args[0].lstrip('#'))
+    if not await context.bot_data["review_router"].ack(case_id, update.effective_user.id):
+        await update.message.reply_text(f"Case #{case_id} is not one of your open cases.")
+        return
+    audit(context.bot_data, "case_closed", case_id=case_id, reviewer_id=update.effective_user.id)
+    await update.message.reply_text(f"☑️ Case #{case_id} closed.")
+
+async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Reviewer: search stored cases by email, wallet address, TXID or network."""
+    field, _, value = " ".join(context.args).partition(":")
+    field = field.strip().lower()
+    if field not in ("email", "wallet", "txid", "network") or not value.strip():
+        await update.message.reply_text(FIND_USAGE)
+        return
+    cases = await context.bot_data["case_store"].find(field, value)
+    # the searched value may itself be personal data, so only the field is recorded
+    audit(
+        context.bot_data, "cases_searched", field=field, results=len(cases), reviewer_id=update.effective_user.id
+    )
+    if not cases:
+        await update.message.reply_text("No matching cases.")
+        return
+    lines = [
+        f"#{case['id']} · {time.strftime('%Y-%m-%d %H:%M', time.gmtime(case['submitted_at']))} · "
+        f"{case['name']} · {case['email']} · {case['network']} · {case['amount_lost']}"
+        for case in cases
+    ]
+    await update.message.reply_text(f"🔎 {len(cases)} matching case(s):\n" + "\n".join(lines))
+
+EXPORT_USAGE = (
+    "Usage: /export <csv|jsonl|parquet> [from:YYYY-MM-DD] [to:YYYY-MM-DD] [network:<name>] [type:<incident type>]\n"
+    "Example: /export csv from:2024-01-01 network:TRON"
+)
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin: export stored cases as CSV/JSONL/Parquet documents."""
+    try:
+        fmt, criteria = parse_export_args(context.args)
+    except ValueError as exc:
+        await update.message.reply_text(f"{exc}\n\n{EXPORT_USAGE}")
+        return
+    rows = context.bot_data["case_store"].iter_cases(**criteria)
+    total = sent = 0
+    with tempfile.TemporaryDirectory(prefix="export-") as directory:
+        parts = export_parts(rows, fmt, directory, EXPORT_PART_BYTES)
+        try:
+            # each part is written off the event loop and deleted once it was sent
+            while (part := await asyncio.to_thread(next, parts, None)) is not None:
+                path, count = part
+                total += count
+                sent += 1
+                with open(path, "rb") as file:
+                    await update.message.reply_document(
+                        file, filename=os.path.basename(path),
+                        caption=f"📦 Cases export part {sent} ({count} case(s))", write_timeout=300,
+                    )
+                os.unlink(path)
+        finally:
+            parts.close()
+    audit(
+        context.bot_data, "cases_exported", format=fmt, criteria=criteria, cases=total, files=sent,
+        reviewer_id=update.effective_user.id,
+    )
+    if not total:
+        await update.message.reply_text("No matching cases.")
+        return
+    await update.message.reply_text(f"✅ Exported {total} case(s) in {sent} file(s).")
+
+async def post_init(app):
+    """Start background services once the bot is initialized."""
+    if "audit_log" in app.bot_data:
+        await app.bot_data["audit_log"].start()
+    if "trace_recorder" in app.bot_data:
+        await app.bot_data["trace_recorder"].start()
+    admin_queue = AdminQueue(app.bot, ADMIN_SPOOL_PATH, workers=ADMIN_QUEUE_WORKERS)
+    await admin_queue.start()
+    app.bot_data["admin_queue"] = admin_queue
+    app.bot_data["case_store"] = CaseStore(CASE_STORE_PATH)
+    review_router = ReviewRouter(
+        app.bot_data["case_store"], REVIEWER_IDS, REVIEW_ROUTING, REVIEW_CLAIM_TIMEOUT,
+        on_reassign=functools.partial(reassigned, app),
+    )
+    await review_router.start()
+    app.bot_data["review_router"] = review_router
+    price_table = PriceTable(PRICE_TABLE_PATH, PRICE_TTL, PRICE_URL or None)
+    await price_table.start()
+    app.bot_data["price_table"] = price_table
+    triage = TriageQueue(app.bot_data["case_store"], MIN_CLAIM_USD)
+    await triage.sync()
+    app.bot_data["triage"] = triage
+    if ADMIN_DIGEST:
+        admin_digest = AdminDigest(
+            admin_queue, app.bot_data["case_store"], ADMIN_SPOOL_PATH, ADMIN_ID,
+            interval=ADMIN_DIGEST_INTERVAL, max_cases=ADMIN_DIGEST_MAX_CASES, fmt=ADMIN_DIGEST_FORMAT,
+        )
+        await admin_digest.start()
+        app.bot_data["admin_digest"] = admin_digest
+    evidence_store = EvidenceStore(EVIDENCE_PATH, EVIDENCE_DOWNLOADS, EVIDENCE_MAX_BYTES)
+    await evidence_store.start()
+    app.bot_data["evidence_store"] = evidence_store
+    app.bot_data["session_expiry"].start(app)
+    if METRICS_PORT:
+        app.bot_data["metrics_server"] = await start_metrics_server(METRICS_LISTEN, METRICS_PORT)
+        print(f"📈 Metrics on http://{METRICS_LISTEN}:{METRICS_PORT}/metrics")
+
+async def post_stop(app):
+    """Stop background services while the bot can still make requests."""
+    await app.bot_data["session_expiry"].stop()
+    await app.bot_data["review_router"].stop()
+    await app.bot_data["price_table"].stop()
+    if "admin_digest" in app.bot_data:
+        await app.bot_data["admin_digest"].stop()
+    # whatever is not delivered in time stays spooled and goes out after the restart
+    await app.bot_data["admin_queue"].drain(ADMIN_DRAIN_TIMEOUT)
+    await app.bot_data["admin_queue"].stop()
+    app.bot_data["case_store"].close()
+    await app.bot_data["evidence_store"].stop()
+    if "metrics_server" in app.bot_data:
+        app.bot_data["metrics_server"].close()
+    # last, so the events of everything above are written too
+    if "audit_log" in app.bot_data:
+        await app.bot_data["audit_log"].stop()
+    if "trace_recorder" in app.bot_data:
+        await app.bot_data["trace_recorder"].stop()
+
+def build_application(bot_token):
+    """Build the Application with persistence and the intake conversation registered."""
+    # Answers are collected in a compact, size-capped CaseDraft instead of a dict
+    draft_class = CaseDraft.with_limits(CASE_FIELD_LIMITS)
+    # In-flight sessions survive restarts; changes are flushed in batches every few seconds
+    persistence = SQLitePersistence(
+        PERSISTENCE_PATH, update_interval=PERSISTENCE_FLUSH_INTERVAL, shared=SHARED_STATE,
+        user_data_class=draft_class,
+    )
+    trace_recorder = TraceRecorder(TRACE_PATH, kept_ids=(ADMIN_ID, *REVIEWER_IDS)) if TRACE_PATH else None
+    builder = (
+        ApplicationBuilder()
+        .token(bot_token)
+        .context_types(ContextTypes(user_data=draft_class))
+        .persistence(persistence)
+        .concurrent_updates(PerChatUpdateProcessor(MAX_CONCURRENT_UPDATES, recorder=trace_recorder))
+        # same pool size as the default request, plus per-method call timings
+        .request(InstrumentedRequest(connection_pool_size=256))
+        .post_init(post_init)
+        .post_stop(post_stop)
+    )
+    if BOT_API_BASE_URL:
+        # e.g. a local fake_bot_api.py instance for end-to-end runs
+        # files are served next to the API: http://host/bot<token>/... -> http://host/file/bot<token>/...
+        base_file_url = BOT_API_BASE_URL.rstrip("/").removesuffix("/bot") + "/file/bot"
+        builder = builder.base_url(BOT_API_BASE_URL).base_file_url(base_file_url)
+    app = builder.build()
+    if trace_recorder is not None:
+        app.bot_data["trace_recorder"] = trace_recorder
 
     # Add conversation handler with all new states
-    conv_handler = ConversationHandler(
+    conversation_class = SharedConversationHandler if SHARED_STATE else ConversationHandler
+    conv_handler = conversation_class(
         entry_points=[
             CommandHandler("start", start),
-            MessageHandler(filters.Regex('^Start New Case$'), start)
+            MessageHandler(NEW_CASE_BUTTON, start)
         ],
         states={
-            NAME: [ MessageHandler(filters.TEXT & ~filters.COMMAND, get_name) ],
-            EMAIL: [ MessageHandler(filters.TEXT & ~filters.COMMAND, get_email) ],
-            PHONE: [ MessageHandler(filters.TEXT & ~filters.COMMAND, get_phone) ],
-            LOCATION: [ MessageHandler(filters.TEXT & ~filters.COMMAND, get_location) ],
-            INCIDENT_TYPE: [ MessageHandler(filters.TEXT & ~filters.COMMAND, get_incident_type) ],
-            INCIDENT_DESCRIPTION: [ MessageHandler(filters.TEXT & ~filters.COMMAND, get_incident_description) ],
-            EXCHANGE: [ MessageHandler(filters.TEXT & ~filters.COMMAND, get_exchange) ],
-            CRYPTO_TYPE: [ MessageHandler(filters.TEXT & ~filters.COMMAND, get_crypto_type) ],
-            CRYPTO_TYPE_OTHER: [ MessageHandler(filters.TEXT & ~filters.COMMAND, get_crypto_type_other) ],
-            NETWORK: [ MessageHandler(filters.TEXT & ~filters.COMMAND, get_network) ],
-            NETWORK_OTHER: [ MessageHandler(filters.TEXT & ~filters.COMMAND, get_network_other) ],
-            WALLET_ADDRESSES: [ MessageHandler(filters.TEXT & ~filters.COMMAND, get_wallet_addresses) ],
-            DATE_TIME: [ MessageHandler(filters.TEXT & ~filters.COMMAND, get_date_time) ],
-            AMOUNT_LOST: [ MessageHandler(filters.TEXT & ~filters.COMMAND, get_amount_lost) ],
-            HOW_OCCURRED: [ MessageHandler(filters.TEXT & ~filters.COMMAND, get_how_occurred) ],
-            HOW_OCCURRED_OTHER: [ MessageHandler(filters.TEXT & ~filters.COMMAND, get_how_occurred_other) ],
-            PROOF_OWNERSHIP: [ MessageHandler(filters.TEXT & ~filters.COMMAND, get_proof_ownership) ],
-            TRANSACTION_IDS: [ MessageHandler(filters.TEXT & ~filters.COMMAND, get_transaction_ids) ],
-            EVIDENCE: [ MessageHandler(filters.TEXT & ~filters.COMMAND, get_evidence) ],
-            POLICE_REPORT: [ MessageHandler(filters.TEXT & ~filters.COMMAND, get_police_report) ],
-            POLICE_CASE: [ MessageHandler(filters.TEXT & ~filters.COMMAND, get_police_case) ],
-            OTHER_SERVICES: [ MessageHandler(filters.TEXT & ~filters.COMMAND, get_other_services) ],
-            ADDITIONAL_INFO: [ MessageHandler(filters.TEXT & ~filters.COMMAND, get_additional_info) ],
+            state: [MessageHandler(TEXT_ANSWER, flow_handler(state))]
+            + ([MessageHandler(EVIDENCE_FILE, upload_handler(state))] if FLOW.steps[state].attachments else [])
+            for state in FLOW.states
         },
         fallbacks=[
             CommandHandler("cancel", cancel),
-            MessageHandler(filters.Regex('^Start New Case$'), start)
+            MessageHandler(NEW_CASE_BUTTON, start)
         ],
-        conversation_timeout=600  # keep if you have job-queue extras installed; otherwise ignore the warning
+        name="intake",
+        persistent=True,
     )
 
+    on_transition = None
+    if AUDIT_LOG_PATH:
+        audit_log = AuditLog(
+            AUDIT_LOG_PATH, AUDIT_LOG_MAX_BYTES, AUDIT_LOG_BACKUPS, AUDIT_QUEUE_SIZE, redact=AUDIT_REDACT
+        )
+        app.bot_data["audit_log"] = audit_log
+        on_transition = audit_log.transition
+    # one wrapper per callback records both the metrics and the audit event
+    instrument_conversation(conv_handler, on_transition)
     app.add_handler(conv_handler)
-    
+
+    # Flooding chats are cut off before anything else sees their updates
+    flood_guard = FloodGuard(FLOOD_RATE, FLOOD_BURST, exempt=(ADMIN_ID, *REVIEWER_IDS))
+    app.bot_data["flood_guard"] = flood_guard
+    app.add_handler(TypeHandler(Update, flood_guard.check), group=-2)
+
+    # Idle sessions are expired by one sweeper instead of a JobQueue job per conversation
+    session_expiry = SessionExpiry(conv_handler, SESSION_TIMEOUT, timeout)
+    app.bot_data["session_expiry"] = session_expiry
+    app.add_handler(TypeHandler(Update, session_expiry.record_activity), group=-1)
+
+    # Reviewers look cases up and work through them; only the admin exports the case store
+    admin_only = filters.User(user_id=ADMIN_ID)
+    reviewer_only = filters.User(user_id=(ADMIN_ID, *REVIEWER_IDS))
+    app.add_handler(CommandHandler("case", case_command, filters=reviewer_only))
+    app.add_handler(CommandHandler("next", next_command, filters=reviewer_only))
+    app.add_handler(CommandHandler("claim", claim_command, filters=reviewer_only))
+    app.add_handler(CommandHandler("done", done_command, filters=reviewer_only))
+    app.add_handler(CommandHandler("find", find_command, filters=reviewer_only))
+    app.add_handler(CommandHandler("export", export_command, filters=admin_only))
+    return app
+
+def main():
+    """Run the bot."""
+    # Read bot token from environment
+    bot_token = os.getenv("BOT_TOKEN")
+    if not bot_token:
+        raise RuntimeError("BOT_TOKEN is not set. Please add it to your .env file.")
+
+    if ADMIN_ID == 0:
+        print("Warning: ADMIN_ID is not set. Set ADMIN_ID in .env to receive submissions.")
+
+    app = build_application(bot_token)
+
     # Start the bot
     print("🚀 Enhanced Crypto Recovery Bot is running...")
     print("📋 Now collecting comprehensive case details as per PDF requirements")
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+    if WEBHOOK_URL or WEBHOOK_MODE:
+        asyncio.run(serve_webhook(
+            app,
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            drain_timeout=SHUTDOWN_DRAIN_TIMEOUT,
+        ))
+    else:
+        asyncio.run(serve_polling(app, ALLOWED_UPDATES, SHUTDOWN_DRAIN_TIMEOUT))
 
 if __name__ == "__main__":
     main()
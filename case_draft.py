@@ -0,0 +1,153 @@
+import copy
+from collections.abc import MutableMapping
+from types import MappingProxyType
+
+from case_store import CASE_FIELDS
+from flow import CRYPTO_TYPES, INCIDENT_TYPES, LOSS_CAUSES, NETWORKS, YES_NO
+
+# Free-text answers get more room than one-line answers; wallet addresses and
+# TXIDs can be a list, so they get the most
+DEFAULT_LIMIT = 256
+FIELD_LIMITS = MappingProxyType({
+    "incident_description": 2048,
+    "how_occurred": 1024,
+    "additional_info": 2048,
+    "wallet_addresses": 4096,
+    "transaction_ids": 4096,
+})
+
+ELLIPSIS = "…"
+
+# Validated lists, one address or TXID per line: these are cut between entries,
+# so a half address never reaches the case or its identifier index
+LINE_FIELDS = frozenset({"wallet_addresses", "transaction_ids"})
+
+# Keyboard answers arrive as a fresh string in every update. Mapping them to these
+# objects lets every session share a single copy of each one.
+_CHOICES = {
+    label: label
+    for rows in (YES_NO, INCIDENT_TYPES, CRYPTO_TYPES, NETWORKS, LOSS_CAUSES)
+    for row in rows
+    for label in row
+}
+
+
+def truncate_utf8(text, limit):
+    """Cut ``text`` to at most ``limit`` UTF-8 bytes, marking the cut with an ellipsis."""
+    # a character is at most 4 bytes, so short strings never need encoding
+    if len(text) * 4 <= limit:
+        return text
+    encoded = text.encode("utf-8")
+    if len(encoded) <= limit:
+        return text
+    cut = limit - len(ELLIPSIS.encode("utf-8"))
+    if cut <= 0:
+        return encoded[:limit].decode("utf-8", "ignore")
+    return encoded[:cut].decode("utf-8", "ignore") + ELLIPSIS
+
+
+def truncate_lines(text, limit):
+    """Cut ``text`` to at most ``limit`` UTF-8 bytes by dropping whole lines, then an ellipsis line."""
+    if len(text) * 4 <= limit:
+        return text
+    encoded = text.encode("utf-8")
+    if len(encoded) <= limit:
+        return text
+    marker = ("\n" + ELLIPSIS).encode("utf-8")
+    cut = encoded.rfind(b"\n", 0, limit - len(marker) + 1)
+    if cut <= 0:
+        # not even the first line fits
+        return ELLIPSIS
+    return encoded[:cut].decode("utf-8") + marker.decode("utf-8")
+
+
+class CaseDraft(MutableMapping):
+    """The answers of one intake session, used as ``context.user_data``.
+
+    One slot per case field instead of a per-user dict, keyboard answers shared
+    between sessions, and every answer capped at a per-field number of bytes.
+    An answer over the cap is truncated rather than refused, so a huge paste
+    can't hold a session hostage or bloat memory. Keys other than the case
+    fields still work; they are kept in a small overflow dict.
+
+    It is a regular mutable mapping, so the flow, the case store and the
+    persistence (which serializes it with ``dict(draft)``) need no changes.
+    """
+
+    __slots__ = CASE_FIELDS + ("_extra",)
+
+    limits = FIELD_LIMITS
+    default_limit = DEFAULT_LIMIT
+
+    def __init__(self, data=(), **kwargs):
+        self._extra = None
+        self.update(data, **kwargs)
+
+    @classmethod
+    def with_limits(cls, limits):
+        """A CaseDraft subclass with some field caps (in bytes) overridden."""
+        merged = MappingProxyType({**cls.limits, **limits})
+        return type(cls.__name__, (cls,), {"__slots__": (), "limits": merged})
+
+    def __getitem__(self, key):
+        if key in _FIELD_SET:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        if isinstance(value, str):
+            truncate = truncate_lines if key in LINE_FIELDS else truncate_utf8
+            value = _CHOICES.get(value) or truncate(value, self.limits.get(key, self.default_limit))
+        if key in _FIELD_SET:
+            setattr(self, key, value)
+            return
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in _FIELD_SET:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+            return
+        if self._extra is None:
+            raise KeyError(key)
+        del self._extra[key]
+
+    def __iter__(self):
+        for field in CASE_FIELDS:
+            if hasattr(self, field):
+                yield field
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        if key in _FIELD_SET:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    def __copy__(self):
+        return type(self)(self)
+
+    def __deepcopy__(self, memo):
+        # case fields hold strings, so only the overflow dict needs a real deep copy
+        clone = self.__copy__()
+        if self._extra:
+            clone._extra = copy.deepcopy(self._extra, memo)
+        return clone
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)!r})"
+
+
+_FIELD_SET = frozenset(CASE_FIELDS)
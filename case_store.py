@@ -0,0 +1,419 @@
+import asyncio
+import threading
+import time
+
+from persistence import open_database
+from similarity import description_buckets, jaccard, shingles
+from validation import TOKEN_RE, normalize_identifier
+
+# One column per user_data key collected by the intake conversation, in question order
+CASE_FIELDS = (
+    "name", "email", "phone", "location", "incident_type", "incident_description",
+    "exchange", "crypto_type", "network", "wallet_addresses", "date_time", "amount_lost",
+    "how_occurred", "proof_ownership", "transaction_ids", "evidence", "police_report",
+    "other_services", "additional_info",
+)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS cases (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    chat_id INTEGER,
+    submitted_at REAL NOT NULL,
+    {", ".join(f"{field} TEXT NOT NULL DEFAULT ''" for field in CASE_FIELDS)},
+    -- amount_lost in USD (see amounts.py), NULL if it could not be worked out
+    amount_usd REAL,
+    -- when a reviewer claimed the case (with /claim, or by taking it off the triage queue)
+    triaged_at REAL,
+    -- the reviewer the case was routed to (see routing.py), when, and when they were done with it
+    reviewer_id INTEGER,
+    assigned_at REAL,
+    acked_at REAL
+);
+CREATE INDEX IF NOT EXISTS cases_email ON cases (email COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS cases_network ON cases (network COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS cases_submitted_at ON cases (submitted_at);
+
+-- wallet addresses and TXIDs, one row per value, so they can be looked up individually
+CREATE TABLE IF NOT EXISTS case_identifiers (
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    case_id INTEGER NOT NULL REFERENCES cases (id),
+    PRIMARY KEY (kind, value, case_id)
+) WITHOUT ROWID;
+
+-- photos and documents attached as evidence, stored by content hash (see evidence_store.py)
+CREATE TABLE IF NOT EXISTS case_files (
+    case_id INTEGER NOT NULL REFERENCES cases (id),
+    sha256 TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    file_name TEXT,
+    size INTEGER NOT NULL,
+    step TEXT,
+    PRIMARY KEY (case_id, sha256)
+) WITHOUT ROWID;
+
+-- MinHash LSH buckets of each incident description (see similarity.py)
+CREATE TABLE IF NOT EXISTS case_lsh (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    case_id INTEGER NOT NULL REFERENCES cases (id),
+    PRIMARY KEY (band, bucket, case_id)
+) WITHOUT ROWID;
+"""
+
+# bumped when an index needs to be rebuilt from the stored cases
+SCHEMA_VERSION = 2
+
+# descriptions at least this similar (Jaccard of their shingles) link two cases
+SIMILARITY_THRESHOLD = 0.5
+# an identifier shared by very many cases (an exchange hot wallet, say) only links the newest
+MAX_LINKS = 20
+
+WALLET = "wallet"
+TXID = "txid"
+
+# what flow.py stores for a skipped or declined wallet/TXID question
+_NO_IDENTIFIERS = frozenset(("not provided", "no"))
+
+
+def _shorten(value):
+    return value if len(value) <= 16 else f"{value[:8]}…{value[-6:]}"
+
+
+def _migrate(conn):
+    # databases created before amounts were normalized and cases were routed to reviewers
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(cases)")}
+    for column, kind in (("amount_usd", "REAL"), ("triaged_at", "REAL"), ("reviewer_id", "INTEGER"),
+                         ("assigned_at", "REAL"), ("acked_at", "REAL")):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE cases ADD COLUMN {column} {kind}")
+    if "triaged_at" not in columns:
+        # those cases went to the admin chat in full and were reviewed from there
+        with conn:
+            conn.execute("UPDATE cases SET triaged_at = submitted_at")
+    # only open cases are indexed: the reviewers' loads and the unclaimed-case sweep read nothing else
+    conn.execute("CREATE INDEX IF NOT EXISTS cases_open ON cases (reviewer_id) WHERE acked_at IS NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS cases_unclaimed ON cases (assigned_at) WHERE triaged_at IS NULL")
+
+
+def extract_identifiers(text):
+    """The address- and hash-shaped tokens of ``text``, in their lookup form.
+
+    Ordinary words (of a skipped answer, or a description typed in for an
+    "Other" network) are never identifiers, so they cannot link cases.
+    """
+    if not text or text.strip().lower() in _NO_IDENTIFIERS:
+        return []
+    return [normalize_identifier(match.group()) for match in TOKEN_RE.finditer(text)]
+
+
+class CaseStore:
+    """Indexed SQLite store of submitted cases.
+
+    Besides the lookups used by /find, every case is indexed so that cases that
+    share a wallet address or TXID, or have a near-identical incident description,
+    can be linked when a new one arrives (``linked_cases``).
+    """
+
+    def __init__(self, path):
+        self._conn = open_database(path)
+        self._conn.executescript(SCHEMA)
+        _migrate(self._conn)
+        self._lock = threading.Lock()
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            self._reindex()
+
+    def _reindex(self):
+        # databases created before descriptions were indexed, or when any word could be an identifier
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM case_lsh")
+            self._conn.execute("DELETE FROM case_identifiers")
+            rows = self._conn.execute(
+                "SELECT id, incident_description, wallet_addresses, transaction_ids FROM cases"
+            ).fetchall()
+            for case_id, description, wallets, txids in rows:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO case_identifiers (kind, value, case_id) VALUES (?, ?, ?)",
+                    [(WALLET, value, case_id) for value in extract_identifiers(wallets)]
+                    + [(TXID, value, case_id) for value in extract_identifiers(txids)],
+                )
+                _, buckets = description_buckets(description)
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO case_lsh (band, bucket, case_id) VALUES (?, ?, ?)",
+                    [(band, bucket, case_id) for band, bucket in buckets],
+                )
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def close(self):
+        self._conn.close()
+
+    # ---- writing -------------------------------------------------------
+
+    def insert_case(self, user_data, user_id=None, chat_id=None, submitted_at=None, amount_usd=None,
+                    reviewer_id=None, held=False):
+        """Store one submission, assigned to ``reviewer_id`` if given, and return its case id.
+
+        A ``held`` case (one waiting for the admin digest) is only counted as
+        assigned once ``assign_cases`` is called, so it is not swept meanwhile.
+        """
+        values = [str(user_data.get(field, "") or "") for field in CASE_FIELDS]
+        identifiers = [(WALLET, value) for value in extract_identifiers(user_data.get("wallet_addresses"))]
+        identifiers += [(TXID, value) for value in extract_identifiers(user_data.get("transaction_ids"))]
+        _, buckets = description_buckets(user_data.get("incident_description"))
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            submitted_at = submitted_at or time.time()
+            cursor = self._conn.execute(
+                "INSERT INTO cases (user_id, chat_id, submitted_at, amount_usd, reviewer_id, assigned_at, "
+                f"{', '.join(CASE_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?, {', '.join('?' for _ in CASE_FIELDS)})",
+                (user_id, chat_id, submitted_at, amount_usd, reviewer_id,
+                 submitted_at if reviewer_id is not None and not held else None, *values),
+            )
+            case_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO case_identifiers (kind, value, case_id) VALUES (?, ?, ?)",
+                [(kind, value, case_id) for kind, value in identifiers],
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO case_lsh (band, bucket, case_id) VALUES (?, ?, ?)",
+                [(band, bucket, case_id) for band, bucket in buckets],
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO case_files (case_id, sha256, kind, file_id, file_name, size, step) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (case_id, item["sha256"], item["kind"], item["file_id"], item.get("file_name"),
+                     item["size"], item.get("step"))
+                    for item in user_data.get("evidence_files") or ()
+                ],
+            )
+        return case_id
+
+    async def add_case(self, user_data, user_id=None, chat_id=None, amount_usd=None, reviewer_id=None,
+                       held=False):
+        return await asyncio.to_thread(
+            self.insert_case, dict(user_data), user_id, chat_id, None, amount_usd, reviewer_id, held
+        )
+
+    # Every state change below is a conditional UPDATE, so when several worker
+    # processes race for the same case exactly one of them wins.
+
+    def claim_case(self, case_id, reviewer_id=None):
+        """Mark case ``case_id`` as taken for review (by ``reviewer_id``); False if it already was."""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE cases SET triaged_at = ?, reviewer_id = COALESCE(?, reviewer_id), "
+                "assigned_at = COALESCE(assigned_at, ?) WHERE id = ? AND triaged_at IS NULL",
+                (now, reviewer_id, now, case_id),
+            )
+            return cursor.rowcount == 1
+
+    def assign_cases(self, case_ids):
+        """Start the claim timeout of the held cases ``case_ids`` that nobody claimed yet."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE cases SET assigned_at = ? WHERE id = ? AND assigned_at IS NULL AND triaged_at IS NULL",
+                [(now, case_id) for case_id in case_ids],
+            )
+
+    def ack_case(self, case_id, reviewer_id):
+        """Mark case ``case_id`` of ``reviewer_id`` as reviewed; False if it is not theirs or already was."""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE cases SET acked_at = ?, triaged_at = COALESCE(triaged_at, ?) "
+                "WHERE id = ? AND reviewer_id = ? AND acked_at IS NULL",
+                (now, now, case_id, reviewer_id),
+            )
+            return cursor.rowcount == 1
+
+    def reassign_case(self, case_id, previous_id, reviewer_id):
+        """Move unclaimed case ``case_id`` from ``previous_id`` to ``reviewer_id``; False if that changed meanwhile."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE cases SET reviewer_id = ?, assigned_at = ? "
+                "WHERE id = ? AND reviewer_id = ? AND triaged_at IS NULL",
+                (reviewer_id, time.time(), case_id, previous_id),
+            )
+            return cursor.rowcount == 1
+
+    # ---- reading -------------------------------------------------------
+
+    def _rows(self, sql, params):
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def get_case(self, case_id):
+        rows = self._rows("SELECT * FROM cases WHERE id = ?", (case_id,))
+        if not rows:
+            return None
+        rows[0]["evidence_files"] = self._rows(
+            "SELECT sha256, kind, file_id, file_name, size, step FROM case_files WHERE case_id = ?", (case_id,)
+        )
+        return rows[0]
+
+    def get_cases(self, case_ids):
+        """The cases with the given ids in id order, each with its number of evidence ``files``."""
+        case_ids = list(case_ids)
+        if not case_ids:
+            return []
+        return self._rows(
+            "SELECT cases.*, (SELECT COUNT(*) FROM case_files WHERE case_id = cases.id) AS files "
+            f"FROM cases WHERE id IN ({', '.join('?' for _ in case_ids)}) ORDER BY id",
+            case_ids,
+        )
+
+    def untriaged_cases(self, after_id=0):
+        """``(id, amount_usd)`` of the cases after ``after_id`` that nobody has taken for review yet."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, amount_usd FROM cases WHERE id > ? AND triaged_at IS NULL ORDER BY id", (after_id,)
+            ).fetchall()
+
+    def reviewer_loads(self):
+        """``{reviewer_id: number of open cases}`` for every reviewer with at least one."""
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT reviewer_id, COUNT(*) FROM cases "
+                "WHERE acked_at IS NULL AND reviewer_id IS NOT NULL GROUP BY reviewer_id"
+            ).fetchall())
+
+    def unclaimed_cases(self, assigned_before):
+        """``(id, reviewer_id)`` of the assigned cases nobody claimed since before ``assigned_before``."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, reviewer_id FROM cases "
+                "WHERE triaged_at IS NULL AND assigned_at < ? ORDER BY assigned_at",
+                (assigned_before,),
+            ).fetchall()
+
+    def find_cases(self, field, value, limit=20):
+        """Look cases up by ``email``, ``network``, ``wallet`` or ``txid``, newest first."""
+        if field in ("email", "network"):
+            return self._rows(
+                f"SELECT * FROM cases WHERE {field} = ? COLLATE NOCASE ORDER BY id DESC LIMIT ?",
+                (value.strip(), limit),
+            )
+        if field in (WALLET, TXID):
+            normalized = extract_identifiers(value)
+            if not normalized:
+                return []
+            return self._rows(
+                "SELECT cases.* FROM case_identifiers JOIN cases ON cases.id = case_identifiers.case_id "
+                "WHERE kind = ? AND value = ? ORDER BY cases.id DESC LIMIT ?",
+                (field, normalized[0], limit),
+            )
+        raise ValueError(f"Unknown search field: {field}")
+
+    def linked_cases(self, case_id):
+        """Other cases sharing a wallet/TXID with case ``case_id`` or describing a similar incident.
+
+        Returns ``[(other_id, [reason, ...]), ...]`` ordered by case id. Every step is
+        an index lookup, so the cost depends on the number of matches, not on the
+        number of stored cases.
+        """
+        case = self.get_case(case_id)
+        if case is None:
+            return []
+        shingle_set, buckets = description_buckets(case["incident_description"])
+        links = {}
+        candidates = []
+        with self._lock:
+            for kind, field in ((WALLET, "wallet_addresses"), (TXID, "transaction_ids")):
+                for value in dict.fromkeys(extract_identifiers(case[field])):
+                    rows = self._conn.execute(
+                        "SELECT case_id FROM case_identifiers WHERE kind = ? AND value = ? AND case_id != ? "
+                        "ORDER BY case_id DESC LIMIT ?",
+                        (kind, value, case_id, MAX_LINKS),
+                    ).fetchall()
+                    for (other_id,) in rows:
+                        links.setdefault(other_id, []).append(f"same {kind} {_shorten(value)}")
+            if buckets:
+                # CROSS JOIN keeps the probe list outermost, so each bucket is a primary key search
+                candidates = self._conn.execute(
+                    f"WITH probe (band, bucket) AS (VALUES {', '.join('(?, ?)' for _ in buckets)}) "
+                    "SELECT id, incident_description FROM cases WHERE id IN ("
+                    "  SELECT case_id FROM probe CROSS JOIN case_lsh"
+                    "  ON case_lsh.band = probe.band AND case_lsh.bucket = probe.bucket"
+                    "  WHERE case_id != ? GROUP BY case_id ORDER BY COUNT(*) DESC, case_id DESC LIMIT ?"
+                    ")",
+                    (*[value for pair in buckets for value in pair], case_id, MAX_LINKS * 2),
+                ).fetchall()
+        for other_id, description in candidates:
+            # LSH only proposes candidates; keep those that really are similar
+            similarity = jaccard(shingle_set, shingles(description))
+            if similarity >= SIMILARITY_THRESHOLD:
+                links.setdefault(other_id, []).append(f"similar description {similarity:.0%}")
+        return sorted(links.items())[-MAX_LINKS:]
+
+    def iter_cases(self, since=None, until=None, network=None, incident_type=None, batch_size=1000):
+        """Yield stored cases as dicts in id order, optionally filtered.
+
+        ``since``/``until`` are Unix timestamps bounding ``submitted_at`` (until is
+        exclusive); ``network`` and ``incident_type`` match case-insensitively.
+        Cases are read ``batch_size`` at a time, continuing after the last id seen,
+        so memory use does not depend on how many cases match and the lock is only
+        held while a batch is read.
+        """
+        conditions, params = ["id > ?"], []
+        if since is not None:
+            conditions.append("submitted_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("submitted_at < ?")
+            params.append(until)
+        if network:
+            conditions.append("network = ? COLLATE NOCASE")
+            params.append(network.strip())
+        if incident_type:
+            conditions.append("incident_type = ? COLLATE NOCASE")
+            params.append(incident_type.strip())
+        # NOT INDEXED: walk the id range rather than re-sorting the filter index for every batch
+        sql = f"SELECT * FROM cases NOT INDEXED WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?"
+        last_id = 0
+        while True:
+            rows = self._rows(sql, (last_id, *params, batch_size))
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1]["id"]
+
+    async def get(self, case_id):
+        return await asyncio.to_thread(self.get_case, case_id)
+
+    async def get_many(self, case_ids):
+        return await asyncio.to_thread(self.get_cases, case_ids)
+
+    async def untriaged(self, after_id=0):
+        return await asyncio.to_thread(self.untriaged_cases, after_id)
+
+    async def claim(self, case_id, reviewer_id=None):
+        return await asyncio.to_thread(self.claim_case, case_id, reviewer_id)
+
+    async def assign(self, case_ids):
+        return await asyncio.to_thread(self.assign_cases, list(case_ids))
+
+    async def ack(self, case_id, reviewer_id):
+        return await asyncio.to_thread(self.ack_case, case_id, reviewer_id)
+
+    async def reassign(self, case_id, previous_id, reviewer_id):
+        return await asyncio.to_thread(self.reassign_case, case_id, previous_id, reviewer_id)
+
+    async def loads(self):
+        return await asyncio.to_thread(self.reviewer_loads)
+
+    async def unclaimed(self, assigned_before):
+        return await asyncio.to_thread(self.unclaimed_cases, assigned_before)
+
+    async def find(self, field, value, limit=20):
+        return await asyncio.to_thread(self.find_cases, field, value, limit)
+
+    async def links(self, case_id):
+        return await asyncio.to_thread(self.linked_cases, case_id)
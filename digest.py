@@ -0,0 +1,170 @@
+import asyncio
+import io
+import threading
+import time
+
+from export import write_export
+from persistence import open_database
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS digest (
+    case_id INTEGER PRIMARY KEY,
+    links TEXT NOT NULL DEFAULT '',
+    added_at REAL NOT NULL
+);
+"""
+
+FORMATS = ("jsonl", "csv")
+# keeps each summary line, and so the summary, well inside Telegram's 4096 characters
+MAX_LINE = 90
+
+def is_urgent(user_data, amount_usd=None, min_amount=None, incident_types=()):
+    """Whether a case should skip the digest: a large loss or an incident type that can't wait."""
+    if user_data.get("incident_type") in incident_types:
+        return True
+    return bool(min_amount) and amount_usd is not None and amount_usd >= min_amount
+
+
+def _summary_line(case, links):
+    line = " · ".join(
+        value for value in (
+            f"#{case['id']}", case["incident_type"], case["network"], case["amount_lost"], case["name"],
+        ) if value
+    )
+    if len(line) > MAX_LINE:
+        line = line[:MAX_LINE - 1] + "…"
+    if case["files"]:
+        line += f" 📎{case['files']}"
+    if links:
+        line += " 🔗"
+    return line
+
+
+class AdminDigest:
+    """Batch new-case notifications into digests for the admin chat.
+
+    Instead of its own messages, a case is added to a buffer that is flushed
+    ``interval`` seconds after its oldest case arrived, or as soon as it holds
+    ``max_cases``, whichever comes first. A flush queues one job on the admin
+    queue: a summary message with one line per case and a JSONL or CSV document
+    with the full answers, so twenty cases cost two Bot API calls instead of forty
+    or more. Evidence files are not forwarded; /case <id> sends them on request.
+
+    The buffer is kept in a table next to the admin queue's spool, so cases added
+    before a restart are still sent.
+    """
+
+    def __init__(self, admin_queue, case_store, path, chat_id, interval=300, max_cases=20, fmt="jsonl"):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown digest format: {fmt}")
+        self.admin_queue = admin_queue
+        self.case_store = case_store
+        self.chat_id = chat_id
+        self.interval = interval
+        self.max_cases = max_cases
+        self.fmt = fmt
+        self._conn = open_database(path)
+        self._conn.executescript(SCHEMA)
+        self._db_lock = threading.Lock()
+        # case id -> (links line, time added), oldest first
+        self._pending = {}
+        self._added = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def start(self):
+        for case_id, links, added_at in self._conn.execute(
+            "SELECT case_id, links, added_at FROM digest ORDER BY case_id"
+        ).fetchall():
+            self._pending[case_id] = (links, added_at)
+        if self._pending:
+            print(f"📬 Resuming a digest of {len(self._pending)} case(s)")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the timer. Buffered cases stay in the table for the next start."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._conn.close()
+
+    def _execute(self, sql, params):
+        with self._db_lock, self._conn:
+            self._conn.execute(sql, params)
+
+    async def add(self, case_id, links=""):
+        """Buffer case ``case_id``; ``links`` is its "linked to" line, if any."""
+        added_at = time.time()
+        await asyncio.to_thread(
+            self._execute, "INSERT OR IGNORE INTO digest (case_id, links, added_at) VALUES (?, ?, ?)",
+            (case_id, links, added_at),
+        )
+        self._pending[case_id] = (links, added_at)
+        self._added.set()
+        if len(self._pending) >= self.max_cases:
+            await self.flush(full_only=True)
+
+    async def flush(self, full_only=False):
+        """Queue digests for the buffered cases, ``max_cases`` per digest.
+
+        With ``full_only`` a remainder smaller than ``max_cases`` (say, cases that
+        arrived during the flush) is left for the timer.
+        """
+        async with self._flush_lock:
+            while len(self._pending) >= (self.max_cases if full_only else 1):
+                batch = list(self._pending)[:self.max_cases]
+                await self._send(batch)
+                # queued before it is forgotten: a crash in between sends the cases twice, never zero times
+                await asyncio.to_thread(
+                    self._execute, f"DELETE FROM digest WHERE case_id IN ({', '.join('?' for _ in batch)})", batch
+                )
+                for case_id in batch:
+                    del self._pending[case_id]
+
+    async def _send(self, batch):
+        cases = await self.case_store.get_many(batch)
+        if not cases:
+            return
+        lines = [_summary_line(case, self._pending[case["id"]][0]) for case in cases]
+        first, last = cases[0]["id"], cases[-1]["id"]
+        summary = (
+            f"📬 CASE DIGEST: {len(cases)} new case(s), #{first}–#{last}\n\n"
+            + "\n".join(lines)
+            + "\n\n📎 = evidence files, 🔗 = linked to earlier cases\n"
+            "Full answers are in the attached file; /case <id> shows a case with its files.\n"
+            "👉 /claim <id> to take a case, /done <id> once reviewed"
+        )
+        buffer = io.StringIO()
+        write_export(cases, self.fmt, buffer)
+        await self.admin_queue.enqueue(self.chat_id, [
+            summary,
+            {
+                "method": "send_document",
+                "attachment": {"filename": f"cases-{first}-{last}.{self.fmt}", "content": buffer.getvalue()},
+                "caption": f"📬 Cases #{first}–#{last}",
+            },
+        ])
+        # the claim timeout runs from now, when the admin can first see the cases
+        await self.case_store.assign(case["id"] for case in cases)
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                self._added.clear()
+                await self._added.wait()
+                continue
+            oldest = next(iter(self._pending.values()))[1]
+            delay = oldest + self.interval - time.time()
+            if delay > 0:
+                # a flush for max_cases may empty the buffer meanwhile; the loop then starts over
+                await asyncio.sleep(delay)
+                continue
+            try:
+                await self.flush()
+            except Exception as exc:
+                print(f"Admin digest failed ({exc!r}); retrying in {self.interval:.0f}s")
+                await asyncio.sleep(self.interval)
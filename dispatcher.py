@@ -0,0 +1,128 @@
+import asyncio
+import hmac
+import json
+
+import httpx
+
+from hash_ring import HashRing
+from http_server import Response
+from webhook import SECRET_HEADER
+
+
+def shard_key(data):
+    """The chat an update belongs to (falls back to the sender, then the update id)."""
+    for field in ("message", "edited_message", "callback_query", "my_chat_member", "chat_member"):
+        item = data.get(field)
+        if not isinstance(item, dict):
+            continue
+        chat = item.get("chat") or (item.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        if item.get("from"):
+            return item["from"]["id"]
+    return data.get("update_id", 0)
+
+
+class Dispatcher:
+    """Front webhook endpoint that shards updates across worker processes by chat id.
+
+    Workers are the URLs of their internal webhook endpoints (see webhook.py). A
+    worker that fails a forward is taken off the ring and its updates go to the
+    next worker on the ring; a background health check puts it back once it
+    answers again. Because all workers share persistence, a chat that moves to
+    another worker continues where it left off.
+    """
+
+    def __init__(self, workers, url_path, secret_token=None, worker_secret=None, health_interval=2.0):
+        self.workers = list(workers)
+        self.url_path = url_path
+        self.secret_token = secret_token
+        self.worker_secret = worker_secret
+        self.health_interval = health_interval
+        self.ring = HashRing(self.workers)
+        self._client = None
+        self._health_task = None
+
+    async def start(self):
+        self._client = httpx.AsyncClient(timeout=10)
+        self._health_task = asyncio.create_task(self._health_loop())
+
+    async def stop(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+
+    def mark_down(self, worker):
+        if worker in self.ring:
+            print(f"⚠️ Worker {worker} is down, resharding its chats")
+            self.ring.remove(worker)
+
+    def mark_up(self, worker):
+        if worker not in self.ring:
+            print(f"✅ Worker {worker} is up")
+            self.ring.add(worker)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            for worker in self.workers:
+                if worker in self.ring:
+                    continue
+                try:
+                    response = await self._client.get(worker.rsplit("/", 1)[0] + "/healthz", timeout=1)
+                except httpx.HTTPError:
+                    continue
+                if response.status_code == 200:
+                    self.mark_up(worker)
+
+    async def _forward(self, worker, updates):
+        headers = {SECRET_HEADER: self.worker_secret} if self.worker_secret else {}
+        try:
+            response = await self._client.post(worker, json=updates, headers=headers)
+        except httpx.HTTPError:
+            return False
+        return response.status_code == 200
+
+    async def dispatch(self, updates):
+        """Forward ``updates`` to their workers; returns False if some could not be delivered."""
+        pending = updates
+        for _ in range(len(self.workers)):
+            batches = {}
+            for update in pending:
+                worker = self.ring.get(shard_key(update))
+                if worker is None:
+                    return False
+                batches.setdefault(worker, []).append(update)
+            workers = list(batches)
+            results = await asyncio.gather(*(self._forward(worker, batches[worker]) for worker in workers))
+            pending = []
+            for worker, delivered in zip(workers, results):
+                if not delivered:
+                    self.mark_down(worker)
+                    pending.extend(batches[worker])
+            if not pending:
+                return True
+        return False
+
+    async def handle(self, request):
+        if request.path == "/healthz":
+            return Response(200 if len(self.ring) else 503, b"ok" if len(self.ring) else b"no workers")
+        if request.path != self.url_path:
+            return Response(404, b"not found")
+        if request.method != "POST":
+            return Response(405, b"method not allowed")
+        if self.secret_token and not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, ""), self.secret_token
+        ):
+            return Response(403, b"forbidden")
+        try:
+            payload = json.loads(request.body)
+        except ValueError:
+            return Response(400, b"invalid json")
+        updates = payload if isinstance(payload, list) else [payload]
+        # a non-200 answer makes Telegram redeliver the update later
+        if await self.dispatch(updates):
+            return Response(200, b"ok")
+        return Response(503, b"no worker available")
@@ -0,0 +1,71 @@
+import asyncio
+import hashlib
+import os
+import secrets
+
+import httpx
+
+# The Bot API refuses to hand out files over 20 MB anyway
+MAX_FILE_SIZE = 20 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+class FileTooLarge(Exception):
+    pass
+
+
+class EvidenceStore:
+    """Content-addressed storage for files users send as evidence.
+
+    Files are streamed from the Bot API in chunks into a temporary file while
+    they are hashed, then moved to ``<root>/<sha256[:2]>/<sha256>``. A file that
+    is already stored (the same screenshot sent twice, or by two users) is kept
+    only once. At most ``max_concurrent`` downloads run at a time.
+    """
+
+    def __init__(self, root, max_concurrent=4, max_size=MAX_FILE_SIZE):
+        self.root = root
+        self.max_size = max_size
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._client = None
+        os.makedirs(os.path.join(root, "tmp"), exist_ok=True)
+
+    async def start(self):
+        self._client = httpx.AsyncClient(timeout=httpx.Timeout(30, read=60))
+
+    async def stop(self):
+        if self._client is not None:
+            await self._client.aclose()
+
+    def path(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    async def save(self, url):
+        """Download ``url`` into the store and return ``(sha256, size)``."""
+        async with self._slots:
+            temp_path = os.path.join(self.root, "tmp", secrets.token_hex(8))
+            digest = hashlib.sha256()
+            size = 0
+            try:
+                with open(temp_path, "wb") as file:
+                    async with self._client.stream("GET", url) as response:
+                        response.raise_for_status()
+                        async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                            size += len(chunk)
+                            if size > self.max_size:
+                                raise FileTooLarge(f"file is larger than {self.max_size} bytes")
+                            digest.update(chunk)
+                            await asyncio.to_thread(file.write, chunk)
+                sha256 = digest.hexdigest()
+                await asyncio.to_thread(self._commit, temp_path, sha256)
+            finally:
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+            return sha256, size
+
+    def _commit(self, temp_path, sha256):
+        target = self.path(sha256)
+        if os.path.exists(target):
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(temp_path, target)
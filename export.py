@@ -0,0 +1,258 @@
+"""Streaming export of stored cases to CSV, JSONL or Parquet.
+
+Used by the admin /export command and as a command line tool:
+
+    python export.py --format csv --since 2024-01-01 --until 2024-03-31 --network TRON -o cases.csv
+
+Cases are read from the case store in batches and written one row at a time
+(Parquet: one row group at a time), so exporting a million cases takes as
+little memory as exporting ten. Parquet needs ``pyarrow``, which is optional.
+"""
+import argparse
+import csv
+import datetime
+import functools
+import importlib.util
+import json
+import os
+import sys
+
+from case_store import CASE_FIELDS, CaseStore
+
+FORMATS = ("csv", "jsonl", "parquet")
+COLUMNS = ("id", "submitted_at", "user_id", "chat_id") + CASE_FIELDS + ("amount_usd",)
+FILTER_KEYS = {"from": "since", "to": "until", "network": "network", "type": "incident_type"}
+
+# Bots can upload documents of up to 50 MB
+MAX_PART_BYTES = 45 * 1024 * 1024
+PARQUET_ROW_GROUP = 4096
+# pyarrow is optional and takes a while to import, so it is only loaded for a Parquet export
+HAVE_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+@functools.cache
+def _parquet_schema():
+    import pyarrow
+
+    return pyarrow.schema(
+        [("id", pyarrow.int64()), ("submitted_at", pyarrow.timestamp("ms", tz="UTC")),
+         ("user_id", pyarrow.int64()), ("chat_id", pyarrow.int64())]
+        + [(field, pyarrow.string()) for field in CASE_FIELDS]
+        + [("amount_usd", pyarrow.float64())]
+    )
+
+
+def _isoformat(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat(timespec="seconds")
+
+
+def parse_date(text, end=False):
+    """Unix timestamp of the start of UTC day ``text`` (YYYY-MM-DD), or of the next day if ``end``."""
+    try:
+        day = datetime.datetime.strptime(text.strip(), "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
+    except ValueError:
+        raise ValueError(f"Invalid date: {text!r} (expected YYYY-MM-DD)") from None
+    if end:
+        # the end date is inclusive
+        day += datetime.timedelta(days=1)
+    return day.timestamp()
+
+
+def parse_export_args(args):
+    """Parse ``/export`` arguments into ``(format, iter_cases keyword arguments)``.
+
+    ``args`` look like ``["csv", "from:2024-01-01", "type:Fraudulent", "Investment"]``;
+    words without a known ``key:`` prefix continue the previous value.
+    """
+    if not args or args[0].lower() not in FORMATS:
+        raise ValueError(f"Choose a format: {', '.join(FORMATS)}")
+    fmt = args[0].lower()
+    values = {}
+    key = None
+    for word in args[1:]:
+        name, sep, value = word.partition(":")
+        if sep and name.lower() in FILTER_KEYS:
+            key = FILTER_KEYS[name.lower()]
+            values[key] = value
+        elif key is not None:
+            values[key] += " " + word
+        else:
+            raise ValueError(f"Unknown filter: {word!r}")
+    criteria = {}
+    for key, value in values.items():
+        if not value.strip():
+            raise ValueError("Filters need a value, e.g. network:TRON")
+        if key in ("since", "until"):
+            criteria[key] = parse_date(value, end=key == "until")
+        else:
+            criteria[key] = value.strip()
+    if fmt == "parquet" and not HAVE_PYARROW:
+        raise ValueError("Parquet export needs pyarrow installed (pip install pyarrow)")
+    return fmt, criteria
+
+
+class CsvWriter:
+    def __init__(self, file):
+        self._file = file
+        self._writer = csv.writer(file)
+        self._writer.writerow(COLUMNS)
+
+    def write(self, row):
+        self._writer.writerow([
+            _isoformat(row[column]) if column == "submitted_at" else row[column] for column in COLUMNS
+        ])
+
+    @property
+    def size(self):
+        return self._file.tell()
+
+    def close(self):
+        self._file.flush()
+
+
+class JsonlWriter:
+    def __init__(self, file):
+        self._file = file
+
+    def write(self, row):
+        record = {column: row[column] for column in COLUMNS}
+        record["submitted_at"] = _isoformat(record["submitted_at"])
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    @property
+    def size(self):
+        return self._file.tell()
+
+    def close(self):
+        self._file.flush()
+
+
+class ParquetWriter:
+    """Buffers up to ``PARQUET_ROW_GROUP`` rows and writes them as one row group."""
+
+    def __init__(self, file):
+        import pyarrow.parquet
+
+        self._file = file
+        self._from_pydict = pyarrow.Table.from_pydict
+        self._writer = pyarrow.parquet.ParquetWriter(file, _parquet_schema(), compression="zstd")
+        self._columns = {column: [] for column in COLUMNS}
+        self._rows = 0
+        self._pending_bytes = 0
+
+    def write(self, row):
+        for column in COLUMNS:
+            self._columns[column].append(row[column])
+        self._columns["submitted_at"][-1] = int(row["submitted_at"] * 1000)
+        self._rows += 1
+        self._pending_bytes += sum(len(row[field]) for field in CASE_FIELDS)
+        if self._rows >= PARQUET_ROW_GROUP:
+            self._flush()
+
+    def _flush(self):
+        if self._rows:
+            self._writer.write_table(self._from_pydict(self._columns, schema=_parquet_schema()))
+            for values in self._columns.values():
+                values.clear()
+            self._rows = self._pending_bytes = 0
+
+    @property
+    def size(self):
+        # buffered rows are counted uncompressed, so parts come out a little small rather than too big
+        return self._file.tell() + self._pending_bytes
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+WRITERS = {"csv": CsvWriter, "jsonl": JsonlWriter, "parquet": ParquetWriter}
+
+
+def _open(fmt, path):
+    if fmt == "parquet":
+        return open(path, "wb")
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def write_export(rows, fmt, file):
+    """Write every row of ``rows`` to the open ``file`` and return how many there were."""
+    writer = WRITERS[fmt](file)
+    count = 0
+    for row in rows:
+        writer.write(row)
+        count += 1
+    writer.close()
+    return count
+
+
+def export_parts(rows, fmt, directory, max_bytes=MAX_PART_BYTES, prefix="cases"):
+    """Write ``rows`` into files of about ``max_bytes`` each in ``directory``.
+
+    A generator: every part is yielded as ``(path, row count)`` as soon as it is
+    complete, so the caller can send and delete it before the next one is written.
+    """
+    part = 0
+    file = writer = None
+    count = 0
+    try:
+        for row in rows:
+            if writer is None:
+                part += 1
+                path = os.path.join(directory, f"{prefix}-{part:03d}.{fmt}")
+                file = _open(fmt, path)
+                writer = WRITERS[fmt](file)
+                count = 0
+            writer.write(row)
+            count += 1
+            if writer.size >= max_bytes:
+                writer.close()
+                file.close()
+                file = writer = None
+                yield path, count
+        if writer is not None:
+            writer.close()
+            file.close()
+            file = writer = None
+            yield path, count
+    finally:
+        if file is not None:
+            file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export stored cases as CSV, JSONL or Parquet.")
+    parser.add_argument("--db", default=os.getenv("CASE_STORE_PATH", "cases.sqlite3"), help="case store database")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--since", help="first submission day to include (YYYY-MM-DD, UTC)")
+    parser.add_argument("--until", help="last submission day to include (YYYY-MM-DD, UTC)")
+    parser.add_argument("--network")
+    parser.add_argument("--incident-type")
+    parser.add_argument("-o", "--output", default="-", help="output file, - for stdout (CSV/JSONL only)")
+    args = parser.parse_args()
+
+    if args.format == "parquet" and not HAVE_PYARROW:
+        parser.error("Parquet export needs pyarrow installed (pip install pyarrow)")
+    if args.format == "parquet" and args.output == "-":
+        parser.error("Parquet can't be written to stdout; pass --output")
+    try:
+        since = parse_date(args.since) if args.since else None
+        until = parse_date(args.until, end=True) if args.until else None
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    store = CaseStore(args.db)
+    rows = store.iter_cases(since=since, until=until, network=args.network, incident_type=args.incident_type)
+    try:
+        if args.output == "-":
+            count = write_export(rows, args.format, sys.stdout)
+        else:
+            with _open(args.format, args.output) as file:
+                count = write_export(rows, args.format, file)
+    finally:
+        store.close()
+    print(f"Exported {count} case(s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Local stand-in for the Telegram Bot API.
+
+Point the bot at it with ``BOT_API_BASE_URL=http://127.0.0.1:8081/bot`` and any
+token. Every outgoing call is recorded in ``FakeBotAPI.calls`` so a driver can
+assert on what the bot sent; updates queued with ``push_update`` are handed out
+through ``getUpdates`` for polling mode. Files registered with ``add_file`` can
+be fetched through ``getFile`` and downloaded like real Bot API files.
+"""
+import argparse
+import asyncio
+import collections
+import email.parser
+import email.policy
+import itertools
+import json
+import time
+from urllib.parse import parse_qsl
+
+from http_server import Response, start_server
+
+
+def _message_update(update_id, chat_id, user_id, **content):
+    user_id = chat_id if user_id is None else user_id
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+            **content,
+        },
+    }
+
+
+def make_text_update(update_id, chat_id, text, user_id=None):
+    """Build the JSON for a private-chat text message update."""
+    entities = (
+        {"entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]}
+        if text.startswith("/")
+        else {}
+    )
+    return _message_update(update_id, chat_id, user_id, text=text, **entities)
+
+
+def make_photo_update(update_id, chat_id, file_id, size, user_id=None):
+    """Build the JSON for a photo message (one size) with file ``file_id``."""
+    photo = {"file_id": file_id, "file_unique_id": file_id, "width": 800, "height": 600, "file_size": size}
+    return _message_update(update_id, chat_id, user_id, photo=[photo])
+
+
+def make_document_update(update_id, chat_id, file_id, size, file_name="file.pdf", user_id=None):
+    """Build the JSON for a document message with file ``file_id``."""
+    document = {"file_id": file_id, "file_unique_id": file_id, "file_name": file_name, "file_size": size}
+    return _message_update(update_id, chat_id, user_id, document=document)
+
+
+def _parse_params(request):
+    """Decode Bot API parameters the way PTB encodes them (urlencoded or multipart)."""
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + request.body
+        )
+        params = {}
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if part.get_filename():
+                params[name] = {"filename": part.get_filename(), "size": len(part.get_content())}
+            else:
+                params[name] = part.get_content()
+        raw = params
+    elif content_type.startswith("application/json"):
+        return json.loads(request.body or b"{}")
+    else:
+        raw = dict(parse_qsl(request.body.decode()))
+    params = {}
+    for name, value in raw.items():
+        try:
+            params[name] = json.loads(value) if isinstance(value, str) else value
+        except ValueError:
+            params[name] = value
+    return params
+
+
+class FakeBotAPI:
+    """Minimal Bot API implementation that records calls and answers with plausible objects."""
+
+    def __init__(self, latency=0.0, record=True):
+        self.latency = latency
+        # load tests turn recording off so the call log doesn't grow without bound
+        self.record = record
+        self.calls = []
+        self.updates = asyncio.Queue()
+        self._inboxes = collections.defaultdict(asyncio.Queue)
+        self._message_ids = itertools.count(1)
+        # file_id -> content
+        self.files = {}
+        self._server = None
+
+    def add_file(self, content, file_id=None):
+        """Register ``content`` as a downloadable file and return its file_id."""
+        file_id = file_id or f"file{len(self.files) + 1}"
+        self.files[file_id] = content
+        return file_id
+
+    def push_update(self, update):
+        self.updates.put_nowait(update)
+
+    def sent_messages(self, chat_id=None):
+        return [
+            params for method, params in self.calls
+            if method == "sendMessage" and (chat_id is None or params.get("chat_id") == chat_id)
+        ]
+
+    async def next_message(self, chat_id, timeout=30):
+        """Wait for the next message the bot sends to ``chat_id`` and return its parameters."""
+        return await asyncio.wait_for(self._inboxes[chat_id].get(), timeout)
+
+    def _message(self, params, **extra):
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": params.get("chat_id", 0), "type": "private"},
+            **extra,
+        }
+
+    async def _get_updates(self, params):
+        timeout = float(params.get("timeout", 0) or 0)
+        try:
+            first = await asyncio.wait_for(self.updates.get(), timeout=max(timeout, 0.01))
+        except asyncio.TimeoutError:
+            return []
+        result = [first]
+        while not self.updates.empty() and len(result) < int(params.get("limit", 100)):
+            result.append(self.updates.get_nowait())
+        return result
+
+    async def _call(self, method, params):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot",
+                    "can_join_groups": False, "can_read_all_group_messages": False,
+                    "supports_inline_queries": False}
+        if method == "getUpdates":
+            return await self._get_updates(params)
+        if method == "sendMessage":
+            self._inboxes[params.get("chat_id")].put_nowait(params)
+            return self._message(params, text=params.get("text", ""))
+        if method == "getFile":
+            file_id = params.get("file_id")
+            return {"file_id": file_id, "file_unique_id": file_id,
+                    "file_size": len(self.files.get(file_id, b"")), "file_path": f"files/{file_id}"}
+        if method == "sendPhoto":
+            return self._message(params, photo=[{"file_id": "photo", "file_unique_id": "photo",
+                                                 "width": 1, "height": 1}])
+        if method == "sendDocument":
+            return self._message(params, document={"file_id": "doc", "file_unique_id": "doc"})
+        if method == "sendMediaGroup":
+            return [self._message(params) for _ in params.get("media", [])]
+        return True
+
+    async def handle(self, request):
+        _, _, method = request.path.rpartition("/")
+        if request.path.startswith("/file/"):
+            # /file/bot<token>/files/<file_id>
+            if method not in self.files:
+                return Response(404, b"not found")
+            return Response(200, self.files[method], "application/octet-stream")
+        params = _parse_params(request)
+        if self.record:
+            self.calls.append((method, params))
+        if self.latency and method != "getUpdates":
+            await asyncio.sleep(self.latency)
+        result = await self._call(method, params)
+        body = json.dumps({"ok": True, "result": result}).encode()
+        return Response(200, body, "application/json")
+
+    async def start(self, host="127.0.0.1", port=0):
+        self._server = await start_server(self.handle, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+
+async def _serve(host, port, latency):
+    api = FakeBotAPI(latency=latency)
+    port = await api.start(host, port)
+    print(f"Fake Bot API listening on http://{host}:{port}/bot")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the Telegram Bot API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every call")
+    args = parser.parse_args()
+    asyncio.run(_serve(args.host, args.port, args.latency))
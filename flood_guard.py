@@ -0,0 +1,73 @@
+import collections
+import time
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop
+
+from metrics import record_throttled
+from ratelimit import TokenBucket
+
+# A full bucket is no different from a missing one, so buckets idle this long are dropped
+# lazily; at most this many are looked at per update to keep each check O(1)
+EVICT_PER_UPDATE = 2
+
+
+class FloodGuard:
+    """Drop updates from chats that send more than ``rate`` updates per second.
+
+    Registered as a TypeHandler in a group that runs before every other handler:
+    each chat has a token bucket of ``burst`` tokens refilling at ``rate`` per
+    second, and an update arriving when its chat's bucket is empty is counted and
+    dropped without a reply (raising ApplicationHandlerStop skips the remaining
+    groups), so a flooding user costs neither handler time nor Bot API calls.
+
+    Buckets are kept in an OrderedDict in order of use. Those idle long enough to
+    have refilled completely are evicted from the front as later updates come in,
+    and at most ``max_chats`` buckets are kept at all.
+    """
+
+    def __init__(self, rate, burst, exempt=(), max_chats=100_000):
+        self.rate = rate
+        self.burst = burst
+        self.exempt = frozenset(exempt)
+        self.max_chats = max_chats
+        self.idle_after = burst / rate
+        self.throttled = 0
+        # chat id -> TokenBucket, least recently used first
+        self._buckets = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def allow(self, chat_id, now=None):
+        """Take a token for ``chat_id``; False if the chat is over its rate."""
+        now = time.monotonic() if now is None else now
+        buckets = self._buckets
+        for _ in range(EVICT_PER_UPDATE):
+            if not buckets:
+                break
+            oldest = next(iter(buckets.values()))
+            if now - oldest.updated < self.idle_after and len(buckets) < self.max_chats:
+                break
+            buckets.popitem(last=False)
+        bucket = buckets.get(chat_id)
+        if bucket is None:
+            bucket = buckets[chat_id] = TokenBucket(self.rate, self.burst)
+            bucket.updated = now
+        else:
+            buckets.move_to_end(chat_id)
+        if bucket.try_acquire(now):
+            return True
+        self.throttled += 1
+        return False
+
+    async def check(self, update, context):
+        """TypeHandler callback; stops handling of the update if its chat is flooding."""
+        if not isinstance(update, Update) or update.effective_chat is None:
+            return
+        user = update.effective_user
+        if user is not None and user.id in self.exempt:
+            return
+        if not self.allow(update.effective_chat.id):
+            record_throttled(update)
+            raise ApplicationHandlerStop
@@ -0,0 +1,386 @@
+"""Declarative definition of the intake conversation.
+
+Every state of the ConversationHandler is described by a ``Step``: the question
+asked when the user enters it, the keyboard offered, which ``user_data`` key the
+answer is stored under, how it is validated and where the conversation goes
+next. ``Flow`` compiles the table once at startup (keyboards included) and
+``Flow.advance`` is the single, Telegram-free dispatcher used for every state.
+"""
+from dataclasses import dataclass, field
+from types import MappingProxyType
+
+from telegram import ReplyKeyboardMarkup, ReplyKeyboardRemove
+from telegram.ext import ConversationHandler
+
+from validation import NETWORK_KINDS, is_valid_email, parse_addresses, parse_txids
+
+# Define states - expanded to match PDF questions, added POLICE_CASE
+(
+    NAME, EMAIL, PHONE, LOCATION, INCIDENT_TYPE, INCIDENT_DESCRIPTION,
+    EXCHANGE, CRYPTO_TYPE, CRYPTO_TYPE_OTHER, NETWORK, NETWORK_OTHER,
+    WALLET_ADDRESSES, DATE_TIME, AMOUNT_LOST, HOW_OCCURRED, HOW_OCCURRED_OTHER,
+    PROOF_OWNERSHIP, TRANSACTION_IDS, EVIDENCE, POLICE_REPORT, POLICE_CASE,
+    OTHER_SERVICES, ADDITIONAL_INFO
+) = range(23)
+
+END = ConversationHandler.END
+
+STATE_NAMES = MappingProxyType({
+    value: name for name, value in globals().items()
+    if name.isupper() and isinstance(value, int) and 0 <= value < 23
+})
+
+YES_NO = (('Yes', 'No'),)
+INCIDENT_TYPES = (
+    ('Scam', 'Hacked Wallet'),
+    ('Fraudulent Investment', 'Lost Access'),
+    ('Other',),
+)
+CRYPTO_TYPES = (
+    ('BTC', 'ETH', 'USDT'),
+    ('BNB', 'SOL', 'Other'),
+)
+NETWORKS = (
+    ('Ethereum', 'TRON'),
+    ('Binance Smart Chain', 'Bitcoin'),
+    ('Polygon', 'Avalanche'),
+    ('Other',),
+)
+LOSS_CAUSES = (
+    ('Phishing link', 'Fake investment platform'),
+    ('Rug pull', 'Fake wallet app'),
+    ('Social engineering', 'Unauthorized transfer'),
+    ('KYC', 'Other'),
+)
+
+
+def keyboard(rows):
+    """Build the one-time reply keyboard used throughout the bot."""
+    return ReplyKeyboardMarkup(rows, one_time_keyboard=True, resize_keyboard=True)
+
+
+REMOVE_KEYBOARD = ReplyKeyboardRemove()
+
+
+class Reprompt(Exception):
+    """Raised by a validator to reply with ``message`` and stay in the current state.
+
+    ``rejected`` is False for a follow-up question that accepts the answer.
+    """
+
+    def __init__(self, message, remove_keyboard=False, rejected=True):
+        super().__init__(message)
+        self.message = message
+        self.remove_keyboard = remove_keyboard
+        self.rejected = rejected
+
+
+@dataclass(frozen=True)
+class Step:
+    prompt: str
+    key: str = None
+    next: int = END
+    choices: tuple = ()
+    # lowercased answer -> state to jump to without storing the answer
+    branches: dict = field(default_factory=dict)
+    # validate(text, user_data) -> value to store; raises Reprompt to ask again
+    validate: object = None
+    # free-text questions clear any keyboard still shown unless told otherwise
+    remove_keyboard: bool = True
+    # the answer completes the case (the caller submits it)
+    completes: bool = False
+    # photos and documents sent in this state are kept as evidence
+    attachments: bool = False
+
+
+@dataclass(frozen=True)
+class Transition:
+    state: int
+    text: str = None
+    reply_markup: object = None
+    completes: bool = False
+    # the answer was invalid and the question is asked again
+    rejected: bool = False
+
+
+# ---- validators ----------------------------------------------------------------
+
+def validate_name(text, user_data):
+    if len(text) < 3:
+        raise Reprompt(
+            "⚠️ Please enter a valid name (at least 3 characters long).\n"
+            "What is your full name?"
+        )
+    return text
+
+
+def validate_email(text, user_data):
+    if not is_valid_email(text):
+        raise Reprompt(
+            "⚠️ Please enter a valid email address.\n"
+            "For example: name@example.com"
+        )
+    return text
+
+
+def validate_phone(text, user_data):
+    if text.lower() == 'skip':
+        return "Not provided"
+    # Check if the input contains only numbers, +, and -
+    phone = text.strip()
+    if not all(char.isdigit() or char in '+-' for char in phone):
+        raise Reprompt(
+            "⚠️ Please enter a valid phone number containing only numbers and +/- symbols.\n"
+            "Or type 'Skip' to continue without providing a phone number."
+        )
+    return phone
+
+
+def validate_exchange(text, user_data):
+    return "Not applicable" if text.lower() == 'skip' else text
+
+
+def validate_wallet_addresses(text, user_data):
+    network = user_data.get("network", "")
+    if text.strip().lower() == 'skip':
+        return "Not provided"
+    if network not in NETWORK_KINDS:
+        # networks typed in via 'Other' can't be validated
+        return text
+    result = parse_addresses(text, network)
+    if result.invalid or not result.valid:
+        problem = (
+            "⚠️ These don't look like valid " + network + " addresses:\n" + "\n".join(result.invalid)
+            if result.invalid else
+            "⚠️ No " + network + " address found in your message."
+        )
+        raise Reprompt(
+            problem + "\n\n"
+            "Please check for typos and send the address(es) again, one per line.\n"
+            "Or type 'Skip' if you don't have them."
+        )
+    return "\n".join(result.valid)
+
+
+def validate_transaction_ids(text, user_data):
+    network = user_data.get("network", "")
+    answer = text.strip().lower()
+    if answer == 'yes':
+        raise Reprompt("Please paste the transaction ID(s), one per line:", remove_keyboard=True, rejected=False)
+    if answer == 'no':
+        return "No"
+    if network not in NETWORK_KINDS:
+        return text
+    result = parse_txids(text, network)
+    if result.invalid or not result.valid:
+        problem = (
+            "⚠️ These don't look like valid " + network + " transaction IDs:\n" + "\n".join(result.invalid)
+            if result.invalid else
+            "⚠️ No transaction ID found in your message."
+        )
+        raise Reprompt(
+            problem + "\n\n"
+            "Please check for typos and send the transaction ID(s) again, one per line.\n"
+            "Or type 'No' if you don't have them."
+        )
+    return "\n".join(result.valid)
+
+
+def police_report_declined(text, user_data):
+    # treat anything other than 'yes' as 'no'
+    return "No"
+
+
+def strip_answer(text, user_data):
+    return text.strip()
+
+
+# ---- the intake questionnaire ----------------------------------------------------
+
+STEPS = {
+    NAME: Step(
+        "📋 Section A – Basic Contact Information\n\n"
+        "1. Please enter your Full Name (for official records):",
+        key="name", next=EMAIL, validate=validate_name,
+        # the welcome keyboard's button shows the first question
+        branches={'start recovery process': NAME},
+    ),
+    EMAIL: Step(
+        "2. Please enter your Email Address (for investigation updates):\n"
+        "Make sure to enter a valid email address where we can contact you.",
+        key="email", next=PHONE, validate=validate_email,
+        remove_keyboard=False,
+    ),
+    PHONE: Step(
+        "3. Please enter your Phone / WhatsApp number (optional):\n"
+        "You can type 'Skip' if you don't want to provide this.",
+        key="phone", next=LOCATION, validate=validate_phone,
+        remove_keyboard=False,
+    ),
+    LOCATION: Step(
+        "4. Please enter your Location / Country:\n"
+        "This helps determine jurisdiction & applicable laws.",
+        key="location", next=INCIDENT_TYPE,
+        remove_keyboard=False,
+    ),
+    INCIDENT_TYPE: Step(
+        "📋 Section B – Incident Overview\n\n"
+        "5. What happened? Please choose one:",
+        key="incident_type", next=INCIDENT_DESCRIPTION, choices=INCIDENT_TYPES,
+    ),
+    INCIDENT_DESCRIPTION: Step(
+        "6. Please briefly describe the incident in your own words:",
+        key="incident_description", next=EXCHANGE,
+    ),
+    EXCHANGE: Step(
+        "📋 Section C – Case Details\n\n"
+        "7. Exchange or Platform Name (if applicable):\n"
+        "Enter the name or type 'skip' if not applicable.",
+        key="exchange", next=CRYPTO_TYPE, validate=validate_exchange,
+        remove_keyboard=False,
+    ),
+    CRYPTO_TYPE: Step(
+        "8. Type of Cryptocurrency involved:\n"
+        "Please choose from the options below or select 'Other' to type a different crypto.",
+        key="crypto_type", next=NETWORK, choices=CRYPTO_TYPES,
+        branches={'other': CRYPTO_TYPE_OTHER},
+    ),
+    CRYPTO_TYPE_OTHER: Step(
+        "Please type the cryptocurrency name/symbol (e.g., XRP, ADA, DOGE):",
+        key="crypto_type", next=NETWORK,
+    ),
+    NETWORK: Step(
+        "9. Network / Blockchain:",
+        key="network", next=WALLET_ADDRESSES, choices=NETWORKS,
+        branches={'other': NETWORK_OTHER},
+    ),
+    NETWORK_OTHER: Step(
+        "Please specify the Network / Blockchain:",
+        key="network", next=WALLET_ADDRESSES,
+    ),
+    WALLET_ADDRESSES: Step(
+        "10. Wallet Address(es) involved:\n"
+        "Please provide your wallet address and the suspected scammer/hacker's address if known.\n"
+        "Separate multiple addresses with new lines.",
+        key="wallet_addresses", next=DATE_TIME, validate=validate_wallet_addresses,
+    ),
+    DATE_TIME: Step(
+        "11. Date & Time of Incident:\n"
+        "Please provide the approximate date and time when the incident occurred.",
+        key="date_time", next=AMOUNT_LOST,
+    ),
+    AMOUNT_LOST: Step(
+        "12. Total Amount Lost:\n"
+        "Please specify approximate USD value.",
+        key="amount_lost", next=HOW_OCCURRED,
+    ),
+    HOW_OCCURRED: Step(
+        "13. How did the loss occur?",
+        key="how_occurred", next=PROOF_OWNERSHIP, choices=LOSS_CAUSES,
+        branches={'other': HOW_OCCURRED_OTHER},
+    ),
+    HOW_OCCURRED_OTHER: Step(
+        "Please specify how the loss occurred:",
+        key="how_occurred", next=PROOF_OWNERSHIP,
+    ),
+    PROOF_OWNERSHIP: Step(
+        "📋 Section D – Evidence & Proof\n\n"
+        "14. Do you have proof of ownership of the assets?\n"
+        "You can send screenshots or documents (e.g. exchange statements) here before answering.",
+        key="proof_ownership", next=TRANSACTION_IDS, choices=YES_NO, attachments=True,
+    ),
+    TRANSACTION_IDS: Step(
+        "15. Do you have transaction IDs (TXIDs) from the blockchain?",
+        key="transaction_ids", next=EVIDENCE, choices=YES_NO, validate=validate_transaction_ids,
+    ),
+    EVIDENCE: Step(
+        "16. Do you have chat screenshots, emails, or scammer contact details?\n"
+        "You can send the screenshots or files here before answering.",
+        key="evidence", next=POLICE_REPORT, choices=YES_NO, attachments=True,
+    ),
+    POLICE_REPORT: Step(
+        "📋 Section E – Additional Information\n\n"
+        "17. Have you reported the case to local police or cybercrime authorities?\n"
+        "If yes, please mention the case reference number in the next question.",
+        key="police_report", next=OTHER_SERVICES, choices=YES_NO,
+        branches={'yes': POLICE_CASE}, validate=police_report_declined,
+    ),
+    POLICE_CASE: Step(
+        "Please enter the case reference number (as provided by the police/cybercrime authority):",
+        key="police_report", next=OTHER_SERVICES, validate=strip_answer,
+    ),
+    OTHER_SERVICES: Step(
+        "18. Have you tried any other recovery services?",
+        key="other_services", next=ADDITIONAL_INFO, choices=YES_NO,
+    ),
+    ADDITIONAL_INFO: Step(
+        "19. Any additional details you believe are important?\n"
+        "Please provide any other relevant information that might help with your case.",
+        key="additional_info", completes=True,
+    ),
+}
+
+
+class Flow:
+    """A compiled, immutable version of a ``STEPS`` table."""
+
+    def __init__(self, steps):
+        for state, step in steps.items():
+            targets = [step.next, *step.branches.values()]
+            missing = [target for target in targets if target != END and target not in steps]
+            if missing:
+                raise ValueError(f"Step {STATE_NAMES.get(state, state)} points to unknown state(s) {missing}")
+        self.steps = MappingProxyType(dict(steps))
+        # keyboards with identical rows share one markup object
+        markups = {}
+        self._prompts = MappingProxyType({
+            state: Transition(
+                state,
+                step.prompt,
+                self._markup(step, markups),
+            )
+            for state, step in steps.items()
+        })
+        self._branches = MappingProxyType({
+            state: MappingProxyType(dict(step.branches)) for state, step in steps.items()
+        })
+
+    @staticmethod
+    def _markup(step, markups):
+        if step.choices:
+            return markups.setdefault(step.choices, keyboard(step.choices))
+        return REMOVE_KEYBOARD if step.remove_keyboard else None
+
+    @property
+    def states(self):
+        return tuple(self.steps)
+
+    def prompt(self, state):
+        """The transition that asks the question of ``state``."""
+        return self._prompts[state]
+
+    def advance(self, state, text, user_data):
+        """Apply the answer ``text`` given in ``state`` to ``user_data``.
+
+        Returns the transition to perform: the state to move to and the reply to
+        send. A transition with ``completes`` set means the case is finished and
+        the caller is responsible for submitting it.
+        """
+        step = self.steps[state]
+        branch = self._branches[state].get(text.strip().lower())
+        if branch is not None:
+            return self._prompts[branch]
+        try:
+            value = step.validate(text, user_data) if step.validate else text
+        except Reprompt as exc:
+            return Transition(
+                state, exc.message, REMOVE_KEYBOARD if exc.remove_keyboard else None, rejected=exc.rejected
+            )
+        if step.key:
+            user_data[step.key] = value
+        if step.completes:
+            return Transition(END, completes=True)
+        return self._prompts[step.next]
+
+
+FLOW = Flow(STEPS)
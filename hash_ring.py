@@ -0,0 +1,64 @@
+import bisect
+import hashlib
+
+# the ring is sampled into this many slots, so a lookup is one hash and one index
+SLOTS = 4096
+_SLOT_WIDTH = 2 ** 64 // SLOTS
+
+
+def _hash(value):
+    # stable across processes and restarts, unlike hash()
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes.
+
+    Each node owns ``replicas`` points on a 64-bit ring. Adding or removing a
+    node only moves the keys that hashed to that node's points, so most keys keep
+    landing on the node they had. The ring is sampled into ``SLOTS`` entries
+    whenever its nodes change: a key goes to the owner of the first point at or
+    after the start of its slot.
+    """
+
+    def __init__(self, nodes=(), replicas=64):
+        self.replicas = replicas
+        self._points = []
+        self._owners = {}
+        self._table = []
+        for node in nodes:
+            self.add(node)
+
+    def __contains__(self, node):
+        return node in set(self._owners.values())
+
+    def __len__(self):
+        return len(self._points) // self.replicas
+
+    def _sample(self):
+        points = self._points
+        self._table = [
+            self._owners[points[bisect.bisect_left(points, slot * _SLOT_WIDTH) % len(points)]]
+            for slot in range(SLOTS)
+        ] if points else []
+
+    def add(self, node):
+        for replica in range(self.replicas):
+            point = _hash(f"{node}#{replica}")
+            if point not in self._owners:
+                bisect.insort(self._points, point)
+                self._owners[point] = node
+        self._sample()
+
+    def remove(self, node):
+        for replica in range(self.replicas):
+            point = _hash(f"{node}#{replica}")
+            if self._owners.get(point) == node:
+                del self._owners[point]
+                self._points.pop(bisect.bisect_left(self._points, point))
+        self._sample()
+
+    def get(self, key):
+        if not self._table:
+            return None
+        return self._table[_hash(str(key)) // _SLOT_WIDTH]
@@ -0,0 +1,144 @@
+import asyncio
+from dataclasses import dataclass, field
+from http import HTTPStatus
+
+# Telegram never sends more than a few hundred KB per webhook call
+MAX_BODY_SIZE = 4 * 1024 * 1024
+
+# how long close() waits for requests that are being handled before it drops them
+CLOSE_TIMEOUT = 5.0
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    query: str
+    headers: dict
+    body: bytes
+
+
+@dataclass
+class Response:
+    status: int = 200
+    body: bytes = b""
+    content_type: str = "text/plain; charset=utf-8"
+    headers: dict = field(default_factory=dict)
+
+
+async def _read_request(reader, request_line):
+    """Read the rest of the HTTP/1.1 request that starts with ``request_line``.
+
+    Returns None when the client closed the connection instead.
+    """
+    if not request_line:
+        return None
+    method, target, _ = request_line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", "0"))
+    if length > MAX_BODY_SIZE:
+        raise ValueError("request body too large")
+    body = await reader.readexactly(length) if length else b""
+    path, _, query = target.partition("?")
+    return Request(method.upper(), path, query, headers, body)
+
+
+def _encode_response(response, keep_alive):
+    reason = HTTPStatus(response.status).phrase
+    lines = [
+        f"HTTP/1.1 {response.status} {reason}",
+        f"Content-Type: {response.content_type}",
+        f"Content-Length: {len(response.body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    lines.extend(f"{name}: {value}" for name, value in response.headers.items())
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + response.body
+
+
+class HTTPServer:
+    """A server returned by ``start_server``.
+
+    It keeps track of its connections: ``close`` also ends the keep-alive
+    connections waiting for their next request (from Python 3.12.1 on,
+    ``wait_closed`` waits for every connection, and a client that keeps an idle
+    one open would otherwise stop a shutdown forever), and a request that is
+    being handled gets its response with ``Connection: close``.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self._server = None
+        self._connections = {}
+        self._idle = set()
+
+    @property
+    def sockets(self):
+        return self._server.sockets
+
+    async def _on_connection(self, reader, writer):
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while self._server.is_serving():
+                self._idle.add(writer)
+                try:
+                    request_line = await reader.readline()
+                finally:
+                    self._idle.discard(writer)
+                try:
+                    request = await _read_request(reader, request_line)
+                except (ValueError, asyncio.IncompleteReadError):
+                    writer.write(_encode_response(Response(400, b"bad request"), False))
+                    break
+                if request is None:
+                    break
+                try:
+                    response = await self.handler(request)
+                except Exception as exc:  # never let one bad request kill the connection loop
+                    print(f"HTTP handler error on {request.path}: {exc!r}")
+                    response = Response(500, b"internal error")
+                keep_alive = (
+                    request.headers.get("connection", "").lower() != "close"
+                    and self._server.is_serving()
+                )
+                writer.write(_encode_response(response, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            del self._connections[writer]
+            writer.close()
+
+    def close(self):
+        """Stop listening and close the connections that are waiting for a request."""
+        self._server.close()
+        for writer in self._idle:
+            writer.close()
+
+    async def wait_closed(self, timeout=CLOSE_TIMEOUT):
+        """Wait for the connections to finish; after ``timeout`` seconds they are aborted."""
+        if self._connections:
+            _, pending = await asyncio.wait(self._connections.values(), timeout=timeout)
+            if pending:
+                print(f"HTTP server: dropping {len(pending)} connection(s) still open after {timeout:g}s")
+                for writer in self._connections:
+                    writer.transport.abort()
+        await self._server.wait_closed()
+
+
+async def start_server(handler, host, port):
+    """Serve ``handler(request) -> Response`` over plain HTTP/1.1 with keep-alive.
+
+    This is intentionally tiny: it is meant to sit behind a TLS-terminating proxy
+    (or to run on localhost), not to be exposed as a general-purpose web server.
+    """
+    server = HTTPServer(handler)
+    server._server = await asyncio.start_server(server._on_connection, host, port)
+    return server
@@ -0,0 +1,68 @@
+"""Starting the application and stopping it gracefully on SIGINT/SIGTERM.
+
+Stopping happens in three steps:
+
+1. no new updates are taken in (the webhook server is closed or polling stops),
+   so Telegram keeps them for the next process;
+2. updates already received are handled, for at most ``drain_timeout`` seconds;
+   the handlers still running then are cancelled, so that nothing uses the
+   stores once ``post_stop`` gives the background services (the admin queue in
+   particular) their own chance to finish and closes them;
+3. every session is written to the persistence, which compacts it so the next
+   process only loads the sessions that are still open.
+"""
+import asyncio
+import signal
+import time
+
+# systemd waits 90 s by default before it kills a service that does not stop
+DRAIN_TIMEOUT = 20.0
+
+
+def stop_signal_event():
+    """An Event that is set when the process gets SIGINT or SIGTERM."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    return stop
+
+
+async def start_application(app):
+    """Initialize ``app``, run its ``post_init`` and start handling updates."""
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+
+
+async def stop_application(app, drain_timeout=DRAIN_TIMEOUT):
+    """Handle the updates ``app`` already has, then stop it and persist everything."""
+    started = time.monotonic()
+    # Application.stop handles every update still queued or in flight first. It
+    # is never cancelled itself: it also stops the persistence loop and flushes
+    # the persistence, which must happen before post_stop closes the stores
+    stopping = asyncio.ensure_future(app.stop())
+    done, _ = await asyncio.wait((stopping,), timeout=drain_timeout)
+    if not done:
+        print(f"⚠️ Updates were still being handled after {drain_timeout:.0f}s; cancelling them")
+        app.update_processor.abort()
+    await stopping
+    if app.post_stop:
+        await app.post_stop(app)
+    await app.shutdown()
+    if app.post_shutdown:
+        await app.post_shutdown(app)
+    print(f"👋 Stopped in {time.monotonic() - started:.1f}s")
+
+
+async def serve_polling(app, allowed_updates, drain_timeout=DRAIN_TIMEOUT):
+    """Run ``app`` with long polling until SIGINT/SIGTERM, then stop it gracefully."""
+    stop = stop_signal_event()
+    await start_application(app)
+    await app.updater.start_polling(allowed_updates=allowed_updates)
+    try:
+        await stop.wait()
+    finally:
+        await app.updater.stop()
+        await stop_application(app, drain_timeout)
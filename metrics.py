@@ -0,0 +1,288 @@
+"""In-process metrics rendered in the Prometheus text format.
+
+Recording a sample only touches a dict and a list, so it costs well under a
+microsecond. Gauges are callbacks that run only when the endpoint is scraped,
+and the text is built at scrape time too, so nothing happens when nobody scrapes.
+Everything runs on the event loop, so no locking is needed.
+"""
+import bisect
+import functools
+import time
+
+from telegram.ext import ConversationHandler
+from telegram.request import HTTPXRequest
+
+from flow import STATE_NAMES
+from http_server import Response, start_server
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HANDLER_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+API_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter keyed by label values."""
+
+    __slots__ = ("name", "help", "labels", "_values")
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        for label_values, value in sorted(self._values.items()):
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Gauge:
+    """Gauge whose values come from ``collect() -> {label values: value}`` at scrape time."""
+
+    __slots__ = ("name", "help", "labels", "collect")
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), collect=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def samples(self):
+        values = self.collect() if self.collect is not None else {}
+        for label_values, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Histogram:
+    """Histogram with fixed buckets; cumulative counts are only computed when rendered."""
+
+    __slots__ = ("name", "help", "labels", "buckets", "_series")
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=HANDLER_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket (+ overflow), sum]
+        self._series = {}
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self):
+        for label_values, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                labels = _format_labels(self.labels, label_values, (("le", _format_value(bound)),))
+                yield self.name + "_bucket", labels, cumulative
+            labels = _format_labels(self.labels, label_values)
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=(), collect=None):
+        return self.register(Gauge(name, help, labels, collect))
+
+    def histogram(self, name, help, labels=(), buckets=HANDLER_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.histogram(
+    "intake_handler_seconds", "Time spent in conversation callbacks.", ("state", "handler")
+)
+STATE_ENTRIES = REGISTRY.counter(
+    "intake_state_entries_total", "Conversations that entered a state.", ("state",)
+)
+STATE_EXITS = REGISTRY.counter(
+    "intake_state_exits_total", "Conversations that left a state, by the state they went to.", ("state", "to")
+)
+VALIDATION_RETRIES = REGISTRY.counter(
+    "intake_validation_retries_total", "Answers that were rejected and asked again.", ("state",)
+)
+THROTTLED_UPDATES = REGISTRY.counter(
+    "bot_throttled_updates_total", "Updates dropped by the flood guard, by kind.", ("kind",)
+)
+ADMIN_NOTIFICATIONS_FAILED = REGISTRY.counter(
+    "bot_admin_notifications_failed_total",
+    "Admin notifications left undelivered in the spool after a permanent Bot API error, by error.", ("error",)
+)
+LOG_EVENTS_DROPPED = REGISTRY.counter(
+    "bot_log_events_dropped_total", "Events dropped because a log writer fell behind, by log.", ("log",)
+)
+BOT_API_SECONDS = REGISTRY.histogram(
+    "bot_api_request_seconds", "Outbound Bot API request latency.", ("method", "status"), API_BUCKETS
+)
+
+
+def state_label(state):
+    if state is None:
+        return "NONE"
+    if state == ConversationHandler.END:
+        return "END"
+    return STATE_NAMES.get(state, str(state))
+
+
+def record_expiry(state):
+    """Count a session that went idle in ``state`` as an exit to TIMEOUT."""
+    STATE_EXITS.inc(state_label(state), "TIMEOUT")
+
+
+def record_rejected(state):
+    """Count an answer given in ``state`` that was rejected and asked again."""
+    VALIDATION_RETRIES.inc(state_label(state))
+
+
+def record_throttled(update):
+    """Count an update the flood guard dropped."""
+    message = update.message
+    if message is None:
+        kind = "other"
+    elif message.text:
+        kind = "command" if message.text.startswith("/") else "text"
+    else:
+        kind = "media"
+    THROTTLED_UPDATES.inc(kind)
+
+
+def _instrument(conversation, handler, state, on_transition):
+    callback = handler.callback
+
+    @functools.wraps(callback)
+    async def timed(update, context):
+        current = state
+        if current is None:
+            # entry points and fallbacks can run in any state; ask the conversation
+            current = conversation._conversations.get(conversation._get_key(update))
+        started = time.perf_counter()
+        new_state = error = None
+        try:
+            new_state = await callback(update, context)
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            HANDLER_SECONDS.observe(seconds, state_label(current), callback.__name__)
+            if on_transition is not None:
+                on_transition(update, callback.__name__, current, new_state, seconds, error)
+        if new_state is None:
+            return new_state
+        if new_state == current:
+            return new_state
+        if current is not None:
+            STATE_EXITS.inc(state_label(current), state_label(new_state))
+        if new_state != ConversationHandler.END:
+            STATE_ENTRIES.inc(state_label(new_state))
+        return new_state
+
+    handler.callback = timed
+
+
+def instrument_conversation(conversation, on_transition=None):
+    """Time every callback of ``conversation`` and count the state transitions it makes.
+
+    Entries minus exits of a state is the number of sessions that reached it and
+    never moved on, i.e. the funnel drop-off. The number of sessions currently in
+    each state is read from the conversation when scraped.
+
+    ``on_transition(update, handler_name, state, new_state, seconds, error)``, if
+    given, is also called after every callback (``AuditLog.transition`` is one).
+    """
+    for handler in conversation.entry_points + conversation.fallbacks:
+        _instrument(conversation, handler, None, on_transition)
+    for state, handlers in conversation.states.items():
+        for handler in handlers:
+            _instrument(conversation, handler, state, on_transition)
+
+    def active_sessions():
+        counts = {}
+        for state in conversation._conversations.values():
+            if isinstance(state, int):
+                label = (state_label(state),)
+                counts[label] = counts.get(label, 0) + 1
+        return counts
+
+    REGISTRY.gauge(
+        "intake_sessions_active", "Conversations currently in progress, by state.", ("state",), active_sessions
+    )
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that records how long each Bot API call takes."""
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        started = time.perf_counter()
+        status = "error"
+        try:
+            status, payload = await super().do_request(url, method, request_data, **kwargs)
+            return status, payload
+        finally:
+            BOT_API_SECONDS.observe(time.perf_counter() - started, url.rsplit("/", 1)[-1], str(status))
+
+
+async def handle_scrape(request):
+    if request.path != "/metrics":
+        return Response(404, b"not found")
+    return Response(200, REGISTRY.render().encode(), CONTENT_TYPE)
+
+
+async def start_metrics_server(host, port):
+    """Serve ``/metrics`` for Prometheus on ``host:port``."""
+    return await start_server(handle_scrape, host, port)
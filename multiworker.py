@@ -0,0 +1,135 @@
+"""Run the bot as several worker processes behind a sharding dispatcher.
+
+The dispatcher receives Telegram's webhook calls on the public address
+(WEBHOOK_LISTEN/WEBHOOK_PORT/WEBHOOK_PATH/WEBHOOK_SECRET, as for bot.py) and
+forwards each update to a worker chosen by consistent hashing on the chat id.
+Workers listen on 127.0.0.1 starting at WORKER_BASE_PORT and share the
+conversation state and case store databases, so a worker that dies or is added
+only moves its chats to another worker without losing their sessions. Exited
+workers are restarted. A worker that is killed outright (rather than stopped with
+SIGTERM) loses the answers it received in the last WORKER_FLUSH_INTERVAL seconds.
+
+Everything runs on one machine, which also makes it easy to try locally against
+fake_bot_api.py (set BOT_API_BASE_URL and leave WEBHOOK_URL empty).
+"""
+import asyncio
+import os
+import secrets
+import signal
+import sys
+
+from dotenv import load_dotenv
+from telegram import Bot
+
+from dispatcher import Dispatcher
+from http_server import start_server
+from webhook import ALLOWED_UPDATES
+
+load_dotenv()
+
+WORKERS = int(os.getenv("WORKERS", str(os.cpu_count() or 2)))
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", "9100"))
+# Workers re-read shared state before each update, so they flush it quickly
+WORKER_FLUSH_INTERVAL = os.getenv("WORKER_FLUSH_INTERVAL", "0.2")
+WORKER_RESTART_DELAY = 1.0
+
+BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL", "")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+ADMIN_SPOOL_PATH = os.getenv("ADMIN_SPOOL_PATH", "admin_outbox.sqlite3")
+AUDIT_LOG_PATH = os.getenv("AUDIT_LOG_PATH", "audit.jsonl")
+TRACE_PATH = os.getenv("TRACE_PATH", "")
+# worker i serves its metrics on METRICS_PORT + i
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+
+
+def worker_env(index, worker_secret):
+    """Environment for worker ``index``: an internal webhook and shared state."""
+    root, ext = os.path.splitext(ADMIN_SPOOL_PATH)
+    env = dict(os.environ)
+    env.update(
+        WEBHOOK_MODE="1",
+        WEBHOOK_URL="",
+        WEBHOOK_LISTEN="127.0.0.1",
+        WEBHOOK_PORT=str(WORKER_BASE_PORT + index),
+        WEBHOOK_PATH=WEBHOOK_PATH,
+        WEBHOOK_SECRET=worker_secret,
+        SHARED_STATE="1",
+        PERSISTENCE_FLUSH_INTERVAL=WORKER_FLUSH_INTERVAL,
+        # the admin outbox is drained by its owner only, so every worker has its own
+        ADMIN_SPOOL_PATH=f"{root}.{index}{ext}",
+    )
+    if METRICS_PORT:
+        env["METRICS_PORT"] = str(METRICS_PORT + index)
+    if AUDIT_LOG_PATH:
+        # a log file is rotated by the process writing it
+        audit_root, audit_ext = os.path.splitext(AUDIT_LOG_PATH)
+        env["AUDIT_LOG_PATH"] = f"{audit_root}.{index}{audit_ext}"
+    if TRACE_PATH:
+        trace_root, trace_ext = os.path.splitext(TRACE_PATH)
+        env["TRACE_PATH"] = f"{trace_root}.{index}{trace_ext}"
+    return env
+
+
+async def supervise(index, worker_secret, stopping):
+    """Keep worker ``index`` running until ``stopping`` is set."""
+    while not stopping.is_set():
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, BOT_SCRIPT, env=worker_env(index, worker_secret)
+        )
+        print(f"👷 Worker {index} started (pid {process.pid})")
+        try:
+            code = await process.wait()
+        except asyncio.CancelledError:
+            if process.returncode is None:
+                process.send_signal(signal.SIGTERM)
+                await process.wait()
+            raise
+        if not stopping.is_set():
+            print(f"⚠️ Worker {index} exited with code {code}, restarting")
+            await asyncio.sleep(WORKER_RESTART_DELAY)
+
+
+async def run():
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    worker_secret = secrets.token_urlsafe(32)
+    workers = [
+        f"http://127.0.0.1:{WORKER_BASE_PORT + index}{WEBHOOK_PATH}" for index in range(WORKERS)
+    ]
+    dispatcher = Dispatcher(workers, WEBHOOK_PATH, WEBHOOK_SECRET, worker_secret)
+    supervisors = [
+        asyncio.create_task(supervise(index, worker_secret, stopping)) for index in range(WORKERS)
+    ]
+    await dispatcher.start()
+    server = await start_server(dispatcher.handle, WEBHOOK_LISTEN, WEBHOOK_PORT)
+    try:
+        if WEBHOOK_URL:
+            bot_kwargs = {"base_url": BOT_API_BASE_URL} if BOT_API_BASE_URL else {}
+            async with Bot(os.environ["BOT_TOKEN"], **bot_kwargs) as bot:
+                await bot.set_webhook(
+                    url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET, allowed_updates=ALLOWED_UPDATES
+                )
+        print(f"🌐 Dispatcher listening on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH} for {WORKERS} workers")
+        await stopping.wait()
+    finally:
+        server.close()
+        await server.wait_closed()
+        for task in supervisors:
+            task.cancel()
+        await asyncio.gather(*supervisors, return_exceptions=True)
+        await dispatcher.stop()
+
+
+if __name__ == "__main__":
+    if not os.getenv("BOT_TOKEN"):
+        raise RuntimeError("BOT_TOKEN is not set. Please add it to your .env file.")
+    asyncio.run(run())
@@ -0,0 +1,278 @@
+import asyncio
+import json
+import sqlite3
+
+from telegram import Update
+from telegram.ext import BasePersistence, ConversationHandler, PersistenceInput
+
+# Only user_data and conversation states are needed to resume an intake session
+STORE_DATA = PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False)
+
+# Every row carries a version that is bumped on each write, so a worker sharing the
+# database can tell whether someone else changed it since it last looked. Finished
+# conversations are kept as END tombstones for the same reason.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (
+    user_id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    conv_key TEXT NOT NULL,
+    state INTEGER NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (name, conv_key)
+);
+"""
+
+END = ConversationHandler.END
+
+# returned by refresh_conversation when the local state is current
+UNCHANGED = object()
+
+
+def open_database(path):
+    """Open a SQLite connection in WAL mode so readers never block the flusher."""
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+def _migrate(conn):
+    # databases created before rows were versioned
+    for table in ("user_data", "conversations"):
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if "version" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+
+
+class SQLitePersistence(BasePersistence):
+    """Persist user_data and ConversationHandler states to SQLite.
+
+    The application hands us changed entries every ``update_interval`` seconds.
+    Entries whose serialized form did not change since the last write are skipped,
+    and everything that is left is written in a single transaction off the event loop.
+
+    With ``shared=True`` several processes can use the same database: before an
+    update is handled, the user's data and conversation state are re-read if
+    another process wrote a newer version of them.
+
+    ``user_data_class`` is the mapping type loaded user_data is restored into; it
+    should match the application's ``ContextTypes``.
+    """
+
+    def __init__(self, path, update_interval=10, shared=False, user_data_class=dict):
+        super().__init__(store_data=STORE_DATA, update_interval=update_interval)
+        self.path = path
+        self.shared = shared
+        self.user_data_class = user_data_class
+        self._conn = open_database(path)
+        self._conn.executescript(SCHEMA)
+        _migrate(self._conn)
+        # refreshes run on the event loop and must not wait for the flusher thread
+        self._reader = open_database(path) if shared else None
+        self._lock = asyncio.Lock()
+        self._flush_task = None
+        # user_id -> serialized data, or None to delete
+        self._pending_users = {}
+        # (name, serialized key) -> state
+        self._pending_conversations = {}
+        # last serialized value written per user, used for dirty-tracking
+        self._written_users = {}
+        # row versions this process last read or wrote
+        self._user_versions = {}
+        self._conversation_versions = {}
+
+    # ---- loading -------------------------------------------------------
+
+    async def get_user_data(self):
+        rows = self._conn.execute("SELECT user_id, data, version FROM user_data").fetchall()
+        self._written_users = {user_id: data for user_id, data, _ in rows}
+        self._user_versions = {user_id: version for user_id, _, version in rows}
+        return {user_id: self.user_data_class(json.loads(data)) for user_id, data, _ in rows}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        rows = self._conn.execute(
+            "SELECT conv_key, state, version FROM conversations WHERE name = ?", (name,)
+        ).fetchall()
+        for key, _, version in rows:
+            self._conversation_versions[(name, key)] = version
+        return {tuple(json.loads(key)): state for key, state, _ in rows if state != END}
+
+    # ---- buffering -----------------------------------------------------
+
+    async def update_user_data(self, user_id, data):
+        serialized = json.dumps(dict(data), ensure_ascii=False, sort_keys=True)
+        if self._written_users.get(user_id) == serialized:
+            self._pending_users.pop(user_id, None)
+            return
+        self._pending_users[user_id] = serialized
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id):
+        # other workers only notice a change by a newer version, so a shared row is
+        # emptied (like a conversation's END tombstone) rather than deleted
+        self._pending_users[user_id] = "{}" if self.shared else None
+        self._schedule_flush()
+
+    async def update_conversation(self, name, key, new_state):
+        self._pending_conversations[(name, json.dumps(list(key)))] = END if new_state is None else new_state
+        self._schedule_flush()
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        if not self.shared:
+            return
+        row = self._reader.execute(
+            "SELECT data, version FROM user_data WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None or row[1] <= self._user_versions.get(user_id, 0):
+            return
+        data, version = row
+        user_data.clear()
+        user_data.update(json.loads(data))
+        self._written_users[user_id] = data
+        self._user_versions[user_id] = version
+        self._pending_users.pop(user_id, None)
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    def refresh_conversation(self, name, key):
+        """Return the stored state of ``key`` if another process changed it, else UNCHANGED."""
+        if not self.shared:
+            return UNCHANGED
+        conv_key = json.dumps(list(key))
+        row = self._reader.execute(
+            "SELECT state, version FROM conversations WHERE name = ? AND conv_key = ?", (name, conv_key)
+        ).fetchone()
+        if row is None or row[1] <= self._conversation_versions.get((name, conv_key), 0):
+            return UNCHANGED
+        self._conversation_versions[(name, conv_key)] = row[1]
+        self._pending_conversations.pop((name, conv_key), None)
+        return row[0]
+
+    # ---- writing -------------------------------------------------------
+
+    def _schedule_flush(self):
+        # The application calls all update_* methods of one run together, so a task
+        # scheduled by the first call runs after the rest and commits them as one batch.
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._write_pending())
+
+    async def _write_pending(self):
+        async with self._lock:
+            users, self._pending_users = self._pending_users, {}
+            conversations, self._pending_conversations = self._pending_conversations, {}
+            if not users and not conversations:
+                return
+            user_versions, conversation_versions = await asyncio.to_thread(self._write, users, conversations)
+            for user_id, serialized in users.items():
+                if serialized is None:
+                    self._written_users.pop(user_id, None)
+                    self._user_versions.pop(user_id, None)
+                else:
+                    self._written_users[user_id] = serialized
+            self._user_versions.update(user_versions)
+            self._conversation_versions.update(conversation_versions)
+
+    def _write(self, users, conversations):
+        user_versions, conversation_versions = {}, {}
+        with self._conn:
+            self._conn.execute("BEGIN")
+            for user_id, serialized in users.items():
+                if serialized is None:
+                    self._conn.execute("DELETE FROM user_data WHERE user_id = ?", (user_id,))
+                    continue
+                user_versions[user_id] = self._conn.execute(
+                    "INSERT INTO user_data (user_id, data) VALUES (?, ?) "
+                    "ON CONFLICT (user_id) DO UPDATE SET data = excluded.data, version = version + 1 "
+                    "RETURNING version",
+                    (user_id, serialized),
+                ).fetchone()[0]
+            for (name, key), state in conversations.items():
+                conversation_versions[(name, key)] = self._conn.execute(
+                    "INSERT INTO conversations (name, conv_key, state) VALUES (?, ?, ?) "
+                    "ON CONFLICT (name, conv_key) DO UPDATE SET state = excluded.state, version = version + 1 "
+                    "RETURNING version",
+                    (name, key, state),
+                ).fetchone()[0]
+        return user_versions, conversation_versions
+
+    async def flush(self):
+        """Write everything still buffered; called by the application on shutdown."""
+        if self._flush_task is not None:
+            await self._flush_task
+        await self._write_pending()
+        await asyncio.to_thread(self._compact)
+        self._conn.close()
+        if self._reader is not None:
+            self._reader.close()
+
+
+    def _compact(self):
+        # Leave only what the next start has to load: without other processes to tell
+        # apart, finished conversations and the answers of users without an open one
+        # are dead weight. The WAL is folded back into the database file, too.
+        if not self.shared:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.execute("DELETE FROM conversations WHERE state = ?", (END,))
+                self._conn.execute(
+                    "DELETE FROM user_data WHERE user_id NOT IN "
+                    "(SELECT json_extract(conv_key, '$[#-1]') FROM conversations)"
+                )
+        self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+class SharedConversationHandler(ConversationHandler):
+    """ConversationHandler that picks up state changes made by other worker processes.
+
+    Used when several workers share one SQLitePersistence database: a chat that was
+    handled by another worker until a moment ago continues in the state that worker
+    left it in.
+    """
+
+    def check_update(self, update):
+        persistence = getattr(self, "_shared_persistence", None)
+        if persistence is not None and isinstance(update, Update) and update.effective_chat and update.effective_user:
+            key = self._get_key(update)
+            state = persistence.refresh_conversation(self.name, key)
+            if state is not UNCHANGED:
+                if state == END:
+                    self._conversations.data.pop(key, None)
+                else:
+                    self._conversations.update_no_track({key: state})
+        return super().check_update(update)
+
+    async def _initialize_persistence(self, application):
+        result = await super()._initialize_persistence(application)
+        if getattr(application.persistence, "shared", False):
+            self._shared_persistence = application.persistence
+        return result
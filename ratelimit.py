@@ -0,0 +1,36 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Classic token bucket: ``rate`` tokens per second, bursting up to ``capacity``."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, now=None):
+        """Take one token if available; never waits."""
+        self._refill(time.monotonic() if now is None else now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def delay(self):
+        """Seconds until the next token becomes available."""
+        self._refill(time.monotonic())
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        while not self.try_acquire():
+            await asyncio.sleep((1 - self.tokens) / self.rate)
@@ -0,0 +1,162 @@
+"""Spreading finished cases over a pool of reviewers.
+
+Every case is assigned to one reviewer when it is submitted, either
+
+* ``least_loaded``: to the reviewer with the fewest open (not yet acked) cases, or
+* ``network`` / ``language``: by consistent hashing of the case's network or the
+  user's language, so each reviewer keeps seeing the cases they know best.
+
+The reviewer claims it with /claim and closes it with /done. A case that nobody
+claimed within ``claim_timeout`` seconds goes to the least loaded of the other
+reviewers. Assignments, claims and acks live in the case store, so all of this
+survives restarts and is shared by worker processes.
+"""
+import asyncio
+import time
+
+from hash_ring import HashRing
+
+LEAST_LOADED = "least_loaded"
+NETWORK = "network"
+LANGUAGE = "language"
+MODES = (LEAST_LOADED, NETWORK, LANGUAGE)
+
+
+class LoadIndex:
+    """Open cases per reviewer, bucketed by count so the least loaded one is found in O(1).
+
+    Counts only ever change by one, so the lowest non-empty bucket moves by at
+    most one step per change. Within a bucket reviewers are kept in the order
+    they reached that count, which spreads ties round-robin.
+    """
+
+    def __init__(self, reviewers, counts=None):
+        counts = counts or {}
+        self._counts = {reviewer: counts.get(reviewer, 0) for reviewer in reviewers}
+        self._buckets = {}
+        for reviewer, count in sorted(self._counts.items(), key=lambda item: item[1]):
+            self._buckets.setdefault(count, {})[reviewer] = None
+        self._min = min(self._buckets, default=0)
+
+    def __getitem__(self, reviewer):
+        return self._counts[reviewer]
+
+    def __contains__(self, reviewer):
+        return reviewer in self._counts
+
+    def _move(self, reviewer, delta):
+        count = self._counts[reviewer]
+        bucket = self._buckets[count]
+        del bucket[reviewer]
+        if not bucket:
+            del self._buckets[count]
+        self._counts[reviewer] = count + delta
+        self._buckets.setdefault(count + delta, {})[reviewer] = None
+        if count + delta < self._min:
+            self._min = count + delta
+        elif self._min not in self._buckets:
+            self._min += 1
+
+    def add(self, reviewer):
+        if reviewer in self._counts:
+            self._move(reviewer, 1)
+
+    def remove(self, reviewer):
+        if self._counts.get(reviewer, 0) > 0:
+            self._move(reviewer, -1)
+
+    def least_loaded(self, exclude=()):
+        """The reviewer with the fewest open cases that is not in ``exclude``, or None."""
+        for reviewer in self._buckets.get(self._min, ()):
+            if reviewer not in exclude:
+                return reviewer
+        candidates = [reviewer for reviewer in self._counts if reviewer not in exclude]
+        return min(candidates, key=self._counts.__getitem__, default=None)
+
+
+class ReviewRouter:
+    """Assign cases to ``reviewers`` and move the ones left unclaimed.
+
+    ``route`` picks the reviewer for a new case; the caller stores it with the
+    case. A task wakes up every ``interval`` seconds, reloads the open-case counts
+    from the store (cases are also claimed and acked by other processes) and hands
+    every case unclaimed for ``claim_timeout`` seconds to another reviewer, then
+    calls ``on_reassign(case_id, previous_id, reviewer_id)`` to tell them.
+    """
+
+    def __init__(self, case_store, reviewers, mode=LEAST_LOADED, claim_timeout=900, on_reassign=None,
+                 interval=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown routing mode {mode!r}; expected one of {', '.join(MODES)}")
+        self.case_store = case_store
+        self.reviewers = tuple(dict.fromkeys(reviewers))
+        self.mode = mode
+        self.claim_timeout = claim_timeout
+        self.on_reassign = on_reassign
+        self.interval = interval if interval is not None else min(claim_timeout / 4, 60)
+        self.loads = LoadIndex(self.reviewers)
+        self._ring = HashRing(self.reviewers) if mode != LEAST_LOADED else None
+        self._task = None
+
+    async def refresh(self):
+        """Reload the open-case counts from the case store."""
+        self.loads = LoadIndex(self.reviewers, await self.case_store.loads())
+
+    def route(self, network="", language=""):
+        """The reviewer for a new case, counted as one more open case of theirs."""
+        key = network if self.mode == NETWORK else language if self.mode == LANGUAGE else ""
+        reviewer = self._ring.get(key.strip().lower()) if key else self.loads.least_loaded()
+        self.loads.add(reviewer)
+        return reviewer
+
+    async def claim(self, case_id, reviewer_id):
+        """Claim case ``case_id`` for ``reviewer_id``; False if someone already did."""
+        if not await self.case_store.claim(case_id, reviewer_id):
+            return False
+        # the case may have been assigned to someone else
+        await self.refresh()
+        return True
+
+    async def ack(self, case_id, reviewer_id):
+        """Close case ``case_id`` of ``reviewer_id``; False if it is not theirs or already closed."""
+        if not await self.case_store.ack(case_id, reviewer_id):
+            return False
+        self.loads.remove(reviewer_id)
+        return True
+
+    async def sweep(self, now=None):
+        """Reassign the cases left unclaimed for too long; returns how many were moved."""
+        await self.refresh()
+        deadline = (time.time() if now is None else now) - self.claim_timeout
+        moved = 0
+        for case_id, previous_id in await self.case_store.unclaimed(deadline):
+            reviewer = self.loads.least_loaded(exclude=(previous_id,))
+            if reviewer is None:
+                # a pool of one: there is nobody else to give the case to
+                continue
+            if not await self.case_store.reassign(case_id, previous_id, reviewer):
+                continue
+            self.loads.remove(previous_id)
+            self.loads.add(reviewer)
+            moved += 1
+            if self.on_reassign is not None:
+                await self.on_reassign(case_id, previous_id, reviewer)
+        return moved
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep()
+            except Exception as exc:  # keep sweeping even if one round fails
+                print(f"Reviewer reassignment sweep failed: {exc!r}")
+
+    async def start(self):
+        await self.refresh()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,103 @@
+import asyncio
+import collections
+import time
+
+from telegram import Update
+from telegram.error import TelegramError
+
+from metrics import record_expiry
+from persistence import UNCHANGED
+
+
+class SessionExpiry:
+    """End conversations that have been idle for ``timeout`` seconds.
+
+    Instead of one timer per conversation, the last activity of every chat is
+    kept in an OrderedDict in the order it happened: touching a chat moves it to
+    the end, so the idle ones are always at the front. A single task wakes up
+    every ``interval`` seconds and pops from the front until it reaches a chat
+    that is still fresh, so both a touch and a sweep cost O(1) per session no
+    matter how many sessions are open.
+
+    For every expired session still in the conversation the state is set to END,
+    the user's ``user_data`` is dropped and ``on_expire(bot, chat_id)`` is called
+    to tell the user.
+    """
+
+    def __init__(self, conversation, timeout, on_expire, interval=None):
+        self.conversation = conversation
+        self.timeout = timeout
+        self.interval = interval if interval is not None else min(timeout / 10, 30)
+        self.on_expire = on_expire
+        # conversation key -> monotonic time of the last update, oldest first
+        self._last_seen = collections.OrderedDict()
+        self._task = None
+
+    def __len__(self):
+        return len(self._last_seen)
+
+    def touch(self, key, now=None):
+        self._last_seen[key] = time.monotonic() if now is None else now
+        self._last_seen.move_to_end(key)
+
+    async def record_activity(self, update, context):
+        """TypeHandler callback; registered in a group that runs before the conversation."""
+        if isinstance(update, Update) and update.effective_chat and update.effective_user:
+            self.touch(self.conversation._get_key(update))
+
+    def pop_expired(self, now=None):
+        """Remove and return the keys idle for longer than ``timeout``."""
+        deadline = (time.monotonic() if now is None else now) - self.timeout
+        expired = []
+        while self._last_seen:
+            key, seen = next(iter(self._last_seen.items()))
+            if seen > deadline:
+                break
+            self._last_seen.popitem(last=False)
+            expired.append(key)
+        return expired
+
+    async def sweep(self, application, now=None):
+        conversations = self.conversation._conversations
+        shared = getattr(self.conversation, "_shared_persistence", None)
+        ended = []
+        for key in self.pop_expired(now):
+            state = conversations.get(key)
+            if not isinstance(state, int):
+                # finished (or, rarely, still being handled) - nothing to expire
+                continue
+            if shared is not None and shared.refresh_conversation(self.conversation.name, key) is not UNCHANGED:
+                # another worker handled the chat since, so its timer is the one that counts
+                conversations.data.pop(key, None)
+                continue
+            self.conversation._update_state(self.conversation.END, key)
+            application.drop_user_data(key[-1])
+            record_expiry(state)
+            ended.append(key)
+        for key in ended:
+            try:
+                await self.on_expire(application.bot, key[0])
+            except TelegramError as exc:
+                print(f"Could not notify chat {key[0]} about its expired session: {exc}")
+        return len(ended)
+
+    async def _run(self, application):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep(application)
+            except Exception as exc:  # keep sweeping even if one round fails
+                print(f"Session expiry sweep failed: {exc!r}")
+
+    def start(self, application):
+        # sessions restored from persistence get a full timeout from now
+        now = time.monotonic()
+        for key in list(self.conversation._conversations):
+            self.touch(key, now)
+        self._task = asyncio.create_task(self._run(application))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
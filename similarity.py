@@ -0,0 +1,73 @@
+"""MinHash signatures and LSH banding for finding near-identical descriptions.
+
+A description is reduced to the set of its character shingles. The MinHash
+signature estimates the Jaccard similarity of two such sets, and splitting the
+signature into bands gives bucket keys that two similar descriptions are likely
+to share: with 16 bands of 4 rows, pairs at 0.5 similarity collide in at least
+one band about 65% of the time and pairs at 0.8 about 99.9% of the time. Bucket
+lookups are index probes, so finding candidates does not depend on how many
+cases are stored.
+"""
+import hashlib
+import random
+import re
+
+SHINGLE_SIZE = 5
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# shorter texts ("scam", "lost my coins") would look alike for no real reason
+MIN_SHINGLES = 16
+
+_PRIME = (1 << 61) - 1
+# fixed seed: signatures stored in the database must stay comparable across restarts
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = tuple((_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM))
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def _hash64(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+def normalize_text(text):
+    return _NON_WORD.sub(" ", (text or "").lower()).strip()
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """The hashed character ``size``-grams of ``text`` after normalization."""
+    text = normalize_text(text)
+    encoded = text.encode("utf-8")
+    return {_hash64(encoded[i:i + size]) for i in range(max(len(encoded) - size + 1, 0))}
+
+
+def minhash(shingle_set):
+    """MinHash signature of a non-empty shingle set."""
+    values = tuple(shingle_set)
+    return tuple(min([(a * x + b) % _PRIME for x in values]) for a, b in _PERMUTATIONS)
+
+
+def lsh_buckets(signature):
+    """(band, bucket) keys of ``signature``, as signed 64-bit ints SQLite can store."""
+    return [
+        (band, int.from_bytes(
+            hashlib.blake2b(repr(signature[band * ROWS:(band + 1) * ROWS]).encode(), digest_size=8).digest(),
+            "big", signed=True,
+        ))
+        for band in range(BANDS)
+    ]
+
+
+def description_buckets(text):
+    """Shingles and LSH buckets of ``text``; no buckets if it is too short to compare."""
+    shingle_set = shingles(text)
+    if len(shingle_set) < MIN_SHINGLES:
+        return shingle_set, []
+    return shingle_set, lsh_buckets(minhash(shingle_set))
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
@@ -0,0 +1,56 @@
+import heapq
+
+
+class TriageQueue:
+    """Cases waiting for review, largest USD loss first.
+
+    A binary heap of ``(-amount_usd, case_id)``, so taking the next case and
+    adding a new one are O(log n). Cases whose amount could not be worked out
+    are kept after every case with a known amount; cases under ``min_usd`` (the
+    minimum claim) are not queued at all.
+
+    The case store is the source of truth: ``sync`` adds the cases stored since
+    the last sync (including those submitted through other worker processes),
+    and ``pop`` claims a case in the store before handing it out, skipping cases
+    someone else took in the meantime.
+    """
+
+    def __init__(self, case_store, min_usd=0):
+        self.case_store = case_store
+        self.min_usd = min_usd
+        self._heap = []
+        self._last_id = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _key(self, case_id, amount_usd):
+        # unknown amounts sort after every known one, oldest first like the rest
+        return (-amount_usd if amount_usd is not None else float("inf"), case_id)
+
+    def qualifies(self, amount_usd):
+        return amount_usd is None or amount_usd >= self.min_usd
+
+    async def sync(self):
+        """Queue the cases stored since the last sync."""
+        rows = await self.case_store.untriaged(self._last_id)
+        if not rows:
+            return
+        self._last_id = rows[-1][0]
+        new = [self._key(case_id, amount_usd) for case_id, amount_usd in rows if self.qualifies(amount_usd)]
+        if len(new) > len(self._heap):
+            # heapify is O(n), cheaper than pushing every case on the first sync
+            self._heap.extend(new)
+            heapq.heapify(self._heap)
+        else:
+            for item in new:
+                heapq.heappush(self._heap, item)
+
+    async def pop(self, reviewer_id=None):
+        """Claim (for ``reviewer_id``) and return ``(case_id, amount_usd)`` of the largest waiting case, or None."""
+        await self.sync()
+        while self._heap:
+            key, case_id = heapq.heappop(self._heap)
+            if await self.case_store.claim(case_id, reviewer_id):
+                return case_id, (None if key == float("inf") else -key)
+        return None
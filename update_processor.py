@@ -0,0 +1,97 @@
+import asyncio
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Process updates from different chats concurrently and updates of one chat in order.
+
+    ConversationHandler relies on a chat's updates being handled one by one (each
+    answer moves the state machine on), so every chat gets its own ordered lane:
+    an update waits for the previous update of the same chat to finish before its
+    handlers run. Lanes only exist while a chat has updates in flight.
+
+    ``max_concurrent_updates`` bounds how many handlers run at the same time;
+    ``max_pending_updates`` bounds how many updates may be waiting for their lane
+    or a free slot before the application stops taking more off its queue.
+
+    ``recorder.record(update)``, if given, sees every update as it is taken in,
+    before any handler (the flood guard included) does.
+
+    ``abort`` cancels the handlers still running and drops the updates still
+    waiting, each of which then counts as processed, so ``Application.stop``
+    finishes its own shutdown instead of waiting on them.
+    """
+
+    def __init__(self, max_concurrent_updates=64, max_pending_updates=4096, recorder=None):
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._lanes = {}
+        self._tasks = set()
+        self._aborted = False
+        self.recorder = recorder
+
+    def abort(self):
+        """Cancel every update in flight and drop the ones that arrive from now on."""
+        self._aborted = True
+        for task in self._tasks:
+            task.cancel()
+
+    @staticmethod
+    def _lane_key(update):
+        if isinstance(update, Update) and update.effective_chat is not None:
+            return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        if self.recorder is not None:
+            self.recorder.record(update)
+        if self._aborted:
+            coroutine.close()
+            return
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            await self._process_in_lane(update, coroutine)
+        except asyncio.CancelledError:
+            if not self._aborted:
+                raise
+            # Application.stop marks the update done only if this returns
+            task.uncancel()
+        finally:
+            self._tasks.discard(task)
+
+    async def _process_in_lane(self, update, coroutine):
+        key = self._lane_key(update)
+        if key is None:
+            try:
+                async with self._running:
+                    await coroutine
+            except asyncio.CancelledError:
+                coroutine.close()
+                raise
+            return
+
+        previous = self._lanes.get(key)
+        done = asyncio.get_running_loop().create_future()
+        self._lanes[key] = done
+        try:
+            if previous is not None:
+                # asyncio.wait never cancels what it waits for, unlike awaiting the future itself
+                await asyncio.wait((previous,))
+            async with self._running:
+                await coroutine
+        except asyncio.CancelledError:
+            coroutine.close()
+            raise
+        finally:
+            done.set_result(None)
+            if self._lanes.get(key) is done:
+                del self._lanes[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
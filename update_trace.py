@@ -0,0 +1,230 @@
+"""Recording the updates the bot takes in, for replay with benchmarks/replay_trace.py.
+
+``TraceRecorder`` is an ``AuditLog`` whose events are updates: every update the
+application takes off its queue is written to gzip-compressed JSONL together
+with the seconds since the previous one, so a replay reproduces both the
+traffic and its timing. Every run of the bot starts with a ``trace_started``
+event naming the ids that were kept (see below).
+
+Nothing identifying reaches the disk. Updates are anonymized in the writer
+thread, off the event loop:
+
+* chat and user ids become pseudonyms (the same within one trace, so every
+  chat keeps its own conversation); admin and reviewer ids are kept, so their
+  commands still work on replay
+* names, usernames and everything else a message may carry are dropped
+* keyboard answers, "skip" and command names are kept; any other text has
+  every letter replaced by x/X and every digit by 1, which keeps its length
+  and shape (an email is still an email)
+* the currency and multiplier of an amount are kept as well, so it parses to
+  the same currency ("about 2.5k ETH" becomes "xxxxx 1.1k ETH")
+* wallet addresses and TXIDs are replaced by made-up ones of the same kind,
+  which pass or fail validation exactly like the originals did
+* file ids are replaced; sizes and MIME types are kept
+"""
+import gzip
+import hashlib
+import json
+import re
+import secrets
+import time
+
+from amounts import AMOUNT_RE, CRYPTO_WORDS, CURRENCY_ALIASES
+from audit_log import AuditLog
+from flow import FLOW
+from validation import (
+    EVM_ADDRESS_RE,
+    HEX64_RE,
+    TOKEN_RE,
+    b58check_decode,
+    b58check_encode,
+    bech32_decode,
+    bech32_encode,
+    is_valid_evm_address,
+    to_checksum_address,
+)
+
+# everything a user can answer by pressing a button
+KEPT_ANSWERS = frozenset(
+    label.lower() for step in FLOW.steps.values() for row in step.choices for label in row
+) | {"start recovery process", "start new case", "skip"}
+
+# currency words kept after the number of an amount
+KEPT_UNITS = frozenset(CURRENCY_ALIASES) | CRYPTO_WORDS
+
+FILE_KEYS = ("file_size", "width", "height", "mime_type")
+
+# pseudonymous chat ids count up from here
+FIRST_PSEUDONYM = 1_000_000
+
+_LETTER_RE = re.compile(r"[^\W\d_]")
+_DIGIT_RE = re.compile(r"\d")
+
+
+def mask(text):
+    """``text`` with every letter replaced by x/X and every digit by 1."""
+    text = _DIGIT_RE.sub("1", text)
+    return _LETTER_RE.sub(lambda match: "X" if match.group().isupper() else "x", text)
+
+
+def mask_amounts(text):
+    """``text`` masked like ``mask``, except for the multipliers and currencies of the amounts in it."""
+    parts, position = [], 0
+    for match in AMOUNT_RE.finditer(text):
+        for group in ("multiplier", "unit"):
+            word = match.group(group)
+            if word and (group == "multiplier" or word.lower() in KEPT_UNITS):
+                parts.append(mask(text[position:match.start(group)]))
+                parts.append(word)
+                position = match.end(group)
+    parts.append(mask(text[position:]))
+    return "".join(parts)
+
+
+def stand_in(token, seed):
+    """A made-up identifier shaped like ``token``, filled from the 64 bytes of ``seed``.
+
+    A valid address or TXID becomes another valid one of the same kind (same
+    version byte, prefix and length); anything else is masked, so it stays invalid.
+    """
+    if EVM_ADDRESS_RE.match(token):
+        if not is_valid_evm_address(token):
+            return mask(token)
+        address = "0x" + seed[:20].hex()
+        return address if token[2:].islower() or token[2:].isdigit() else to_checksum_address(address)
+    match = HEX64_RE.match(token)
+    if match:
+        return (match.group(1) or "") + seed[:32].hex()
+    payload = b58check_decode(token)
+    if payload is not None:
+        return b58check_encode(payload[:1] + seed[:len(payload) - 1])
+    decoded = bech32_decode(token)
+    if decoded is not None:
+        hrp, data, const = decoded
+        groups = [byte & 31 for byte in seed[:len(data) - 1]]
+        # the bits left over after the last whole byte of the program must be zero
+        padding = len(groups) * 5 % 8
+        if groups:
+            groups[-1] &= 31 ^ ((1 << padding) - 1)
+        return bech32_encode(hrp, data[:1] + groups, const)
+    return mask(token)
+
+
+class TraceRecorder(AuditLog):
+    """Write every update passed to ``record`` to ``path``, anonymized, with its inter-arrival time.
+
+    ``kept_ids`` are the chat/user ids (the admin first, then the reviewers) that
+    are not pseudonymized. Rotation and dropping work as for ``AuditLog``.
+    """
+
+    name = "trace"
+
+    def __init__(self, path, kept_ids=(), **kwargs):
+        super().__init__(path, **kwargs)
+        self.kept_ids = tuple(dict.fromkeys(kept_ids))
+        self._last = None
+        self._pseudonyms = {}
+        # stand-ins are keyed per trace, so known addresses cannot be looked up in it
+        self._key = secrets.token_bytes(32)
+
+    def record(self, update):
+        """Queue ``update``; never blocks."""
+        now = time.monotonic()
+        gap = 0.0 if self._last is None else now - self._last
+        self._last = now
+        self.emit("update", gap=round(gap, 4), update=update)
+
+    async def start(self):
+        await super().start()
+        self.emit("trace_started", kept_ids=self.kept_ids)
+
+    # ---- anonymizing (in the writer thread) --------------------------------
+
+    def _seed(self, text):
+        return hashlib.blake2b(text.encode(), key=self._key).digest()
+
+    def _id(self, value):
+        if value in self.kept_ids:
+            return value
+        return self._pseudonyms.setdefault(value, FIRST_PSEUDONYM + len(self._pseudonyms))
+
+    def _text(self, text):
+        if text.strip().lower() in KEPT_ANSWERS:
+            return text
+        if text.startswith("/"):
+            command, space, arguments = text.partition(" ")
+            return command + space + self._text(arguments) if arguments else text
+        parts, position = [], 0
+        for match in TOKEN_RE.finditer(text):
+            parts.append(mask_amounts(text[position:match.start()]))
+            parts.append(stand_in(match.group(), self._seed(match.group())))
+            position = match.end()
+        parts.append(mask_amounts(text[position:]))
+        return "".join(parts)
+
+    def _stand_in_file(self, file):
+        file_id = self._seed(file.file_unique_id).hex()[:32]
+        kept = {"file_id": file_id, "file_unique_id": file_id[:16]}
+        for key in FILE_KEYS:
+            if getattr(file, key, None) is not None:
+                kept[key] = getattr(file, key)
+        if getattr(file, "file_name", None):
+            stem, dot, extension = file.file_name.rpartition(".")
+            kept["file_name"] = mask(stem) + dot + extension if dot else mask(extension)
+        return kept
+
+    def anonymize(self, update):
+        """The JSON of ``update`` with only the anonymized fields the bot looks at."""
+        message = update.message
+        if message is None:
+            return {"update_id": update.update_id}
+        # built from the attributes directly: to_dict() would cost several times more
+        kept = {
+            "message_id": message.message_id,
+            "date": int(message.date.timestamp()),
+            "chat": {"id": self._id(message.chat.id), "type": message.chat.type},
+        }
+        if message.from_user is not None:
+            user = message.from_user
+            kept["from"] = {"id": self._id(user.id), "is_bot": user.is_bot, "first_name": "User"}
+            if user.language_code:
+                kept["from"]["language_code"] = user.language_code
+        for key, entities_key in (("text", "entities"), ("caption", "caption_entities")):
+            if getattr(message, key) is not None:
+                kept[key] = self._text(getattr(message, key))
+                entities = getattr(message, entities_key)
+                if entities:
+                    kept[entities_key] = [
+                        {"type": entity.type, "offset": entity.offset, "length": entity.length}
+                        for entity in entities
+                    ]
+        if message.photo:
+            kept["photo"] = [self._stand_in_file(size) for size in message.photo]
+        if message.document is not None:
+            kept["document"] = self._stand_in_file(message.document)
+        if message.media_group_id is not None:
+            kept["media_group_id"] = message.media_group_id
+        return {"update_id": update.update_id, "message": kept}
+
+    def _open(self):
+        # every open appends another gzip member; gzip.open reads them back as one stream
+        return gzip.open(self.path, "ab")
+
+    def _encode(self, event):
+        if "update" in event:
+            update = event["update"]
+            try:
+                anonymized = self.anonymize(update)
+            except (TypeError, AttributeError, ValueError):
+                # a shape anonymize does not know; keep the gap, never the content
+                anonymized = {"update_id": update.update_id}
+            event = dict(event, update=anonymized)
+        return super()._encode(event)
+
+
+def read_trace(path):
+    """Yield the events of a trace file, in order."""
+    with gzip.open(path, "rt", encoding="utf-8") as trace:
+        for line in trace:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,258 @@
+"""Input validation for the intake conversation.
+
+All patterns are compiled once at import time. Wallet addresses are checked
+against the checksum scheme of the selected network:
+
+* Bitcoin: Base58Check (P2PKH/P2SH) and bech32/bech32m (SegWit/Taproot)
+* Ethereum, Binance Smart Chain, Polygon, Avalanche (C-Chain): EIP-55
+* TRON: Base58Check with the 0x41 version byte
+
+Networks typed in via "Other" are not validated.
+"""
+import hashlib
+import operator
+import re
+from dataclasses import dataclass
+from functools import lru_cache, reduce
+
+import sha3
+
+EMAIL_RE = re.compile(r'^[\w\.-]+@[\w\.-]+\.\w+$')
+
+# Anything this long that is made of address/hash characters is treated as an address
+# or TXID attempt; shorter words ("my", "wallet:", "scammer") are labels and ignored.
+TOKEN_RE = re.compile(r'[0-9A-Za-z]{25,}')
+TXID_TOKEN_RE = re.compile(r'(?:0x)?[0-9A-Za-z]{60,}')
+EVM_ADDRESS_RE = re.compile(r'^0x[0-9a-fA-F]{40}$')
+HEX64_RE = re.compile(r'^(0x)?([0-9a-fA-F]{64})$')
+
+EVM = "evm"
+BITCOIN = "bitcoin"
+TRON = "tron"
+
+# Network names exactly as offered by the network keyboard
+NETWORK_KINDS = {
+    "Ethereum": EVM,
+    "Binance Smart Chain": EVM,
+    "Polygon": EVM,
+    "Avalanche": EVM,
+    "Bitcoin": BITCOIN,
+    "TRON": TRON,
+}
+
+
+def is_valid_email(email):
+    """Check if email is valid using regex pattern"""
+    return EMAIL_RE.match(email) is not None
+
+
+# ---- Base58 / Base58Check ------------------------------------------------------
+
+_B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+_B58_INDEX = {char: index for index, char in enumerate(_B58_ALPHABET)}
+
+
+def b58decode(text):
+    """Decode Base58 text; returns None on characters outside the alphabet."""
+    number = 0
+    try:
+        for digit in map(_B58_INDEX.__getitem__, text):
+            number = number * 58 + digit
+    except KeyError:
+        return None
+    leading_zeros = len(text) - len(text.lstrip("1"))
+    return b"\x00" * leading_zeros + number.to_bytes((number.bit_length() + 7) // 8, "big")
+
+
+def b58check_decode(text):
+    """Return the payload of a Base58Check string, or None if the checksum is wrong."""
+    raw = b58decode(text)
+    if raw is None or len(raw) < 5:
+        return None
+    payload, checksum = raw[:-4], raw[-4:]
+    if hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4] != checksum:
+        return None
+    return payload
+
+
+def b58check_encode(payload):
+    """Encode ``payload`` as Base58Check (the inverse of ``b58check_decode``)."""
+    raw = payload + hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4]
+    number = int.from_bytes(raw, "big")
+    chars = []
+    while number:
+        number, remainder = divmod(number, 58)
+        chars.append(_B58_ALPHABET[remainder])
+    return "1" * (len(raw) - len(raw.lstrip(b"\x00"))) + "".join(reversed(chars))
+
+
+# ---- bech32 / bech32m (BIP-173, BIP-350) ----------------------------------------
+
+_BECH32_CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+_BECH32_INDEX = {char: index for index, char in enumerate(_BECH32_CHARSET)}
+_BECH32_GENERATOR = (0x3B6A57B2, 0x26508E6D, 0x1EA119FA, 0x3D4233DD, 0x2A1462B3)
+BECH32_CONST = 1
+BECH32M_CONST = 0x2BC830A3
+# the generators to XOR in for each value of the top five bits of the checksum
+_BECH32_TABLE = tuple(
+    reduce(operator.xor, (generator for index, generator in enumerate(_BECH32_GENERATOR) if top >> index & 1), 0)
+    for top in range(32)
+)
+
+
+def _bech32_polymod(values):
+    checksum = 1
+    table = _BECH32_TABLE
+    for value in values:
+        checksum = ((checksum & 0x1FFFFFF) << 5 ^ value) ^ table[checksum >> 25]
+    return checksum
+
+
+def bech32_decode(text):
+    """Return ``(hrp, data, const)`` for a bech32/bech32m string, or None if invalid."""
+    if text.lower() != text and text.upper() != text:
+        return None
+    text = text.lower()
+    separator = text.rfind("1")
+    if separator < 1 or separator + 7 > len(text) or len(text) > 90:
+        return None
+    hrp = text[:separator]
+    try:
+        data = list(map(_BECH32_INDEX.__getitem__, text[separator + 1:]))
+    except KeyError:
+        return None
+    expanded = [ord(char) >> 5 for char in hrp] + [0] + [ord(char) & 31 for char in hrp]
+    const = _bech32_polymod(expanded + data)
+    if const not in (BECH32_CONST, BECH32M_CONST):
+        return None
+    return hrp, data[:-6], const
+
+
+def bech32_encode(hrp, data, const=BECH32_CONST):
+    """Encode 5-bit ``data`` under ``hrp`` (the inverse of ``bech32_decode``)."""
+    expanded = [ord(char) >> 5 for char in hrp] + [0] + [ord(char) & 31 for char in hrp]
+    polymod = _bech32_polymod(expanded + data + [0] * 6) ^ const
+    checksum = [(polymod >> 5 * (5 - index)) & 31 for index in range(6)]
+    return hrp + "1" + "".join(_BECH32_CHARSET[value] for value in data + checksum)
+
+
+def is_valid_segwit_address(text, hrp="bc"):
+    decoded = bech32_decode(text)
+    if decoded is None or decoded[0] != hrp or not decoded[1]:
+        return False
+    _, data, const = decoded
+    version = data[0]
+    # the program is packed into the 5-bit groups after the version; the bits after
+    # its last whole byte must be fewer than one group, and zero
+    length, padding = divmod((len(data) - 1) * 5, 8)
+    if version > 16 or padding >= 5 or data[-1] & ((1 << padding) - 1) or not 2 <= length <= 40:
+        return False
+    if version == 0:
+        return const == BECH32_CONST and length in (20, 32)
+    return const == BECH32M_CONST
+
+
+# ---- Keccak-256 for EIP-55 ------------------------------------------------------
+
+def keccak256(data):
+    """Keccak-256 as used by Ethereum (not the padded NIST SHA3-256)."""
+    return sha3.keccak_256(data).digest()
+
+
+@lru_cache(maxsize=4096)
+def to_checksum_address(address):
+    """Return the EIP-55 mixed-case form of a 0x-prefixed hex address."""
+    lower = address[2:].lower()
+    digest = keccak256(lower.encode("ascii")).hex()
+    return "0x" + "".join(
+        char.upper() if nibble in "89abcdef" else char for char, nibble in zip(lower, digest)
+    )
+
+
+# hex digits -> "1" where EIP-55 wants (or the address has) an upper-case letter
+_HIGH_NIBBLE = str.maketrans("0123456789abcdef", "0000000011111111")
+_IS_LETTER = str.maketrans("0123456789abcdefABCDEF", "0000000000111111111111")
+_IS_UPPER = str.maketrans("0123456789abcdefABCDEF", "0000000000000000111111")
+
+
+def is_valid_evm_address(address):
+    if not EVM_ADDRESS_RE.match(address):
+        return False
+    body = address[2:]
+    lower = body.lower()
+    # single-case addresses carry no checksum; only mixed case has to match EIP-55
+    if body == lower or body.isupper():
+        return True
+    # compared as bit masks: a letter must be upper case exactly where its digest nibble is >= 8
+    expected = int(keccak256(lower.encode("ascii"))[:20].hex().translate(_HIGH_NIBBLE), 2)
+    letters = int(body.translate(_IS_LETTER), 2)
+    return (int(body.translate(_IS_UPPER), 2) ^ expected) & letters == 0
+
+
+# ---- per-network parsing ----------------------------------------------------------
+
+@dataclass(frozen=True)
+class ParseResult:
+    valid: tuple
+    invalid: tuple
+
+
+def normalize_address(token, kind):
+    """Return the canonical form of ``token`` for ``kind`` or None if it is not valid.
+
+    EVM addresses are normalized to lowercase so they compare equal however the
+    user typed them; bech32 addresses to lowercase; Base58 is case-sensitive and
+    kept as is.
+    """
+    if kind == EVM:
+        return token.lower() if is_valid_evm_address(token) else None
+    if kind == BITCOIN:
+        if token[:3].lower() == "bc1":
+            return token.lower() if is_valid_segwit_address(token) else None
+        payload = b58check_decode(token)
+        return token if payload is not None and len(payload) == 21 and payload[0] in (0x00, 0x05) else None
+    if kind == TRON:
+        payload = b58check_decode(token)
+        return token if payload is not None and len(payload) == 21 and payload[0] == 0x41 else None
+    return token
+
+
+def normalize_txid(token, kind):
+    match = HEX64_RE.match(token)
+    if match is None:
+        return None
+    if kind == EVM:
+        return "0x" + match.group(2).lower()
+    if kind in (BITCOIN, TRON) and match.group(1):
+        return None
+    return match.group(2).lower() if kind else token.lower()
+
+
+def _parse(text, kind, token_re, normalize):
+    # a dict keeps the first occurrence of each normalized token, in order
+    valid, invalid = {}, []
+    for token in token_re.findall(text):
+        normalized = normalize(token, kind)
+        if normalized is None:
+            invalid.append(token)
+        else:
+            valid.setdefault(normalized)
+    return ParseResult(tuple(valid), tuple(invalid))
+
+
+def parse_addresses(text, network):
+    """Extract and validate every address in a (multi-line) paste for ``network``."""
+    return _parse(text, NETWORK_KINDS.get(network), TOKEN_RE, normalize_address)
+
+
+def parse_txids(text, network):
+    """Extract and validate every transaction hash in a paste for ``network``."""
+    return _parse(text, NETWORK_KINDS.get(network), TXID_TOKEN_RE, normalize_txid)
+
+
+def normalize_identifier(token):
+    """Network-agnostic normalization used for lookups: hex and bech32 are case-insensitive."""
+    lowered = token.lower()
+    if lowered.startswith(("0x", "bc1")) or all(char in "0123456789abcdef" for char in lowered):
+        return lowered
+    return token
@@ -0,0 +1,66 @@
+import hmac
+import json
+
+from telegram import Update
+
+from http_server import Response, start_server
+from lifecycle import DRAIN_TIMEOUT, start_application, stop_application, stop_signal_event
+
+# The intake flow only ever reacts to plain messages
+ALLOWED_UPDATES = [Update.MESSAGE]
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+
+def make_webhook_handler(app, url_path, secret_token=None):
+    """Build the HTTP handler that feeds webhook calls into ``app.update_queue``.
+
+    Besides the single update Telegram posts, the body may also be a JSON array of
+    updates so a front proxy (or a test driver) can deliver a batch in one request.
+    """
+
+    async def handle(request):
+        if request.path == "/healthz":
+            return Response(200, b"ok")
+        if request.path != url_path:
+            return Response(404, b"not found")
+        if request.method != "POST":
+            return Response(405, b"method not allowed")
+        if secret_token and not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, ""), secret_token
+        ):
+            return Response(403, b"forbidden")
+        try:
+            payload = json.loads(request.body)
+        except ValueError:
+            return Response(400, b"invalid json")
+
+        for data in payload if isinstance(payload, list) else [payload]:
+            update = Update.de_json(data, app.bot)
+            if update is not None:
+                await app.update_queue.put(update)
+        return Response(200, b"ok")
+
+    return handle
+
+
+async def serve_webhook(app, listen, port, url_path, webhook_url=None, secret_token=None,
+                        drain_timeout=DRAIN_TIMEOUT):
+    """Run ``app`` behind the embedded webhook server until SIGINT/SIGTERM, then stop it gracefully."""
+    stop = stop_signal_event()
+    await start_application(app)
+    server = await start_server(make_webhook_handler(app, url_path, secret_token), listen, port)
+    try:
+        if webhook_url:
+            await app.bot.set_webhook(
+                url=webhook_url,
+                secret_token=secret_token,
+                allowed_updates=ALLOWED_UPDATES,
+            )
+        print(f"🌐 Webhook listening on {listen}:{port}{url_path}")
+        await stop.wait()
+    finally:
+        # refuse new updates first; Telegram (or the dispatcher) delivers them elsewhere or later
+        server.close()
+        await server.wait_closed()
+        await stop_application(app, drain_timeout)